@@ -7,4 +7,152 @@ DATABASE_PGSQL = {
     'user': os.getenv('DB_USER', ''),
     'password': os.getenv('DB_PASSWORD', ''),
     'name': os.getenv('DB_NAME', 'rome'),
-}
\ No newline at end of file
+}
+
+CORPUS_STORE = {
+    # sqlite keeps the corpus in a local file; postgresql uses the DATABASE_PGSQL server
+    'backend': os.getenv('CORPUS_STORE_BACKEND', 'sqlite'),
+    'sqlite_path': os.getenv('CORPUS_STORE_SQLITE_PATH',
+                             os.path.join(os.path.expanduser('~'), '.cache', 'rome', 'corpus.sqlite')),
+    # Connections kept open per process, and extra ones allowed under load
+    'pool_size': int(os.getenv('CORPUS_STORE_POOL_SIZE', '5')),
+    'max_overflow': int(os.getenv('CORPUS_STORE_MAX_OVERFLOW', '10')),
+    # Rows per round trip when streaming results back through a server-side cursor
+    'fetch_size': int(os.getenv('CORPUS_STORE_FETCH_SIZE', '10000')),
+}
+
+EMBEDDING = {
+    'model_name': os.getenv('EMBEDDING_MODEL', 'microsoft/codebert-base'),
+    'batch_size': int(os.getenv('EMBEDDING_BATCH_SIZE', '32')),
+    'max_tokens': int(os.getenv('EMBEDDING_MAX_TOKENS', '512')),
+}
+
+BACKENDS = {
+    # Model compared across frameworks by the torch/TensorFlow check
+    'model_name': os.getenv('BACKENDS_MODEL', 'bert-base-uncased'),
+    'backends': [name.strip() for name in os.getenv('BACKENDS', 'torch,tensorflow').split(',') if name.strip()],
+    # Run the backends side by side in threads
+    'concurrent': os.getenv('BACKENDS_CONCURRENT', '1').lower() in ('1', 'true', 'yes'),
+}
+
+INFERENCE = {
+    # Dynamic int8 quantization of the Linear layers; faster on CPU at a small accuracy cost
+    'quantize': os.getenv('INFERENCE_QUANTIZE', '0').lower() in ('1', 'true', 'yes'),
+    # torch thread pools; 0 keeps torch's default
+    'intra_op_threads': int(os.getenv('INFERENCE_INTRA_OP_THREADS', '0')),
+    'inter_op_threads': int(os.getenv('INFERENCE_INTER_OP_THREADS', '0')),
+    # Forked worker processes sharing the loaded weights; 0 or 1 embeds in-process
+    'replicas': int(os.getenv('INFERENCE_REPLICAS', '0')),
+}
+
+EMBEDDING_CACHE = {
+    # Set EMBEDDING_CACHE_DIR to an empty string to disable the cache
+    'path': os.getenv('EMBEDDING_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rome', 'embeddings')),
+    'max_entries': int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '1000000')),
+}
+
+COVERAGE = {
+    # Directory of per-project symbol indexes; empty keeps the index in memory for one run
+    'index_path': os.getenv('COVERAGE_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rome', 'coverage')),
+}
+
+TEST_GENERATION = {
+    # Test files rendered and written concurrently; 0 uses one thread per CPU
+    'workers': int(os.getenv('TEST_GENERATION_WORKERS', '0')),
+}
+
+EXTRACTION = {
+    # 0 uses one parser process per CPU
+    'workers': int(os.getenv('EXTRACTION_WORKERS', '0')),
+    # Below this many files the pool start-up costs more than it saves
+    'min_pool_files': int(os.getenv('EXTRACTION_MIN_POOL_FILES', '64')),
+    # Parsed files remembered per process for reuse; least recently used are dropped past this
+    'max_records': int(os.getenv('EXTRACTION_MAX_RECORDS', '50000')),
+}
+
+VECTOR_INDEX = {
+    # Where `ingest` saves the index and `query`/`serve` load it from
+    'path': os.getenv('VECTOR_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rome', 'index')),
+    # One of: flat, ivf_flat, ivf_pq, hnsw
+    'type': os.getenv('VECTOR_INDEX_TYPE', 'flat'),
+    'nlist': int(os.getenv('VECTOR_INDEX_NLIST', '1024')),
+    'nprobe': int(os.getenv('VECTOR_INDEX_NPROBE', '16')),
+    'pq_m': int(os.getenv('VECTOR_INDEX_PQ_M', '64')),
+    'pq_nbits': int(os.getenv('VECTOR_INDEX_PQ_NBITS', '8')),
+    'hnsw_m': int(os.getenv('VECTOR_INDEX_HNSW_M', '32')),
+    'ef_search': int(os.getenv('VECTOR_INDEX_EF_SEARCH', '64')),
+    # Vectors buffered to train IVF/PQ indexes before anything is added
+    'train_sample': int(os.getenv('VECTOR_INDEX_TRAIN_SAMPLE', '50000')),
+}
+
+SERVER = {
+    'host': os.getenv('SERVER_HOST', '127.0.0.1'),
+    'port': int(os.getenv('SERVER_PORT', '8765')),
+    # When set, serve on this Unix socket instead of host:port
+    'socket': os.getenv('SERVER_SOCKET', ''),
+    'max_batch_size': int(os.getenv('SERVER_MAX_BATCH_SIZE', '64')),
+    'max_wait_ms': int(os.getenv('SERVER_MAX_WAIT_MS', '10')),
+}
+
+WATCH = {
+    # auto uses inotify on Linux and falls back to polling elsewhere
+    'backend': os.getenv('WATCH_BACKEND', 'auto'),
+    'poll_interval': float(os.getenv('WATCH_POLL_INTERVAL', '1.0')),
+    # Events within this window after the first one are handled as one batch
+    'debounce_ms': int(os.getenv('WATCH_DEBOUNCE_MS', '200')),
+    # Seconds between index snapshots while there are unsaved changes
+    'snapshot_interval': float(os.getenv('WATCH_SNAPSHOT_INTERVAL', '300')),
+}
+
+DISCOVERY = {
+    # Directory names (globs) never descended into, at any depth, so only names that cannot be a
+    # source package. Virtualenvs are recognised by their pyvenv.cfg; build outputs are left to .gitignore.
+    'exclude': [name.strip() for name in os.getenv(
+        'DISCOVERY_EXCLUDE', '.git,__pycache__,node_modules,*.egg-info',
+    ).split(',') if name.strip()],
+    'gitignore': os.getenv('DISCOVERY_GITIGNORE', '1').lower() in ('1', 'true', 'yes'),
+    # Threads listing directories; helps most on network file systems
+    'scan_workers': int(os.getenv('DISCOVERY_SCAN_WORKERS', '8')),
+    # Larger files are skipped as generated or vendored; 0 disables the limit
+    'max_file_bytes': int(os.getenv('DISCOVERY_MAX_FILE_BYTES', str(2 * 1024 * 1024))),
+}
+
+PIPELINE = {
+    # Items in flight between two ingestion stages; bounds peak memory
+    'queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', '8')),
+    'read_workers': int(os.getenv('PIPELINE_READ_WORKERS', '4')),
+    # Functions per cache lookup and tokenizer call
+    'chunk_size': int(os.getenv('PIPELINE_CHUNK_SIZE', '256')),
+}
+
+SHARDS = {
+    # One index shard per repository lives under this directory
+    'path': os.getenv('SHARDS_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rome', 'shards')),
+    # Threads searching shards concurrently; 0 uses one per CPU
+    'workers': int(os.getenv('SHARDS_WORKERS', '0')),
+}
+
+DEDUPE = {
+    # Minimum cosine similarity for an embedding-verified duplicate
+    'threshold': float(os.getenv('DEDUPE_THRESHOLD', '0.95')),
+    # Minimum estimated Jaccard similarity of AST shingles for a pair to be verified
+    'jaccard_threshold': float(os.getenv('DEDUPE_JACCARD_THRESHOLD', '0.5')),
+    'shingle_size': int(os.getenv('DEDUPE_SHINGLE_SIZE', '5')),
+    'num_perm': int(os.getenv('DEDUPE_NUM_PERM', '128')),
+    'bands': int(os.getenv('DEDUPE_BANDS', '32')),
+    'min_tokens': int(os.getenv('DEDUPE_MIN_TOKENS', '10')),
+    'max_bucket_pairs': int(os.getenv('DEDUPE_MAX_BUCKET_PAIRS', '50')),
+}
+
+LOGGING = {
+    'level': os.getenv('LOG_LEVEL', 'DEBUG').upper(),
+    # Hand records to a background thread instead of writing to the console inline
+    'queue': os.getenv('LOG_QUEUE', '1').lower() in ('1', 'true', 'yes'),
+}
+
+NORMALIZATION = {
+    # Leave functions with tiny bodies (pass, getters, setters) out of the embedded corpus
+    'skip_trivial': os.getenv('NORMALIZATION_SKIP_TRIVIAL', '1').lower() in ('1', 'true', 'yes'),
+    # Largest body, in AST nodes, that counts as trivial
+    'trivial_max_nodes': int(os.getenv('NORMALIZATION_TRIVIAL_MAX_NODES', '4')),
+}
@@ -32,3 +32,26 @@ CREATE TABLE similar_functions (
     similarity_score FLOAT NOT NULL,
     PRIMARY KEY (function_id, similar_function_id)
 );
+
+-- Corpus store (services/corpus_store.py); the store also creates these tables on first use.
+-- Embeddings are keyed by a hash of the model and normalized source, so identical bodies share a row.
+CREATE TABLE IF NOT EXISTS corpus_embeddings (
+    content_hash TEXT PRIMARY KEY,
+    dim INT NOT NULL,
+    vector BYTEA NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS corpus_functions (
+    id BIGSERIAL PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    lineno INT NOT NULL,
+    end_lineno INT NOT NULL,
+    start_offset BIGINT NOT NULL,
+    end_offset BIGINT NOT NULL,
+    content_hash TEXT NOT NULL,
+    UNIQUE (model_name, path, start_offset)
+);
+
+CREATE INDEX IF NOT EXISTS ix_corpus_functions_content_hash ON corpus_functions (content_hash);
@@ -1,35 +1,401 @@
 import sys
-from random import random
-import time
 import argparse
+import os
 import traceback
 
+from config.settings import DEDUPE, EMBEDDING, EMBEDDING_CACHE, INFERENCE, SERVER, SHARDS, VECTOR_INDEX, WATCH
+from utils.importtime import IMPORTTIME_CHILD
 from utils.logger import get_logger
 
 log = get_logger()
 
+# Commands import their engines inside the handler, so torch, transformers and faiss
+# are only loaded by the commands that embed (ingest, query, dedupe, serve).
+
 def run():
     print("Rome 1.0")
-    args = load_args()
+    argv = sys.argv[1:]
+    args = load_args(argv)
 
-    try:
-        #if args.command == "command":
-        #    loader = Loader(args)
-        #    loader.load()
+    if args.import_report and not os.environ.get(IMPORTTIME_CHILD):
+        from utils.importtime import import_time_report
+        sys.exit(import_time_report(argv, top=args.import_report_limit))
 
-        pass
+    profiler = None
+    if args.profile or args.profile_out:
+        from utils.profiling import ThreadProfiler
+
+        profiler = ThreadProfiler()
+        profiler.enable()
+    try:
+        args.handler(args)
 
     except Exception as e:
         log.error(f"CLI error {type(e)}: {e}")
         traceback.print_exc()
 
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_path = args.profile_out or f"rome-{args.command}.prof"
+            profiler.dump_stats(profile_path)
+            log.info(f"Wrote profile of the command's threads to {profile_path}")
+        if args.metrics:
+            from utils.metrics import metrics
 
-def load_args():
-    argv = sys.argv[1:]
+            metrics.dump(args.metrics)
+            log.info(f"Wrote stage metrics to {args.metrics}")
+
+
+def status(args):
+    """Print configuration and whether a saved index, the cache and a server are available."""
+    from services.client import RomeClient
+
+    print(f"Model: {EMBEDDING['model_name']}")
+    print(f"Index type: {VECTOR_INDEX['type']}")
+    index_found = os.path.exists(os.path.join(args.index, 'index.faiss'))
+    print(f"Index: {args.index} ({'found' if index_found else 'missing'})")
+    cache_dir = EMBEDDING_CACHE['path']
+    if cache_dir and os.path.isdir(cache_dir):
+        cache_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.is_file())
+        print(f"Embedding cache: {cache_dir} ({cache_bytes / 2 ** 20:.1f} MiB)")
+    else:
+        print(f"Embedding cache: {cache_dir or 'disabled'}")
+    try:
+        server = RomeClient(args.host, args.port, args.socket, timeout=1).status()
+        print(f"Server: running, {server['indexed_functions']} functions indexed")
+    except OSError:
+        print("Server: not running")
+
+
+def ingest(args):
+    """Embed every function under the given projects and save the index."""
+    from test.faiss_test import FaissEmbedder
+
+    # Embeddings go straight into the shared corpus database instead of the local cache
+    corpus = open_corpus(args.model) if args.store else None
+    with FaissEmbedder(model_name=args.model, quantized=args.quantize, index_type=args.index_type,
+                       keep_embeddings=bool(args.recall), cache=corpus) as embedder:
+        added = []
+        for path in args.paths:
+            added += embedder.ingest_project(path, with_keys=corpus is not None) or []
+        embedder.save_index(args.index)
+        print(f"Indexed {len(embedder.functions)} functions into {args.index}")
+        if corpus is not None:
+            # The keys the pipeline stored the embeddings under, so no source is read or hashed again
+            saved = corpus.save_functions(added, embedder.model_id)
+            print(f"Saved {saved} functions to the corpus store")
+        if args.recall:
+            print(f"Recall@{args.recall} vs. exact search: {embedder.report_recall(k=args.recall):.3f}")
+
+
+def query(args):
+    """Print the indexed functions most similar to each query file."""
+    snippets = [read_snippet(path) for path in args.files]
+    if args.remote:
+        from services.client import RomeClient
+
+        client = RomeClient(args.host, args.port, args.socket)
+        results = client.query(snippets, args.top_k)
+    elif args.shards:
+        from test.repo_similarity_test import FunctionSimilarityModel
+
+        with FunctionSimilarityModel([], model_name=args.model, quantized=args.quantize) as model:
+            model.load_shards(args.shards, repos=args.repo)
+            # Shards report cosine similarity in 0-1; print it on the 0-100 scale of the index path
+            results = [[dict(match, score=match['similarity'] * 100) for match in matches]
+                       for matches in model.find_similar_functions_batch(snippets, args.top_k, repos=args.repo)]
+    else:
+        from test.faiss_test import FaissEmbedder
+
+        with FaissEmbedder(model_name=args.model, quantized=args.quantize) as embedder:
+            embedder.load_index(args.index)
+            results = embedder.search_functions(embedder.calculate_embeddings(snippets, store=False), args.top_k)
+
+    for path, matches in zip(args.files, results):
+        print(f"\n{path}:")
+        for match in matches:
+            location = f"{match['file']}:{match['lineno']}" if match['file'] else "unknown location"
+            print(f"Function: {match['name']} ({location}), Similarity Score: {match['score']:.2f}")
+
+
+def shard(args):
+    """Build or refresh one index shard per repository, skipping repositories that did not change."""
+    from test.repo_similarity_test import FunctionSimilarityModel
+
+    with FunctionSimilarityModel(args.paths, model_name=args.model, quantized=args.quantize) as model:
+        rebuilt = model.build_shards(args.shards, force=args.force)
+        for repo_path in args.paths:
+            print(f"{repo_path}: {'rebuilt' if repo_path in rebuilt else 'up to date'}")
+
+
+def check_inference(args):
+    """Compare fp32 and int8 inference on functions from a project: speed and embedding drift."""
+    from transformers import AutoTokenizer
+
+    from services.extraction import extract_file, iter_python_files, read_sources
+    from services.inference import compare_quantization
+
+    # Parse only as many files as it takes to reach the limit
+    snippets = []
+    for path in iter_python_files(args.project):
+        record = extract_file(path)
+        if not record.error:
+            snippets.extend(read_sources(record))
+        if len(snippets) >= args.limit:
+            break
+    snippets = snippets[:args.limit]
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    report = compare_quantization(tokenizer, args.model, snippets, repeat=args.repeat)
+    print(f"Functions: {report['snippets']}")
+    print(f"fp32: {report['fp32_seconds']:.3f}s  int8: {report['int8_seconds']:.3f}s  speedup: {report['speedup']:.2f}x")
+    print(f"Cosine similarity fp32 vs int8: mean {report['mean_cosine']:.4f}, min {report['min_cosine']:.4f}")
+
+
+def coverage(args):
+    """Test coverage report for a project, static by default or measured with --runtime."""
+    from test.test_coverage import CodeCoverageAnalyzer
+
+    analyzer = CodeCoverageAnalyzer(args.project)
+    analyzer.get_function_definitions()
+    if args.runtime:
+        analyzer.collect_runtime_coverage(runner=args.runner, timing=args.timing)
+    else:
+        analyzer.get_function_calls_in_tests()
+    analyzer.analyze_coverage()
+    if args.runtime and args.timing:
+        analyzer.report_timings(top=args.top)
+
+
+def gen_tests(args):
+    """Generate unit test stubs for every function the coverage report marks as uncovered."""
+    from test.test_coverage import CodeCoverageAnalyzer
+    from test.test_unittest_gen import UnitTestGenerator
+
+    analyzer = CodeCoverageAnalyzer(args.project)
+    analyzer.get_function_definitions()
+    analyzer.get_function_calls_in_tests()
+    uncovered_functions = analyzer.analyze_coverage()
+    # Reuse the analyzer's index, which already holds the test files
+    UnitTestGenerator(args.project, uncovered_functions, index=analyzer.index).generate_tests()
+
+
+def dedupe(args):
+    """Report clusters of near-duplicate functions across the given repositories."""
+    from test.repo_similarity_test import FunctionSimilarityModel
+
+    with FunctionSimilarityModel(args.paths, model_name=args.model, quantized=args.quantize) as model:
+        model.collect_code()
+        model.extract_functions()
+        clusters = model.find_duplicate_clusters(threshold=args.threshold, jaccard_threshold=args.jaccard,
+                                                 verify=not args.no_verify)
+        for number, (functions, score) in enumerate(clusters, 1):
+            print(f"\nCluster {number} ({len(functions)} functions, score {score:.3f}):")
+            for func in functions:
+                print(f"  {func['file']}:{func['lineno']} {func['name']}")
+        print(f"\n{len(clusters)} duplicate clusters")
+
+
+def serve(args):
+    """Load the model and index once, then answer embed/query requests until interrupted."""
+    from services.server import EmbeddingService, serve as serve_forever
+    from test.faiss_test import FaissEmbedder
+
+    if args.watch and not args.ingest:
+        raise ValueError("--watch needs --ingest to know which project to follow")
+    with FaissEmbedder(model_name=args.model, quantized=args.quantize, updatable=args.watch) as embedder:
+        if args.ingest:
+            embedder.ingest_project(os.path.abspath(args.ingest))
+            embedder.flush_index()
+        elif args.store:
+            embedder.load_corpus(open_corpus(args.model))
+        elif os.path.exists(args.index):
+            embedder.load_index(args.index)
+        log.info(f"Loaded {embedder.model_name} with {len(embedder.functions)} indexed functions")
+
+        if args.watch:
+            import threading
+
+            from services.watcher import watch_index
+
+            threading.Thread(target=watch_index, args=(embedder, [args.ingest], args.index), name='watch', daemon=True).start()
+        serve_forever(EmbeddingService(embedder), host=args.host, port=args.port, socket_path=args.socket)
+
+
+def watch(args):
+    """Index projects, then keep the index current as files change, saving snapshots periodically."""
+    from services.watcher import watch_index
+    from test.faiss_test import FaissEmbedder
+
+    paths = [os.path.abspath(path) for path in args.paths]
+    with FaissEmbedder(model_name=args.model, quantized=args.quantize, index_type=args.index_type,
+                       updatable=True) as embedder:
+        # Unchanged functions come straight from the embedding cache, so a fresh start is cheap
+        for path in paths:
+            embedder.ingest_project(path)
+        embedder.snapshot(args.index)
+        print(f"Indexed {len(embedder.functions)} functions into {args.index}; watching for changes")
+        try:
+            watch_index(embedder, paths, args.index, snapshot_interval=args.snapshot_interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def bench(args):
+    """Generate a synthetic repository and benchmark parsing, ingestion and queries on it, printing JSON."""
+    import json
+    import tempfile
+
+    from services.benchmark import make_tiny_model, run_benchmark
+    from utils.synthetic_repo import generate_repo
+
+    with tempfile.TemporaryDirectory(prefix='rome-bench-') as workdir:
+        repo_dir = os.path.join(workdir, 'repo')
+        repo = generate_repo(repo_dir, files=args.files, functions_per_file=args.functions_per_file,
+                             mean_lines=args.mean_lines, length_sigma=args.length_sigma, seed=args.seed)
+        model_name = args.model or make_tiny_model(os.path.join(workdir, 'model'), repo_dir, seed=args.seed)
+        report = run_benchmark(repo_dir, model_name, index_types=args.index_types, queries=args.queries,
+                               top_k=args.top_k, dtype=args.dtype)
+    report['model_name'] = args.model or 'tiny-random'
+    report['repo'] = dict(repo, seed=args.seed, mean_lines=args.mean_lines, length_sigma=args.length_sigma)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    print(output)
+
+
+def open_corpus(model_name):
+    """The corpus store configured in config.settings, for vectors of the model's size."""
+    from transformers import AutoConfig
+
+    from services.corpus_store import CorpusStore
+
+    return CorpusStore.from_settings(AutoConfig.from_pretrained(model_name).hidden_size)
+
+
+def read_snippet(path):
+    if path == '-':
+        return sys.stdin.read()
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def load_args(argv):
     parser = argparse.ArgumentParser(description="Parses command.")
-    parser.add_argument("-c", "--command", help="Command")
+    parser.add_argument("--import-report", action="store_true",
+                        help="Re-run the command under -X importtime and list the slowest imports")
+    parser.add_argument("--import-report-limit", type=int, default=20, metavar="N",
+                        help="Imports listed by --import-report")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a cProfile (pstats) profile of the command and the threads it starts")
+    parser.add_argument("--profile-out", metavar="PATH",
+                        help="Where --profile writes, rome-<command>.prof by default; implies --profile")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Write per-stage timers and counters when the command ends; .prom/.txt for Prometheus text, JSON otherwise")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    # Bare `main.py` runs status
+    parser.set_defaults(command='status', handler=status, index=VECTOR_INDEX['path'],
+                        host=SERVER['host'], port=SERVER['port'], socket=SERVER['socket'])
+
+    model_options = argparse.ArgumentParser(add_help=False)
+    model_options.add_argument("--model", default=EMBEDDING['model_name'], help="Embedding model name or path")
+    model_options.add_argument("--quantize", action=argparse.BooleanOptionalAction, default=INFERENCE['quantize'],
+                               help="Run the model with dynamic int8 quantization (faster on CPU)")
+
+    index_options = argparse.ArgumentParser(add_help=False)
+    index_options.add_argument("--index", default=VECTOR_INDEX['path'], help="Directory of the saved index")
+
+    server_options = argparse.ArgumentParser(add_help=False)
+    server_options.add_argument("--host", default=SERVER['host'], help="Server host")
+    server_options.add_argument("--port", type=int, default=SERVER['port'], help="Server port")
+    server_options.add_argument("--socket", default=SERVER['socket'], help="Unix socket path, overrides host/port")
+
+    command = subparsers.add_parser("status", parents=[index_options, server_options], help="Show configuration and state")
+    command.set_defaults(handler=status)
+
+    command = subparsers.add_parser("ingest", parents=[model_options, index_options], help="Index the functions of projects")
+    command.add_argument("paths", nargs='+', help="Project directories")
+    command.add_argument("--index-type", default=VECTOR_INDEX['type'], help="flat, ivf_flat, ivf_pq or hnsw")
+    command.add_argument("--recall", type=int, metavar="K", help="Report recall@K against exact search")
+    command.add_argument("--store", action="store_true",
+                         help="Also save functions and embeddings to the shared corpus database")
+    command.set_defaults(handler=ingest)
+
+    command = subparsers.add_parser("query", parents=[model_options, index_options, server_options],
+                                    help="Find indexed functions similar to code in files")
+    command.add_argument("files", nargs='+', help="Files holding one query snippet each, - for stdin")
+    command.add_argument("--top-k", type=int, default=5, help="Results per query")
+    command.add_argument("--remote", action="store_true", help="Ask a running server instead of loading the model")
+    command.add_argument("--shards", help="Search the per-repository shards in this directory instead of --index")
+    command.add_argument("--repo", action="append", help="With --shards, only search this repository (repeatable)")
+    command.set_defaults(handler=query)
+
+    command = subparsers.add_parser("shard", parents=[model_options], help="Build per-repository index shards")
+    command.add_argument("paths", nargs='+', help="Repository directories, one shard each")
+    command.add_argument("--shards", default=SHARDS['path'], help="Directory holding the shards")
+    command.add_argument("--force", action="store_true", help="Rebuild shards even when up to date")
+    command.set_defaults(handler=shard)
+
+    command = subparsers.add_parser("check-inference", parents=[model_options],
+                                    help="Measure int8 quantization speedup and embedding drift")
+    command.add_argument("project", help="Project whose functions are embedded")
+    command.add_argument("--limit", type=int, default=256, help="Number of functions to embed")
+    command.add_argument("--repeat", type=int, default=3, help="Timed runs per variant")
+    command.set_defaults(handler=check_inference)
+
+    command = subparsers.add_parser("coverage", help="Test coverage report")
+    command.add_argument("project", help="Project directory")
+    command.add_argument("--runtime", action="store_true",
+                         help="Run the tests and record the functions that execute (Python 3.12+)")
+    command.add_argument("--runner", default="unittest", choices=["unittest", "pytest"], help="Test runner for --runtime")
+    command.add_argument("--timing", action="store_true",
+                         help="With --runtime, also record call counts and cumulative time per function")
+    command.add_argument("--top", type=int, default=20, help="Functions listed in the timing report")
+    command.set_defaults(handler=coverage)
+
+    command = subparsers.add_parser("gen-tests", help="Generate test stubs for uncovered functions")
+    command.add_argument("project", help="Project directory")
+    command.set_defaults(handler=gen_tests)
+
+    command = subparsers.add_parser("dedupe", parents=[model_options], help="Find near-duplicate functions")
+    command.add_argument("paths", nargs='+', help="Repository directories")
+    command.add_argument("--threshold", type=float, default=DEDUPE['threshold'], help="Minimum cosine similarity")
+    command.add_argument("--jaccard", type=float, default=DEDUPE['jaccard_threshold'],
+                         help="Minimum estimated AST shingle Jaccard similarity of candidates")
+    command.add_argument("--no-verify", action="store_true", help="Skip embedding verification of candidates")
+    command.set_defaults(handler=dedupe)
+
+    command = subparsers.add_parser("watch", parents=[model_options, index_options],
+                                    help="Index projects and keep the index current as files change")
+    command.add_argument("paths", nargs='+', help="Project directories")
+    command.add_argument("--index-type", default=VECTOR_INDEX['type'], help="flat, ivf_flat or ivf_pq")
+    command.add_argument("--snapshot-interval", type=float, default=WATCH['snapshot_interval'],
+                         help="Seconds between snapshots of a changed index")
+    command.set_defaults(handler=watch)
+
+    command = subparsers.add_parser("serve", parents=[model_options, index_options, server_options],
+                                    help="Keep the model and index loaded and answer requests")
+    command.add_argument("--ingest", help="Project directory to index instead of loading --index")
+    command.add_argument("--store", action="store_true", help="Build the index from the shared corpus database")
+    command.add_argument("--watch", action="store_true",
+                         help="Keep the --ingest index current as files change, snapshotting to --index")
+    command.set_defaults(handler=serve)
 
-    args = parser.parse_args(argv)
+    command = subparsers.add_parser("bench", help="Benchmark ingestion and queries on a synthetic repository")
+    command.add_argument("--files", type=int, default=100, help="Modules in the synthetic repository")
+    command.add_argument("--functions-per-file", type=int, default=10, help="Functions per module")
+    command.add_argument("--mean-lines", type=int, default=12, help="Median function body length")
+    command.add_argument("--length-sigma", type=float, default=0.6, help="Log-normal spread of function lengths")
+    command.add_argument("--seed", type=int, default=0, help="Seed of the repository and the tiny model")
+    command.add_argument("--model", help="Embedding model name or path; a tiny random model by default, to run offline")
+    command.add_argument("--index-types", nargs='+', default=['flat', 'ivf_flat', 'hnsw'],
+                         help="FAISS index types to build and query")
+    command.add_argument("--queries", type=int, default=100, help="Timed single-snippet queries per index")
+    command.add_argument("--top-k", type=int, default=10, help="Results per query and k of recall@k")
+    command.add_argument("--dtype", default="float16", choices=["float32", "float16"],
+                         help="Corpus dtype of the FunctionSimilarityModel path")
+    command.add_argument("--output", help="Also write the JSON report to this file")
+    command.set_defaults(handler=bench)
 
-    if args.command is None: args.command = 'status'   
-    return args
+    return parser.parse_args(argv)
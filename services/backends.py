@@ -0,0 +1,143 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config.settings import BACKENDS, EMBEDDING
+from services.embedding import embed_batched, length_sorted_batches
+from services.similarity import normalize_rows
+
+# Models and tokenizers loaded in this process, keyed by (backend, model name)
+_registry = {}
+# One lock per key, so a slow load of one model does not hold up the others
+_load_locks = {}
+_registry_lock = threading.Lock()
+
+
+def registered(backend, model_name, load):
+    """Return the process-wide (tokenizer, model) for a backend and model, calling load() only the first time."""
+    key = (backend, model_name)
+    with _registry_lock:
+        if key in _registry:
+            return _registry[key]
+        lock = _load_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _registry:
+            loaded = load()
+            with _registry_lock:
+                _registry[key] = loaded
+        return _registry[key]
+
+
+class TorchBackend:
+    name = 'torch'
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def load(self):
+        from transformers import AutoTokenizer
+
+        from services.inference import load_model
+
+        # Always fp32, like the TensorFlow side: comparing frameworks must not compare precisions too
+        return registered(self.name, self.model_name,
+                          lambda: (AutoTokenizer.from_pretrained(self.model_name),
+                                   load_model(self.model_name, quantized=False)))
+
+    def embed(self, texts, batch_size=EMBEDDING['batch_size'], max_tokens=EMBEDDING['max_tokens']):
+        tokenizer, model = self.load()
+        return embed_batched(tokenizer, model, texts, batch_size, max_tokens)
+
+
+class TensorFlowBackend:
+    name = 'tensorflow'
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def load(self):
+        from transformers import AutoTokenizer, TFAutoModel
+
+        return registered(self.name, self.model_name,
+                          lambda: (AutoTokenizer.from_pretrained(self.model_name), TFAutoModel.from_pretrained(self.model_name)))
+
+    def embed(self, texts, batch_size=EMBEDDING['batch_size'], max_tokens=EMBEDDING['max_tokens']):
+        import tensorflow as tf
+
+        tokenizer, model = self.load()
+        embeddings = np.empty((len(texts), model.config.hidden_size), dtype='float32')
+        input_ids = tokenizer(list(texts), truncation=True, max_length=max_tokens)['input_ids']
+        for batch in length_sorted_batches([len(ids) for ids in input_ids], batch_size):
+            features = tokenizer.pad({'input_ids': [input_ids[i] for i in batch]}, return_tensors='tf')
+            hidden = model(**features, training=False).last_hidden_state
+            # Masked mean, as in services.embedding.mean_pool, so padding does not dilute short inputs
+            mask = tf.cast(tf.expand_dims(features['attention_mask'], -1), hidden.dtype)
+            pooled = tf.reduce_sum(hidden * mask, axis=1) / tf.maximum(tf.reduce_sum(mask, axis=1), 1e-9)
+            embeddings[batch] = pooled.numpy()
+        return embeddings
+
+
+BACKEND_TYPES = {backend.name: backend for backend in (TorchBackend, TensorFlowBackend)}
+
+
+class EmbeddingEngine:
+    """
+    Embeds the same inputs with one model on several frameworks.
+
+    Each backend's model is loaded once per process through the registry, and every
+    call embeds all inputs in length-bucketed batches with one pass per backend. With
+    ``concurrent`` the backends run side by side in threads; both frameworks release
+    the GIL inside their kernels.
+    """
+
+    def __init__(self, model_name=BACKENDS['model_name'], backends=BACKENDS['backends'],
+                 concurrent=BACKENDS['concurrent']):
+        unknown = [name for name in backends if name not in BACKEND_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown embedding backends {unknown}, expected some of {sorted(BACKEND_TYPES)}")
+        self.backends = [BACKEND_TYPES[name](model_name) for name in backends]
+        self.concurrent = concurrent
+
+    def embed(self, texts):
+        """Return {backend name: (len(texts), hidden_size) float32 array}."""
+        texts = list(texts)
+        if self.concurrent and len(self.backends) > 1:
+            with ThreadPoolExecutor(max_workers=len(self.backends)) as pool:
+                results = list(pool.map(lambda backend: backend.embed(texts), self.backends))
+        else:
+            results = [backend.embed(texts) for backend in self.backends]
+        return {backend.name: result for backend, result in zip(self.backends, results)}
+
+    @staticmethod
+    def cosine(embedding1, embedding2):
+        """Cosine similarity of two single embeddings (1-D or (1, dim))."""
+        vectors = normalize_rows(np.stack([np.ravel(embedding1), np.ravel(embedding2)]))
+        return float(vectors[0] @ vectors[1])
+
+    def compare_pairs(self, pairs, threshold=0.95):
+        """
+        Cosine similarity of many (code, code) pairs on every backend.
+
+        Each distinct snippet is embedded once per backend, however many pairs it appears in.
+
+        :param pairs: Iterable of (code1, code2).
+        :param threshold: Minimum similarity on every backend for a pair to count as similar.
+        :return: ({backend name: (n,) similarities}, (n,) bool array of similar pairs).
+        """
+        pairs = list(pairs)
+        position = {}
+        for pair in pairs:
+            for code in pair:
+                position.setdefault(code, len(position))
+        left = [position[code1] for code1, _ in pairs]
+        right = [position[code2] for _, code2 in pairs]
+
+        similarities = {}
+        for name, embeddings in self.embed(position).items():
+            vectors = normalize_rows(embeddings)
+            similarities[name] = np.einsum('ij,ij->i', vectors[left], vectors[right])
+        similar = np.ones(len(pairs), dtype=bool)
+        for values in similarities.values():
+            similar &= values >= threshold
+        return similarities, similar
@@ -0,0 +1,61 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesce items submitted from many threads into batches for one worker thread.
+
+    A batch is dispatched once it holds ``max_batch_size`` items or the oldest item has
+    waited ``max_wait_ms``, whichever comes first, so a lone request pays at most the
+    deadline while a burst of requests shares forward passes.
+    """
+
+    def __init__(self, process_batch, max_batch_size=64, max_wait_ms=10):
+        """
+        :param process_batch: Callable mapping a list of items to a list of results of the same length.
+        :param max_batch_size: Most items handed to process_batch at once.
+        :param max_wait_ms: Longest time the first item of a batch waits for company.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result."""
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def map(self, items):
+        """Submit several items and wait for all of their results."""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,231 @@
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from config.settings import EMBEDDING
+from services.extraction import clear_records, extract_files, iter_python_files
+from services.similarity import normalize_rows, top_k_cosine
+from utils.logger import get_logger
+
+log = get_logger()
+
+_SPECIAL_TOKENS = ['<s>', '<pad>', '</s>', '<unk>']
+
+
+def make_tiny_model(directory, corpus_dir, hidden_size=32, layers=2, max_tokens=EMBEDDING['max_tokens'], seed=0):
+    """
+    Save a small randomly initialized RoBERTa encoder and a word-level tokenizer trained on a corpus.
+
+    The embeddings mean nothing, but the model exercises the same code paths as a real one
+    and needs no download, so benchmarks run offline and fast.
+
+    :param directory: Output directory, loadable with from_pretrained.
+    :param corpus_dir: Python files under it make up the tokenizer vocabulary.
+    :param max_tokens: Longest input the model must accept.
+    :param seed: Seed of the weight initialization.
+    :return: directory.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaModel
+
+    tokenizer = Tokenizer(models.WordLevel(unk_token='<unk>'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train(list(iter_python_files(corpus_dir)), trainers.WordLevelTrainer(special_tokens=_SPECIAL_TOKENS))
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single='<s> $A </s>', special_tokens=[('<s>', tokenizer.token_to_id('<s>')), ('</s>', tokenizer.token_to_id('</s>'))])
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token='<s>', eos_token='</s>', pad_token='<pad>',
+                            unk_token='<unk>', model_max_length=max_tokens).save_pretrained(directory)
+
+    torch.manual_seed(seed)
+    # RoBERTa positions start after the padding index, hence the two extra slots
+    config = RobertaConfig(vocab_size=tokenizer.get_vocab_size(), hidden_size=hidden_size, num_hidden_layers=layers,
+                           num_attention_heads=max(1, hidden_size // 16), intermediate_size=hidden_size * 2,
+                           max_position_embeddings=max_tokens + 2, pad_token_id=tokenizer.token_to_id('<pad>'))
+    RobertaModel(config).save_pretrained(directory)
+    return directory
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2 ** 20 if platform.system() == 'Darwin' else peak / 2 ** 10
+
+
+def latency_stats(seconds):
+    """p50/p99/mean of a list of durations, in milliseconds."""
+    milliseconds = np.array(seconds) * 1000
+    return {
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p99_ms': float(np.percentile(milliseconds, 99)),
+        'mean_ms': float(milliseconds.mean()),
+    }
+
+
+def timed_queries(search, snippets):
+    """Run search on each snippet alone and return the per-call latencies in seconds."""
+    latencies = []
+    for snippet in snippets:
+        start = time.perf_counter()
+        search(snippet)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def query_snippets(store, count, seed=0):
+    """Sources of up to count random functions of a store."""
+    rng = np.random.default_rng(seed)
+    rows = sorted(rng.choice(len(store), min(count, len(store)), replace=False).tolist())
+    return store.sources(rows)
+
+
+def recall_vs_exact(exact_vectors, vectors, k, n_queries=1000):
+    """Recall@k of top-k cosine over vectors against the same search over the float32 exact_vectors."""
+    if len(exact_vectors) == 0:
+        return 1.0
+    k = min(k, len(exact_vectors))
+    rng = np.random.default_rng(0)
+    queries = exact_vectors[rng.choice(len(exact_vectors), min(n_queries, len(exact_vectors)), replace=False)]
+    _, expected = top_k_cosine(queries, exact_vectors, k)
+    _, found = top_k_cosine(queries, vectors, k)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / (len(queries) * k)
+
+
+def bench_parse(file_paths):
+    """Parse every file from scratch and report files and functions per second."""
+    # Start cold; extract_files would otherwise reuse records parsed earlier in this process
+    clear_records()
+    start = time.perf_counter()
+    records = extract_files(file_paths)
+    seconds = time.perf_counter() - start
+    functions = sum(len(record.defs) for record in records if not record.error)
+    return {
+        'files': len(records),
+        'functions': functions,
+        'seconds': seconds,
+        'files_per_second': len(records) / seconds if seconds else 0.0,
+        'functions_per_second': functions / seconds if seconds else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_faiss(repo_dir, model_name, index_types, queries, top_k, cache_dir):
+    """Ingest with FaissEmbedder, then build, query and measure recall of every index type."""
+    from services.embedding_cache import EmbeddingCache
+    from services.vector_index import build_index, recall_at_k
+    from test.faiss_test import FaissEmbedder
+    from transformers import AutoConfig
+
+    cache = EmbeddingCache(cache_dir, AutoConfig.from_pretrained(model_name).hidden_size)
+    embedder = FaissEmbedder(model_name=model_name, cache=cache, index_type='flat', keep_embeddings=True, quantized=False)
+    start = time.perf_counter()
+    embedder.ingest_project(repo_dir)
+    seconds = time.perf_counter() - start
+    functions = len(embedder.functions)
+    report = {
+        'functions': functions,
+        'ingest_seconds': seconds,
+        'functions_per_second': functions / seconds if seconds else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'indexes': {},
+    }
+
+    vectors = np.array(embedder.function_embeddings)
+    snippets = query_snippets(embedder.functions, queries)
+    # Queries are ingested functions; without the cache they pay for a real forward pass
+    embedder.cache = None
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(index_type, embedder.embedding_dim, vectors)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        # Rows were added in store order, so the ingested metadata matches this index too
+        embedder.index = index
+        latencies = timed_queries(lambda snippet: embedder.compare_function_similarity(snippet, top_k), snippets)
+        report['indexes'][index_type] = {
+            'build_seconds': build_seconds,
+            f'recall_at_{top_k}': recall_at_k(index, vectors, k=top_k),
+            **latency_stats(latencies),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    embedder.close()
+    cache.close()
+    return report
+
+
+def bench_similarity_model(repo_dir, model_name, queries, top_k, dtype, cache_dir):
+    """Extract and embed with FunctionSimilarityModel, then measure query latency and recall of its corpus dtype."""
+    from services.embedding_cache import EmbeddingCache
+    from test.repo_similarity_test import FunctionSimilarityModel
+    from transformers import AutoConfig
+
+    cache = EmbeddingCache(cache_dir, AutoConfig.from_pretrained(model_name).hidden_size)
+    model = FunctionSimilarityModel([repo_dir], model_name=model_name, cache=cache, dtype=dtype, quantized=False)
+    model.collect_code()
+    model.extract_functions()
+    model.load_model()
+    functions = len(model.functions)
+    start = time.perf_counter()
+    model.generate_embeddings()
+    seconds = time.perf_counter() - start
+    embedded = len(model.function_embeddings)
+
+    # Every embedded function is in the cache by now, so the float32 reference costs no inference
+    exact = normalize_rows(model.embed(list(model.functions.iter_sources())))
+    model.cache = None
+    latencies = timed_queries(lambda snippet: model.find_similar_functions(snippet, top_k),
+                              query_snippets(model.functions, queries))
+    report = {
+        'functions': functions,
+        'embedded': embedded,
+        'dtype': dtype,
+        'embed_seconds': seconds,
+        'functions_per_second': functions / seconds if seconds else 0.0,
+        f'recall_at_{top_k}': recall_vs_exact(exact, model.function_embeddings, top_k),
+        **latency_stats(latencies),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    model.close()
+    cache.close()
+    return report
+
+
+def run_benchmark(repo_dir, model_name, index_types=('flat', 'ivf_flat', 'hnsw'), queries=100, top_k=10,
+                  dtype='float16'):
+    """
+    Benchmark parsing, ingestion and querying of a repository on both embedding paths.
+
+    Each embedding path starts from its own empty embedding cache, so ingest numbers
+    measure inference rather than cache hits. Peak RSS is the process high-water mark
+    after each phase and only ever grows.
+
+    :param repo_dir: Repository to benchmark, typically from utils.synthetic_repo.generate_repo.
+    :param model_name: Model name or path, e.g. a make_tiny_model directory.
+    :param index_types: FAISS index types built for the FaissEmbedder path.
+    :param queries: Number of single-snippet queries timed per index.
+    :param top_k: Results per query, and the k of recall@k.
+    :param dtype: Corpus dtype of the FunctionSimilarityModel path.
+    :return: JSON-serializable dict of results.
+    """
+    cache_root = tempfile.mkdtemp(prefix='rome-bench-cache-')
+    try:
+        report = {'model_name': model_name, 'top_k': top_k, 'queries': queries}
+        log.info("Benchmarking parsing")
+        report['parse'] = bench_parse(list(iter_python_files(repo_dir)))
+        log.info("Benchmarking FaissEmbedder")
+        report['faiss_embedder'] = bench_faiss(repo_dir, model_name, index_types, queries, top_k,
+                                               os.path.join(cache_root, 'faiss'))
+        log.info("Benchmarking FunctionSimilarityModel")
+        report['similarity_model'] = bench_similarity_model(repo_dir, model_name, queries, top_k, dtype,
+                                                            os.path.join(cache_root, 'similarity'))
+        report['peak_rss_mb'] = peak_rss_mb()
+        return report
+    finally:
+        shutil.rmtree(cache_root, ignore_errors=True)
@@ -0,0 +1,62 @@
+import http.client
+import json
+import socket
+
+from config.settings import SERVER
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=30):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RomeClient:
+    """
+    Minimal client for the `serve` command. Standard library only, so CI hooks can
+    ask for embeddings or similar functions without importing torch.
+    """
+
+    def __init__(self, host=SERVER['host'], port=SERVER['port'], socket_path=SERVER['socket'], timeout=30):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(self, method, path, payload=None):
+        connection = self._connection()
+        try:
+            body = None if payload is None else json.dumps(payload)
+            headers = {} if payload is None else {'Content-Type': 'application/json'}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read() or b'{}')
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"Server returned {response.status}: {data.get('error')}")
+        return data
+
+    def status(self):
+        """Model, index type and number of indexed functions on the server."""
+        return self._request('GET', '/status')
+
+    def embed(self, snippets):
+        """Return one embedding (list of floats) per snippet."""
+        return self._request('POST', '/embed', {'snippets': list(snippets)})['embeddings']
+
+    def query(self, snippets, top_k=5):
+        """Return, per snippet, a list of {'name', 'file', 'lineno', 'end_lineno', 'score'} dicts for the most similar indexed functions."""
+        return self._request('POST', '/query', {'snippets': list(snippets), 'top_k': top_k})['results']
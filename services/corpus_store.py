@@ -0,0 +1,267 @@
+import csv
+import io
+import os
+import threading
+
+import numpy as np
+from sqlalchemy import (BigInteger, Column, Integer, LargeBinary, MetaData, Table, Text, UniqueConstraint,
+                        create_engine, delete, event, func, select)
+from sqlalchemy.engine import URL
+
+from config.settings import CORPUS_STORE, DATABASE_PGSQL
+from services.function_store import FunctionStore
+from utils.metrics import metrics
+
+metadata = MetaData()
+
+# One row per distinct (model, normalized source); the key is services.embedding_cache.cache_key
+embeddings = Table(
+    'corpus_embeddings', metadata,
+    Column('content_hash', Text, primary_key=True),
+    Column('dim', Integer, nullable=False),
+    Column('vector', LargeBinary, nullable=False),
+)
+
+functions = Table(
+    'corpus_functions', metadata,
+    Column('id', BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True),
+    Column('model_name', Text, nullable=False),
+    Column('path', Text, nullable=False),
+    Column('name', Text, nullable=False),
+    Column('lineno', Integer, nullable=False),
+    Column('end_lineno', Integer, nullable=False),
+    Column('start_offset', BigInteger, nullable=False),
+    Column('end_offset', BigInteger, nullable=False),
+    Column('content_hash', Text, nullable=False, index=True),
+    UniqueConstraint('model_name', 'path', 'start_offset'),
+)
+
+# SQLite allows a limited number of bound parameters per statement
+_IN_CHUNK = 500
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def database_url(backend=CORPUS_STORE['backend']):
+    """SQLAlchemy URL of the configured corpus database."""
+    if backend == 'sqlite':
+        return URL.create('sqlite', database=CORPUS_STORE['sqlite_path'])
+    if backend == 'postgresql':
+        return URL.create('postgresql+psycopg2', username=DATABASE_PGSQL['user'] or None,
+                          password=DATABASE_PGSQL['password'] or None, host=DATABASE_PGSQL['host'],
+                          port=int(DATABASE_PGSQL['port']), database=DATABASE_PGSQL['name'])
+    raise ValueError(f"Unknown corpus store backend {backend!r}, expected sqlite or postgresql")
+
+
+def shared_engine(url):
+    """Return the process-wide pooled engine for a database URL, creating it on first use."""
+    key = url.render_as_string(hide_password=False) if isinstance(url, URL) else str(url)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = _create_engine(url)
+        return _engines[key]
+
+
+def _create_engine(url):
+    if not isinstance(url, URL):
+        from sqlalchemy.engine import make_url
+
+        url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url, pool_size=CORPUS_STORE['pool_size'], max_overflow=CORPUS_STORE['max_overflow'],
+                             pool_pre_ping=True)
+
+    if url.database and url.database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+    engine = create_engine(url)
+
+    @event.listens_for(engine, 'connect')
+    def configure(dbapi_connection, _):
+        # WAL lets query servers read while a worker writes; writers wait for each other
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+        dbapi_connection.execute('PRAGMA busy_timeout=30000')
+
+    return engine
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CorpusStore:
+    """
+    Function records and their embeddings in one database shared by workers and query servers.
+
+    PostgreSQL is the shared deployment; a local SQLite file is the fallback for offline runs.
+    Embeddings are keyed by content hash, so a function body is stored once however many
+    files or runs contain it. On PostgreSQL, writes are bulk-loaded with COPY into a staging
+    table and upserted from there; reads stream back through a server-side cursor.
+
+    The store also has the EmbeddingCache interface (``dim``, ``get_many``, ``put_many``),
+    so it can be passed as ``cache`` to the embedders and the ingestion pipeline.
+    """
+
+    def __init__(self, url, dim, fetch_size=CORPUS_STORE['fetch_size']):
+        self.engine = shared_engine(url)
+        self.dim = dim
+        self.fetch_size = fetch_size
+        self.bulk_copy = self.engine.dialect.name == 'postgresql'
+        metadata.create_all(self.engine)
+
+    @classmethod
+    def from_settings(cls, dim):
+        """Open the corpus database configured in config.settings."""
+        return cls(database_url(), dim)
+
+    def __len__(self):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(embeddings).where(embeddings.c.dim == self.dim)).scalar_one()
+
+    def get_many(self, keys):
+        """Return {key: float32 vector} for the keys that are stored."""
+        found = {}
+        with self.engine.connect() as connection:
+            for chunk in _chunks(list(dict.fromkeys(keys)), _IN_CHUNK):
+                rows = connection.execute(
+                    select(embeddings.c.content_hash, embeddings.c.vector)
+                    .where(embeddings.c.content_hash.in_(chunk), embeddings.c.dim == self.dim))
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype='float32')
+        return found
+
+    def put_many(self, keys, vectors):
+        """Store vectors under their content hashes; hashes already stored are left as they are."""
+        vectors = np.asarray(vectors, dtype='float32')
+        unique = dict(zip(keys, vectors))
+        rows = [{'content_hash': key, 'dim': self.dim, 'vector': vector.tobytes()} for key, vector in unique.items()]
+        with self.engine.begin() as connection:
+            self._upsert(connection, embeddings, rows, conflict=('content_hash',))
+
+    def save_functions(self, entries, model_name):
+        """
+        Record functions under a model, replacing what was stored for their files.
+
+        Every function is linked to its embedding by content hash, so the embeddings must be
+        stored too (by passing this store as the embedder's cache) for load to return it.
+
+        :param entries: ((file_path, FunctionRecord), cache key) pairs, as
+            FaissEmbedder.ingest_project returns them with with_keys.
+        :param model_name: Model identifier, as used for the cache keys.
+        :return: Number of functions saved.
+        """
+        records = [{
+            'model_name': model_name,
+            'path': path,
+            'name': function.name,
+            'lineno': function.lineno,
+            'end_lineno': function.end_lineno,
+            'start_offset': function.start_offset,
+            'end_offset': function.end_offset,
+            'content_hash': key,
+        } for (path, function), key in entries]
+        with self.engine.begin() as connection:
+            # Functions deleted or moved within a file must not survive the save
+            self._delete_paths(connection, sorted({record['path'] for record in records}), model_name)
+            self._upsert(connection, functions, records, conflict=('model_name', 'path', 'start_offset'),
+                         update=('name', 'lineno', 'end_lineno', 'end_offset', 'content_hash'))
+        return len(records)
+
+    def delete_paths(self, paths, model_name):
+        """Forget the functions of files under a model, e.g. files deleted from a repository."""
+        with self.engine.begin() as connection:
+            self._delete_paths(connection, sorted(set(paths)), model_name)
+
+    def _delete_paths(self, connection, paths, model_name):
+        for chunk in _chunks(paths, _IN_CHUNK):
+            connection.execute(delete(functions).where(functions.c.model_name == model_name, functions.c.path.in_(chunk)))
+
+    def _upsert(self, connection, table, rows, conflict, update=()):
+        if not rows:
+            return
+        with metrics.timer('store.write'):
+            if self.bulk_copy:
+                self._copy_upsert(connection, table, rows, conflict, update)
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+
+                statement = insert(table)
+                if update:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=conflict, set_={column: statement.excluded[column] for column in update})
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=conflict)
+                connection.execute(statement, rows)
+        metrics.count('store.rows_written', len(rows))
+
+    def _copy_upsert(self, connection, table, rows, conflict, update):
+        """COPY rows into a temporary table in CSV, then upsert them into table with one INSERT ... SELECT."""
+        columns = list(rows[0])
+        column_list = ', '.join(columns)
+        staging = f"staging_{table.name}"
+        connection.exec_driver_sql(
+            f"CREATE TEMP TABLE {staging} AS SELECT {column_list} FROM {table.name} WITH NO DATA")
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # bytea in hex input format
+            writer.writerow(['\\x' + value.hex() if isinstance(value, bytes) else value
+                             for value in (row[column] for column in columns)])
+        buffer.seek(0)
+        cursor = connection.connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+        if update:
+            action = 'DO UPDATE SET ' + ', '.join(f"{column} = EXCLUDED.{column}" for column in update)
+        else:
+            action = 'DO NOTHING'
+        connection.exec_driver_sql(
+            f"INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM {staging} "
+            f"ON CONFLICT ({', '.join(conflict)}) {action}")
+        connection.exec_driver_sql(f"DROP TABLE {staging}")
+
+    def iter_functions(self, model_name, path_prefix=None):
+        """
+        Stream the stored functions of a model that have an embedding, in insertion order.
+
+        :param path_prefix: Only functions of files under this path.
+        :return: Iterator of row blocks of about fetch_size rows, each row
+            (path, name, lineno, end_lineno, start_offset, end_offset, vector bytes).
+        """
+        query = (
+            select(functions.c.path, functions.c.name, functions.c.lineno, functions.c.end_lineno,
+                   functions.c.start_offset, functions.c.end_offset, embeddings.c.vector)
+            .join(embeddings, functions.c.content_hash == embeddings.c.content_hash)
+            .where(functions.c.model_name == model_name, embeddings.c.dim == self.dim)
+            .order_by(functions.c.id)
+        )
+        if path_prefix:
+            query = query.where(functions.c.path.startswith(path_prefix, autoescape=True))
+        with self.engine.connect() as connection:
+            # A server-side cursor on PostgreSQL; rows arrive fetch_size at a time
+            result = connection.execution_options(stream_results=True, yield_per=self.fetch_size).execute(query)
+            yield from result.partitions()
+
+    def load(self, model_name, path_prefix=None):
+        """
+        Read the stored functions of a model into a FunctionStore.
+
+        :return: FunctionStore whose vectors are the raw (not normalized) float32 embeddings.
+        """
+        store = FunctionStore()
+        blocks = []
+        for partition in self.iter_functions(model_name, path_prefix):
+            for path, name, lineno, end_lineno, start_offset, end_offset, _ in partition:
+                store.append(name, path, lineno, end_lineno, start_offset, end_offset)
+            blocks.append(np.frombuffer(b''.join(row[-1] for row in partition), dtype='float32').reshape(-1, self.dim))
+        store.vectors = np.concatenate(blocks) if blocks else np.empty((0, self.dim), dtype='float32')
+        return store
+
+    def close(self):
+        """Nothing to release; the pooled engine is shared by the whole process."""
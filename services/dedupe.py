@@ -0,0 +1,179 @@
+import ast
+import textwrap
+import zlib
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+
+from config.settings import DEDUPE
+from services.normalize import fingerprint
+from services.similarity import normalize_rows
+
+# Mersenne prime for the MinHash permutations; (a * x + b) stays below 2**63
+_PRIME = (1 << 31) - 1
+
+
+def ast_tokens(code):
+    """
+    Pre-order stream of AST node types for a function.
+
+    Identifiers, attribute names and literal values are dropped, so renamed copies produce
+    the same stream; docstrings and other bare string statements are skipped.
+    """
+    tokens = []
+
+    def visit(node):
+        if isinstance(node, ast.expr_context):
+            return
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            return
+        if isinstance(node, ast.Constant):
+            tokens.append(f"Constant:{type(node.value).__name__}")
+        else:
+            tokens.append(type(node).__name__)
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    try:
+        visit(ast.parse(textwrap.dedent(code)))
+    except (SyntaxError, RecursionError, ValueError):
+        return []
+    return tokens[1:]  # drop the Module wrapper
+
+
+def shingle_hashes(tokens, size=DEDUPE['shingle_size']):
+    """Set of 32-bit hashes of every run of `size` consecutive tokens."""
+    if len(tokens) < size:
+        return np.empty(0, dtype='uint64')
+    hashes = {zlib.crc32('\x1f'.join(tokens[i:i + size]).encode('ascii')) for i in range(len(tokens) - size + 1)}
+    return np.fromiter(hashes, dtype='uint64', count=len(hashes))
+
+
+class MinHasher:
+    """MinHash signatures from universal hashing (a * x + b) mod p."""
+
+    def __init__(self, num_perm=DEDUPE['num_perm'], seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, _PRIME, num_perm, dtype='uint64')
+        self.b = rng.integers(0, _PRIME, num_perm, dtype='uint64')
+
+    def signature(self, hashes):
+        if len(hashes) == 0:
+            return np.full(self.num_perm, _PRIME, dtype='uint32')
+        values = (np.outer(self.a, hashes % _PRIME) + self.b[:, None]) % _PRIME
+        return values.min(axis=1).astype('uint32')
+
+    def signatures(self, shingle_sets):
+        signatures = np.empty((len(shingle_sets), self.num_perm), dtype='uint32')
+        for row, hashes in enumerate(shingle_sets):
+            signatures[row] = self.signature(hashes)
+        return signatures
+
+
+def lsh_candidates(signatures, bands=DEDUPE['bands'], max_bucket_pairs=DEDUPE['max_bucket_pairs']):
+    """
+    Candidate pairs from LSH banding: two items are candidates when all rows of any band match.
+
+    Buckets larger than max_bucket_pairs members are linked as a star around their first member
+    instead of all pairs, so a pile of identical trivial functions stays linear.
+    """
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for item, row in enumerate(block):
+            buckets[row.tobytes()].append(item)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) <= max_bucket_pairs:
+                pairs.update(combinations(members, 2))
+            else:
+                pairs.update((members[0], member) for member in members[1:])
+    return pairs
+
+
+def _clusters(pairs, scores):
+    parent = {}
+
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for i, j in pairs:
+        parent[find(i)] = find(j)
+
+    members, pair_scores = defaultdict(list), defaultdict(list)
+    for item in list(parent):
+        members[find(item)].append(item)
+    for (i, j), score in zip(pairs, scores):
+        pair_scores[find(i)].append(score)
+    clusters = [(sorted(members[root]), float(np.mean(pair_scores[root]))) for root in members]
+    return sorted(clusters, key=lambda cluster: (-len(cluster[0]), -cluster[1]))
+
+
+def duplicate_clusters(codes, embed=None, threshold=DEDUPE['threshold'],
+                       jaccard_threshold=DEDUPE['jaccard_threshold'], min_tokens=DEDUPE['min_tokens'],
+                       fetch_sources=None):
+    """
+    Group near-duplicate functions without comparing every pair.
+
+    Exact clones (equal services.normalize fingerprints) are grouped first with score 1.0
+    and need no further work; only one representative of each goes on. Normalized AST
+    token shingles are MinHashed and LSH-banded into candidate pairs in near-linear time.
+    Sources are consumed one at a time and only their signatures are kept. Candidates whose estimated Jaccard similarity clears jaccard_threshold
+    are then verified: with `embed`, only the functions that appear in a surviving pair are
+    embedded and the pair is kept when its cosine similarity reaches threshold; without it
+    the Jaccard estimate is the score.
+
+    :param codes: Iterable of function sources, read once.
+    :param embed: Optional callable mapping a list of sources to an (n, dim) array.
+    :param threshold: Minimum cosine similarity for embedding verification.
+    :param jaccard_threshold: Minimum estimated Jaccard similarity of shingle sets.
+    :param min_tokens: Functions with fewer AST tokens are too small to compare and skipped.
+    :param fetch_sources: Callable mapping a list of indices to their sources, used to read
+        back the functions to embed; by default codes is indexed, so it must be a sequence.
+    :return: List of (indices into codes, mean pair score), largest clusters first.
+    """
+    hasher = MinHasher()
+    considered, exact_pairs, signatures = [], [], []
+    representative = {}
+    for i, code in enumerate(codes):
+        tokens = ast_tokens(code)
+        if len(tokens) < min_tokens:
+            continue
+        key = fingerprint(code)
+        if key in representative:
+            exact_pairs.append((representative[key], i))
+            continue
+        representative[key] = i
+        considered.append(i)
+        signatures.append(hasher.signature(shingle_hashes(tokens)))
+    signatures = np.array(signatures, dtype='uint32').reshape(len(considered), hasher.num_perm)
+
+    pairs, scores = [], []
+    for a, b in lsh_candidates(signatures):
+        jaccard = float(np.mean(signatures[a] == signatures[b]))
+        if jaccard >= jaccard_threshold:
+            pairs.append((considered[a], considered[b]))
+            scores.append(jaccard)
+
+    if embed is not None and pairs:
+        members = sorted({i for pair in pairs for i in pair})
+        position = {item: row for row, item in enumerate(members)}
+        sources = fetch_sources(members) if fetch_sources is not None else [codes[i] for i in members]
+        vectors = normalize_rows(embed(sources))
+        left = vectors[[position[i] for i, _ in pairs]]
+        right = vectors[[position[j] for _, j in pairs]]
+        cosines = np.einsum('ij,ij->i', left, right)
+        kept = [k for k, cosine in enumerate(cosines) if cosine >= threshold]
+        pairs = [pairs[k] for k in kept]
+        scores = [float(cosines[k]) for k in kept]
+
+    return _clusters(exact_pairs + pairs, [1.0] * len(exact_pairs) + scores)
@@ -0,0 +1,285 @@
+import fnmatch
+import functools
+import io
+import os
+import re
+import tokenize
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from config.settings import DISCOVERY
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+log = get_logger()
+
+# Contents of one source file, always UTF-8; mtime_ns and size describe the file on disk
+SourceFile = namedtuple('SourceFile', 'path data mtime_ns size')
+
+_EXCLUDED_NAMES = re.compile('|'.join(fnmatch.translate(pattern) for pattern in DISCOVERY['exclude']))
+
+
+class GitIgnore:
+    """
+    The patterns of one .gitignore file, matched against paths below its directory.
+
+    Supports the usual syntax: comments, ``!`` negation, trailing ``/`` for directories only,
+    patterns anchored by a ``/``, ``*``, ``?``, ``[...]`` and ``**``.
+    """
+
+    def __init__(self, base, lines):
+        self.base = base
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            if not line.endswith('\\ '):
+                line = line.rstrip()
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            # A slash anywhere but the end ties the pattern to this directory
+            anchored = '/' in line
+            pattern = _translate(line.lstrip('/'))
+            if not anchored:
+                pattern = '(?:.*/)?' + pattern
+            self.rules.append((re.compile(pattern + r'\Z', re.DOTALL), negate, dir_only))
+
+    @classmethod
+    def read(cls, base, path):
+        with open(path, encoding='utf-8', errors='replace') as file:
+            return cls(base, file.readlines())
+
+    def match(self, path, is_dir):
+        """True if path is ignored, False if re-included by a negation, None if no pattern applies."""
+        relative = path[len(self.base) + 1:].replace(os.sep, '/')
+        ignored = None
+        for pattern, negate, dir_only in self.rules:
+            if (is_dir or not dir_only) and pattern.match(relative):
+                ignored = not negate
+        return ignored
+
+
+def _translate(pattern):
+    """Regular expression for one gitignore glob, where only ``**`` crosses directories."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+            continue
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body[0] in '!^':
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif char == '\\' and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return ''.join(parts)
+
+
+def _is_ignored(gitignores, path, is_dir):
+    # Deeper files override shallower ones, as in git
+    for gitignore in reversed(gitignores):
+        ignored = gitignore.match(path, is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+
+@functools.lru_cache(maxsize=1024)
+def _read_gitignore(base, mtime_ns, size):
+    # Keyed by mtime and size as well, so an edited .gitignore is read again
+    return GitIgnore.read(base, os.path.join(base, '.gitignore'))
+
+
+def _gitignore_in(directory):
+    try:
+        stat = os.stat(os.path.join(directory, '.gitignore'))
+        return _read_gitignore(directory, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        log.warning(f"Cannot read {directory}/.gitignore: {e}")
+        return None
+
+
+def is_pruned(path, roots=(), gitignore=DISCOVERY['gitignore']):
+    """
+    Whether walking the root that contains path would leave it out.
+
+    walk only judges the entries it lists, so a path that turns up later, as a watcher
+    reports it, is checked with this before it is watched or rescanned on its own. Every
+    directory from the root down to path is held against DISCOVERY['exclude'], the
+    .gitignore files above it and the pyvenv.cfg check; a root itself is never pruned.
+
+    :param roots: Directories being walked; path is judged from the deepest one containing it,
+        or from its parent directory when none does.
+    :param gitignore: Honour .gitignore files.
+    """
+    path = os.path.abspath(path)
+    containing = [root for root in map(os.path.abspath, roots)
+                  if path == root or path.startswith(os.path.join(root, ''))]
+    root = max(containing, key=len) if containing else os.path.dirname(path)
+    is_dir = os.path.isdir(path)
+    parts = [] if path == root else os.path.relpath(path, root).split(os.sep)
+    gitignores = ()
+    current = root
+    for position, part in enumerate(parts):
+        if gitignore:
+            found = _gitignore_in(current)
+            if found is not None:
+                gitignores += (found,)
+        current = os.path.join(current, part)
+        part_is_dir = is_dir or position < len(parts) - 1
+        if part_is_dir and (_EXCLUDED_NAMES.match(part) or os.path.isfile(os.path.join(current, 'pyvenv.cfg'))):
+            return True
+        if gitignores and _is_ignored(gitignores, current, part_is_dir):
+            return True
+    return False
+
+
+def _scan(directory):
+    """List one directory as sorted (name, path, is_dir), or None when it cannot or should not be entered."""
+    try:
+        with metrics.timer('walk'):
+            with os.scandir(directory) as entries:
+                listing = sorted((entry.name, entry.path, entry.is_dir(follow_symlinks=False)) for entry in entries)
+    except FileNotFoundError:
+        # A missing root (such as a project without tst/) or a directory deleted mid-walk
+        return None
+    except OSError as e:
+        log.warning(f"Cannot list {directory}: {e}")
+        return None
+    if any(name == 'pyvenv.cfg' and not is_dir for name, _, is_dir in listing):
+        # A virtualenv that is not named like one
+        return None
+    return listing
+
+
+def walk(directory, exclude_dirs=(), gitignore=DISCOVERY['gitignore'], workers=DISCOVERY['scan_workers']):
+    """
+    Yield (directory path, file names) for every directory worth looking into under directory.
+
+    Version control metadata, caches and node_modules (DISCOVERY['exclude']) are pruned
+    without being listed, as are virtualenvs (directories holding a pyvenv.cfg) and paths
+    the .gitignore files along the way ignore. directory itself is always listed; use
+    is_pruned to judge it first.
+    Directories of one level are listed concurrently, which hides the latency of network
+    file systems; the order is still deterministic (breadth first, sorted by name).
+
+    :param exclude_dirs: Further directories to prune, by path.
+    :param gitignore: Honour .gitignore files.
+    :param workers: Threads listing directories.
+    """
+    excluded = {os.path.abspath(path) for path in exclude_dirs}
+    level = [(directory, ())]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while level:
+            next_level = []
+            for (path, gitignores), listing in zip(level, pool.map(_scan, [path for path, _ in level])):
+                if listing is None:
+                    continue
+                if gitignore and any(name == '.gitignore' and not is_dir for name, _, is_dir in listing):
+                    try:
+                        gitignores += (GitIgnore.read(path, os.path.join(path, '.gitignore')),)
+                    except OSError as e:
+                        log.warning(f"Cannot read {path}/.gitignore: {e}")
+                files = []
+                for name, full_path, is_dir in listing:
+                    if is_dir:
+                        if _EXCLUDED_NAMES.match(name) or (excluded and os.path.abspath(full_path) in excluded):
+                            continue
+                        if not gitignores or not _is_ignored(gitignores, full_path, True):
+                            next_level.append((full_path, gitignores))
+                    elif not gitignores or not _is_ignored(gitignores, full_path, False):
+                        files.append(name)
+                yield path, files
+            level = next_level
+
+
+def iter_files(directory, exclude_dirs=(), suffix='.py', **options):
+    """Yield the path of every file with the suffix under directory, pruned as walk does."""
+    for path, files in walk(directory, exclude_dirs, **options):
+        paths = [os.path.join(path, name) for name in files if name.endswith(suffix)]
+        metrics.count('walk.files', len(paths))
+        yield from paths
+
+
+def to_utf8(data):
+    """
+    Source bytes re-encoded as UTF-8 without a BOM, decoded as their BOM or PEP 263 coding cookie says.
+
+    Extraction offsets count bytes of this form, so whatever slices sources by those
+    offsets must read files through it as well.
+
+    :raises SyntaxError: The coding cookie is unknown or contradicts the BOM.
+    :raises UnicodeDecodeError: The bytes are not in the declared encoding.
+    """
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+    if encoding == 'utf-8':
+        return data
+    if encoding == 'utf-8-sig':
+        return data[3:] if data.startswith(b'\xef\xbb\xbf') else data
+    return data.decode(encoding).encode('utf-8')
+
+
+def read_file(path, max_bytes=DISCOVERY['max_file_bytes']):
+    """
+    Read a source file for parsing.
+
+    :param max_bytes: Refuse larger files (generated or vendored code, data dumps); 0 for no limit.
+    :return: SourceFile whose data is UTF-8.
+    :raises OSError: The file cannot be read.
+    :raises ValueError: The file is too large or not text in its declared encoding.
+    """
+    with metrics.timer('read'):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            if max_bytes and stat.st_size > max_bytes:
+                metrics.count('read.too_large')
+                raise ValueError(f"{stat.st_size} bytes exceeds the limit of {max_bytes}")
+            data = file.read()
+        try:
+            data = to_utf8(data)
+        except SyntaxError as e:
+            raise ValueError(e.msg) from e
+    metrics.count('read.bytes', len(data))
+    return SourceFile(path, data, stat.st_mtime_ns, stat.st_size)
+
+
+def read_span(path, start_offset, end_offset):
+    """Bytes start_offset:end_offset of a file's UTF-8 contents, as extraction offsets count them."""
+    with open(path, 'rb') as file:
+        encoding, _ = tokenize.detect_encoding(file.readline)
+        if encoding == 'utf-8':
+            file.seek(start_offset)
+            return file.read(end_offset - start_offset)
+        file.seek(0)
+        return to_utf8(file.read())[start_offset:end_offset]
@@ -0,0 +1,65 @@
+import numpy as np
+import torch
+
+from utils.metrics import metrics
+
+
+def mean_pool(last_hidden_state, attention_mask):
+    """Average token embeddings over the attention mask so padding does not dilute the result."""
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1e-9)
+    return summed / counts
+
+
+def length_sorted_batches(lengths, batch_size):
+    """Yield lists of indices whose token lengths are close, to keep padding per batch low."""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def tokenize_batches(tokenizer, snippets, batch_size=32, max_tokens=512):
+    """
+    Tokenize snippets once and yield length-bucketed, padded batches.
+
+    :return: Iterator of (indices, features) where indices point into snippets.
+    """
+    # Tokenize once without padding so batches can be padded to their own longest member
+    with metrics.timer('tokenize'):
+        input_ids = tokenizer(list(snippets), truncation=True, max_length=max_tokens)['input_ids']
+    lengths = [len(ids) for ids in input_ids]
+    metrics.count('tokenize.tokens', sum(lengths))
+    for batch in length_sorted_batches(lengths, batch_size):
+        with metrics.timer('tokenize'):
+            features = tokenizer.pad({'input_ids': [input_ids[i] for i in batch]}, return_tensors='pt')
+        yield batch, features
+
+
+def embed_features(model, features):
+    """Run one padded batch through the model and mean-pool it into a float32 array."""
+    model.eval()
+    with metrics.timer('forward'), torch.inference_mode():
+        outputs = model(**features)
+        pooled = mean_pool(outputs.last_hidden_state, features['attention_mask'])
+    metrics.count('forward.snippets', len(pooled))
+    return pooled.float().numpy()
+
+
+def embed_batched(tokenizer, model, snippets, batch_size=32, max_tokens=512):
+    """
+    Embed code snippets in length-bucketed batches.
+
+    :param tokenizer: Hugging Face tokenizer matching the model.
+    :param model: Hugging Face encoder model.
+    :param snippets: List of code strings.
+    :param batch_size: Number of snippets per forward pass.
+    :param max_tokens: Truncation length for each snippet.
+    :return: float32 array of shape (len(snippets), hidden_size) in input order.
+    """
+    embeddings = np.empty((len(snippets), model.config.hidden_size), dtype='float32')
+    if not snippets:
+        return embeddings
+    for batch, features in tokenize_batches(tokenizer, snippets, batch_size, max_tokens):
+        embeddings[batch] = embed_features(model, features)
+    return embeddings
@@ -0,0 +1,242 @@
+import fcntl
+import hashlib
+import os
+import sqlite3
+import textwrap
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from config.settings import EMBEDDING_CACHE
+from services.normalize import normalize_function
+from utils.metrics import metrics
+
+# Lookups are remembered and written to last_used this many at a time
+_TOUCH_BATCH = 1024
+
+
+def normalize_source(code):
+    """Normalize indentation and whitespace so formatting-only edits keep the same cache key."""
+    lines = textwrap.dedent(code).splitlines()
+    return '\n'.join(line.rstrip() for line in lines if line.strip())
+
+
+def cache_key(code, model_name, pooling='mean'):
+    """Content hash identifying one (source, model, pooling) embedding."""
+    digest = hashlib.sha256()
+    for part in (model_name, pooling, normalize_source(code)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def clone_key(normalized, model_name, pooling='mean'):
+    """
+    Key shared by exact clones: a hash of the services.normalize canonical form.
+
+    Embeddings are stored under this key as well as their own, so a renamed or reformatted
+    copy of a function embedded before reuses its vector without a forward pass.
+    """
+    digest = hashlib.sha256()
+    for part in ('clone', model_name, pooling, normalized.source):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache shared by every embedder.
+
+    Vectors live in fixed-size float32 slots of ``vectors.bin``; ``index.sqlite`` maps
+    content keys to slots and tracks last use. Once ``max_entries`` slots are taken the
+    least recently used entry gives up its slot, so the data file never grows past
+    ``max_entries * dim * 4`` bytes.
+
+    Several processes may share one cache directory: slots are handed out from a counter in
+    the ``meta`` table under SQLite's write lock (``BEGIN IMMEDIATE``). Writers also hold an
+    exclusive lock on the vectors file until they commit, and lookups a shared one, so a
+    lookup never reads a slot that is being handed to another key. Lookups only read the
+    index; their last-use times are written in batches, so query servers do not queue up
+    behind each other.
+    """
+
+    def __init__(self, cache_dir, dim, max_entries=EMBEDDING_CACHE['max_entries']):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dim = dim
+        self.max_entries = max_entries
+        self.slot_bytes = dim * 4
+        # Transactions are opened explicitly, see _transaction
+        self.db = sqlite3.connect(os.path.join(cache_dir, f'index_{dim}.sqlite'), timeout=30,
+                                  isolation_level=None, check_same_thread=False)
+        # Pipeline stages share one cache from several threads
+        self.lock = threading.RLock()
+        # key -> time of lookups not yet written to last_used
+        self.touched = {}
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self._transaction():
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Caches written before the counter existed have dense slots 0..MAX(slot)
+            self.db.execute("INSERT OR IGNORE INTO meta (name, value) "
+                            "SELECT 'next_slot', COALESCE(MAX(slot) + 1, 0) FROM entries")
+        vectors_path = os.path.join(cache_dir, f'vectors_{dim}.bin')
+        self.fd = os.open(vectors_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @classmethod
+    def from_settings(cls, dim):
+        """Build the cache configured in config.settings, or return None when caching is disabled."""
+        if not EMBEDDING_CACHE['path']:
+            return None
+        return cls(EMBEDDING_CACHE['path'], dim)
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    @contextmanager
+    def _transaction(self, immediate=True):
+        """
+        Hold the thread lock and a SQLite transaction.
+
+        :param immediate: Take SQLite's write lock up front, which also excludes other
+            processes; otherwise a read transaction that sees one snapshot of the index.
+        """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+
+    @contextmanager
+    def _vectors_lock(self, exclusive):
+        """Lock the vectors file against other processes: shared for lookups, exclusive for writes."""
+        fcntl.flock(self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def get_many(self, keys):
+        """Return a dict of key -> vector for the keys present in the cache."""
+        found = {}
+        # The file lock spans the snapshot, so no writer can reuse a slot between lookup and read
+        with self.lock, self._vectors_lock(exclusive=False), self._transaction(immediate=False):
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.db.execute(f'SELECT key, slot FROM entries WHERE key IN ({placeholders})', chunk).fetchall()
+                for key, slot in sorted(rows, key=lambda row: row[1]):
+                    data = os.pread(self.fd, self.slot_bytes, slot * self.slot_bytes)
+                    found[key] = np.frombuffer(data, dtype='float32')
+        with self.lock:
+            now = time.time()
+            self.touched.update((key, now) for key in found)
+            if len(self.touched) >= _TOUCH_BATCH:
+                with self._transaction():
+                    self._write_touched()
+        return found
+
+    def _write_touched(self):
+        # Called inside a write transaction
+        self.db.executemany('UPDATE entries SET last_used = ? WHERE key = ?',
+                            [(used, key) for key, used in self.touched.items()])
+        self.touched.clear()
+
+    def put_many(self, keys, vectors):
+        """Store vectors under their keys, evicting least recently used entries when full."""
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        # File lock first and released after COMMIT, so lookups see the old slots or the new ones
+        with self.lock, self._vectors_lock(exclusive=True), self._transaction():
+            # Recent lookups count before choosing what to evict
+            self._write_touched()
+            now = time.time()
+            for key, vector in zip(keys, vectors):
+                row = self.db.execute('SELECT slot FROM entries WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    slot = row[0]
+                else:
+                    slot = self._allocate_slot()
+                os.pwrite(self.fd, vector.tobytes(), slot * self.slot_bytes)
+                self.db.execute('INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)', (key, slot, now))
+
+    def _allocate_slot(self):
+        # Called inside a transaction; the counter and the eviction commit with the new entry
+        next_slot = self.db.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()[0]
+        if next_slot < self.max_entries:
+            self.db.execute("UPDATE meta SET value = ? WHERE name = 'next_slot'", (next_slot + 1,))
+            return next_slot
+        key, slot = self.db.execute('SELECT key, slot FROM entries ORDER BY last_used LIMIT 1').fetchone()
+        self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        return slot
+
+    def close(self):
+        with self.lock:
+            if self.touched:
+                with self._transaction():
+                    self._write_touched()
+            self.db.close()
+            os.close(self.fd)
+
+
+def cached_embed(cache, snippets, embed_fn, model_name, pooling='mean', store=True):
+    """
+    Embed snippets, reusing cached vectors and only running ``embed_fn`` on the misses.
+
+    Misses are normalized first: exact clones of a cached function take its vector, and
+    clones among the misses are embedded once.
+
+    :param cache: EmbeddingCache instance, or None to always call ``embed_fn``.
+    :param snippets: List of code strings.
+    :param embed_fn: Callable mapping a list of snippets to an (n, dim) float32 array.
+    :param model_name: Model identifier folded into the cache key.
+    :param pooling: Pooling mode folded into the cache key.
+    :param store: Write the new vectors to the cache; off for ad-hoc queries, which would
+        otherwise fill the cache with snippets that are not part of any corpus.
+    :return: float32 array of shape (len(snippets), dim) in input order.
+    """
+    if cache is None:
+        return embed_fn(snippets)
+
+    keys = [cache_key(snippet, model_name, pooling) for snippet in snippets]
+    cached = cache.get_many(keys)
+    missing = list(dict.fromkeys(key for key in keys if key not in cached))
+    metrics.count('cache.hits', sum(key in cached for key in keys))
+    metrics.count('cache.misses', len(missing))
+    if missing:
+        first_snippet = {}
+        for key, snippet in zip(keys, snippets):
+            first_snippet.setdefault(key, snippet)
+        shared_keys = {}
+        for key in missing:
+            normalized = normalize_function(first_snippet[key])
+            shared_keys[key] = key if normalized is None else clone_key(normalized, model_name, pooling)
+        shared = cache.get_many(set(shared_keys.values()))
+        # One forward pass per distinct canonical form
+        representatives = list(dict.fromkeys(shared_key for shared_key in shared_keys.values() if shared_key not in shared))
+        metrics.count('clones.exact', len(missing) - len(representatives))
+        if representatives:
+            representative_snippet = {}
+            for key, shared_key in shared_keys.items():
+                representative_snippet.setdefault(shared_key, first_snippet[key])
+            fresh = embed_fn([representative_snippet[shared_key] for shared_key in representatives])
+            shared.update(zip(representatives, fresh))
+        vectors = [shared[shared_keys[key]] for key in missing]
+        if store:
+            cache.put_many(missing + representatives, vectors + [shared[shared_key] for shared_key in representatives])
+        cached.update(zip(missing, vectors))
+
+    embeddings = np.empty((len(snippets), cache.dim), dtype='float32')
+    for i, key in enumerate(keys):
+        embeddings[i] = cached[key]
+    return embeddings
@@ -0,0 +1,242 @@
+import ast
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from config.settings import EXTRACTION
+from services.discovery import iter_files, read_file, read_span, to_utf8
+from services.normalize import body_nodes
+from utils.metrics import metrics
+
+# One function or method definition. Offsets are byte offsets into the UTF-8 file contents;
+# body_nodes is the size of the body as services.normalize counts it, for is_trivial.
+FunctionRecord = namedtuple('FunctionRecord',
+                            'name qualname is_async lineno end_lineno start_offset end_offset body_nodes')
+
+# Everything the analyzers need from one parsed file. ``calls`` holds bare callee names.
+FileRecord = namedtuple('FileRecord', 'path mtime_ns size defs calls error')
+
+# Records already produced in this process, keyed by path and validated by mtime/size;
+# least recently used first, capped at EXTRACTION['max_records']
+_records = OrderedDict()
+_records_lock = threading.Lock()
+
+
+def iter_python_files(directory, exclude_dirs=()):
+    """
+    Yield every .py file under directory, pruning the excluded directories.
+
+    Virtualenvs, VCS metadata, caches and whatever .gitignore ignores are pruned
+    as well; see services.discovery.walk.
+    """
+    return iter_files(directory, exclude_dirs)
+
+
+class _Visitor(ast.NodeVisitor):
+    """Single walk collecting definitions with qualified names and call names."""
+
+    def __init__(self, line_starts):
+        self.line_starts = line_starts
+        self.scope = []
+        self.defs = []
+        self.calls = set()
+
+    def visit_ClassDef(self, node):
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def visit_FunctionDef(self, node):
+        self.scope.append(node.name)
+        self.defs.append(FunctionRecord(
+            node.name,
+            '.'.join(self.scope),
+            isinstance(node, ast.AsyncFunctionDef),
+            node.lineno,
+            node.end_lineno,
+            self.line_starts[node.lineno - 1] + node.col_offset,
+            self.line_starts[node.end_lineno - 1] + node.end_col_offset,
+            body_nodes(node),
+        ))
+        # Anything defined inside a function body is local to it, as in __qualname__
+        self.scope.append('<locals>')
+        self.generic_visit(node)
+        self.scope.pop()
+        self.scope.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name):
+            self.calls.add(func.id)
+        elif isinstance(func, ast.Attribute):
+            # For method calls like obj.method()
+            self.calls.add(func.attr)
+        self.generic_visit(node)
+
+
+def extract_file(file_path):
+    """Parse one file and return its FileRecord. Errors are recorded, not raised."""
+    try:
+        source = read_file(file_path)
+    except (OSError, ValueError) as e:
+        return FileRecord(file_path, 0, 0, (), (), f"{type(e).__name__}: {e}")
+    return extract_source(*source)
+
+
+def extract_source(file_path, data, mtime_ns=0, size=0):
+    """
+    Parse already-read file contents and return their FileRecord. Errors are recorded, not raised.
+
+    data must be UTF-8, as services.discovery.read_file returns it; a coding cookie in it is ignored.
+    """
+    with metrics.timer('parse'):
+        try:
+            tree = ast.parse(data.decode('utf-8'), filename=file_path)
+        except (SyntaxError, ValueError) as e:
+            metrics.count('parse.errors')
+            return FileRecord(file_path, 0, 0, (), (), f"{type(e).__name__}: {e}")
+
+        line_starts = [0]
+        for line in data.splitlines(keepends=True):
+            line_starts.append(line_starts[-1] + len(line))
+        visitor = _Visitor(line_starts)
+        visitor.visit(tree)
+    metrics.count('parse.files')
+    metrics.count('parse.functions', len(visitor.defs))
+    return FileRecord(file_path, mtime_ns, size, tuple(visitor.defs), tuple(sorted(visitor.calls)), None)
+
+
+def _recall(file_path):
+    with _records_lock:
+        record = _records.get(file_path)
+        if record is not None:
+            _records.move_to_end(file_path)
+        return record
+
+
+def _remember(record):
+    with _records_lock:
+        _records[record.path] = record
+        _records.move_to_end(record.path)
+        while len(_records) > EXTRACTION['max_records']:
+            _records.popitem(last=False)
+
+
+def clear_records():
+    """Forget the records memoized in this process, so the next extraction parses every file again."""
+    with _records_lock:
+        _records.clear()
+
+
+def _is_fresh(record):
+    try:
+        stat = os.stat(record.path)
+    except OSError:
+        return False
+    return record.error is None and (stat.st_mtime_ns, stat.st_size) == (record.mtime_ns, record.size)
+
+
+def extract_files(file_paths, workers=EXTRACTION['workers']):
+    """
+    Parse each file once, in a process pool when there is enough work to pay for it.
+
+    :param file_paths: Iterable of Python file paths.
+    :param workers: Pool size; 0 means one worker per CPU.
+    :return: List of FileRecord in the same order as file_paths.
+    """
+    file_paths = list(file_paths)
+    found = {}
+    for path in file_paths:
+        record = _recall(path)
+        if record is not None and _is_fresh(record):
+            found[path] = record
+    pending = [path for path in dict.fromkeys(file_paths) if path not in found]
+    workers = workers or os.cpu_count() or 1
+
+    if workers > 1 and len(pending) >= EXTRACTION['min_pool_files']:
+        chunksize = max(1, len(pending) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            records = list(pool.map(extract_file, pending, chunksize=chunksize))
+    else:
+        records = [extract_file(path) for path in pending]
+
+    for record in records:
+        found[record.path] = record
+        _remember(record)
+    return [found[path] for path in file_paths]
+
+
+def extract_stream(sources, workers=EXTRACTION['workers']):
+    """
+    Parse already-read files as they arrive, yielding (FileRecord, data) in their order.
+
+    Files go to a process pool once EXTRACTION['min_pool_files'] have arrived, so short
+    streams (a watcher's few changed files) never start one; about two files per worker are
+    parsed at a time. Files unchanged since this process last parsed them are not parsed again.
+    The pool's workers come from a fork server rather than from this process, which may
+    have other threads holding locks at the time.
+
+    :param sources: Iterable of SourceFile, as services.discovery.read_file returns them.
+    :param workers: Pool size; 0 means one worker per CPU, 1 parses in this thread.
+    """
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    in_flight = deque()
+    try:
+        for count, source in enumerate(sources, 1):
+            record = _recall(source.path)
+            if record is not None and not record.error and (record.mtime_ns, record.size) == (source.mtime_ns, source.size):
+                in_flight.append((source, record))
+            elif pool is not None or (workers > 1 and count >= EXTRACTION['min_pool_files']):
+                if pool is None:
+                    context = multiprocessing.get_context('forkserver') \
+                        if 'forkserver' in multiprocessing.get_all_start_methods() else None
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                in_flight.append((source, pool.submit(extract_source, *source)))
+            else:
+                record = extract_source(*source)
+                _remember(record)
+                in_flight.append((source, record))
+            # Hand on everything already parsed, and wait once enough files are in the pool
+            while in_flight and (not isinstance(in_flight[0][1], Future) or len(in_flight) > 2 * workers):
+                yield _finish(*in_flight.popleft())
+        while in_flight:
+            yield _finish(*in_flight.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _finish(source, result):
+    if isinstance(result, Future):
+        result = result.result()
+        _remember(result)
+    return result, source.data
+
+
+def extract_project(directory, exclude_dirs=(), workers=EXTRACTION['workers']):
+    """Extract records for every Python file under directory."""
+    return extract_files(iter_python_files(directory, exclude_dirs), workers=workers)
+
+
+def read_source(file_path, start_offset, end_offset):
+    """Read one definition's source text by byte offsets."""
+    return read_span(file_path, start_offset, end_offset).decode('utf-8')
+
+
+def read_sources(record, data=None):
+    """Slice the source text of every definition in a record, reading the file once if data is not given."""
+    if data is None:
+        with open(record.path, 'rb') as file:
+            data = to_utf8(file.read())
+    return [data[d.start_offset:d.end_offset].decode('utf-8') for d in record.defs]
+
+
+def module_name(file_path, project_dir):
+    """Dotted module name of a file relative to the project directory."""
+    module_path = os.path.relpath(file_path, project_dir)
+    return module_path.replace(os.sep, '.')[:-3]  # remove .py extension
@@ -0,0 +1,219 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+from services.discovery import to_utf8
+from services.extraction import read_source
+
+# Integer columns kept per function: (name, array typecode, numpy dtype)
+COLUMNS = (
+    ('name', 'i', 'int32'),
+    ('file', 'i', 'int32'),
+    ('lineno', 'i', 'int32'),
+    ('end_lineno', 'i', 'int32'),
+    ('start', 'q', 'int64'),
+    ('end', 'q', 'int64'),
+)
+
+STORE_FILE = 'store.json'
+
+
+class StringTable:
+    """
+    Interned strings stored as one UTF-8 blob plus an offsets array.
+
+    While building, strings live in a dict for interning. Once saved and loaded, both
+    arrays are memory-mapped read-only and a string is decoded only when it is looked up.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+        self.blob = None
+        self.offsets = None
+
+    def __len__(self):
+        return len(self.strings) if self.offsets is None else len(self.offsets) - 1
+
+    def __getitem__(self, string_id):
+        if self.offsets is None:
+            return self.strings[string_id]
+        return bytes(self.blob[self.offsets[string_id]:self.offsets[string_id + 1]]).decode('utf-8')
+
+    def intern(self, string):
+        """Return the id of string, adding it to the table if it is new."""
+        if self.offsets is not None:
+            raise ValueError("A loaded string table is read-only")
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def save(self, directory):
+        encoded = [string.encode('utf-8') for string in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        np.save(os.path.join(directory, 'strings.npy'), np.frombuffer(b''.join(encoded), dtype='uint8'))
+        np.save(os.path.join(directory, 'string_offsets.npy'), offsets)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        table = cls()
+        mmap_mode = 'r' if mmap else None
+        table.blob = np.load(os.path.join(directory, 'strings.npy'), mmap_mode=mmap_mode)
+        table.offsets = np.load(os.path.join(directory, 'string_offsets.npy'), mmap_mode=mmap_mode)
+        return table
+
+    def writable(self):
+        """Return a copy that can intern new strings, decoding a loaded table once."""
+        if self.offsets is None:
+            return self
+        table = StringTable()
+        for string_id in range(len(self)):
+            table.intern(self[string_id])
+        return table
+
+
+class FunctionStore:
+    """
+    Array-backed function metadata: a string table for names and paths, integer columns
+    for file id, line span and byte span, and an optional (n, dim) vector matrix.
+
+    Rows are appended while building and saved as ``.npy`` files. A loaded store is
+    memory-mapped read-only, so several worker processes share one copy through the page
+    cache. Source text is not stored; it is read from the byte span on request.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+        self.vectors = None
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def append(self, name, file_path=None, lineno=0, end_lineno=0, start=0, end=0):
+        """Add one function and return its row id. file_path None means the source is unknown."""
+        row = len(self)
+        values = {
+            'name': self.strings.intern(name),
+            'file': -1 if file_path is None else self.strings.intern(file_path),
+            'lineno': lineno,
+            'end_lineno': end_lineno,
+            'start': start,
+            'end': end,
+        }
+        for column, value in values.items():
+            self.columns[column].append(value)
+        return row
+
+    def append_function(self, file_path, function):
+        """Add a FunctionRecord found in file_path and return its row id."""
+        return self.append(function.name, file_path, function.lineno, function.end_lineno,
+                           function.start_offset, function.end_offset)
+
+    def name(self, row):
+        return self.strings[self.columns['name'][row]]
+
+    def file(self, row):
+        file_id = self.columns['file'][row]
+        return None if file_id < 0 else self.strings[file_id]
+
+    def source(self, row):
+        """Read the function's source text from its file by byte span."""
+        file_path = self.file(row)
+        if file_path is None:
+            return None
+        return read_source(file_path, int(self.columns['start'][row]), int(self.columns['end'][row]))
+
+    def sources(self, rows):
+        """Read the source text of many rows, opening each file only once."""
+        by_file = {}
+        for position, row in enumerate(rows):
+            by_file.setdefault(self.file(row), []).append((position, row))
+        sources = [None] * len(rows)
+        for file_path, entries in by_file.items():
+            if file_path is None:
+                continue
+            with open(file_path, 'rb') as file:
+                data = to_utf8(file.read())
+            for position, row in entries:
+                sources[position] = data[self.columns['start'][row]:self.columns['end'][row]].decode('utf-8')
+        return sources
+
+    def iter_sources(self, rows=None, block_size=1024):
+        """Yield the source text of each row in order, reading a block of rows at a time."""
+        rows = range(len(self)) if rows is None else rows
+        for start in range(0, len(rows), block_size):
+            yield from self.sources(rows[start:start + block_size])
+
+    def get(self, row, with_source=False):
+        """Return one row as a dict, reading the source only when asked to."""
+        record = {
+            'name': self.name(row),
+            'file': self.file(row),
+            'lineno': int(self.columns['lineno'][row]),
+            'end_lineno': int(self.columns['end_lineno'][row]),
+        }
+        if with_source:
+            record['code'] = self.source(row)
+        return record
+
+    def rows_by_file(self, rows=None):
+        """Map file path to the list of its row ids, over all rows or only the given ones."""
+        by_file = {}
+        for row in range(len(self)) if rows is None else rows:
+            by_file.setdefault(self.file(row), []).append(row)
+        return by_file
+
+    def rows_by_span(self):
+        """Map (file_path, start offset) to row id."""
+        return {(self.file(row), int(self.columns['start'][row])): row for row in range(len(self))}
+
+    def subset(self, rows):
+        """Return a new store of the given rows, in order, so row i of it is rows[i] of this one."""
+        store = FunctionStore()
+        for row in rows:
+            store.append(self.name(row), self.file(row), int(self.columns['lineno'][row]),
+                         int(self.columns['end_lineno'][row]), int(self.columns['start'][row]),
+                         int(self.columns['end'][row]))
+        if self.vectors is not None:
+            store.vectors = np.asarray(self.vectors)[np.asarray(rows, dtype='int64')]
+        return store
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.strings.save(directory)
+        for name, _, dtype in COLUMNS:
+            np.save(os.path.join(directory, f'{name}.npy'), np.asarray(self.columns[name], dtype=dtype))
+        if self.vectors is not None:
+            np.save(os.path.join(directory, 'vectors.npy'), self.vectors)
+        with open(os.path.join(directory, STORE_FILE), 'w', encoding='utf-8') as file:
+            json.dump({'rows': len(self), 'vectors': self.vectors is not None}, file)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved store, memory-mapping every array read-only unless mmap is False."""
+        with open(os.path.join(directory, STORE_FILE), 'r', encoding='utf-8') as file:
+            info = json.load(file)
+        mmap_mode = 'r' if mmap else None
+        store = cls()
+        store.strings = StringTable.load(directory, mmap=mmap)
+        store.columns = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name, _, _ in COLUMNS}
+        if info['vectors']:
+            store.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode=mmap_mode)
+        return store
+
+    def writable(self):
+        """Return a store that accepts appends, copying a loaded store's arrays into memory."""
+        if isinstance(self.columns['name'], array):
+            return self
+        store = FunctionStore()
+        store.strings = self.strings.writable()
+        for name, typecode, _ in COLUMNS:
+            store.columns[name] = array(typecode, self.columns[name].tolist())
+        store.vectors = None if self.vectors is None else np.array(self.vectors)
+        return store
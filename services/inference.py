@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import torch
+from transformers import AutoModel
+
+from config.settings import EMBEDDING, INFERENCE
+from services.embedding import embed_batched
+from services.similarity import normalize_rows
+from utils.metrics import metrics
+
+_threads_configured = False
+
+# (tokenizer, model, batch_size, max_tokens) inherited by forked replica processes
+_replica = None
+
+
+def configure_threads(intra_op=INFERENCE['intra_op_threads'], inter_op=INFERENCE['inter_op_threads']):
+    """Apply the configured torch thread counts; 0 keeps torch's default."""
+    global _threads_configured
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op and not _threads_configured:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Only allowed before the first parallel op; keep whatever is in effect
+            pass
+    _threads_configured = True
+
+
+def quantize(model):
+    """Dynamic int8 quantization of every Linear layer; activations stay float and are quantized per batch."""
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_model(model_name, quantized=INFERENCE['quantize']):
+    """
+    Load an encoder for CPU inference with the configured thread counts.
+
+    :param model_name: Hugging Face model name or path.
+    :param quantized: Apply dynamic int8 quantization to the Linear layers.
+    :return: Model in eval mode.
+    """
+    configure_threads()
+    model = AutoModel.from_pretrained(model_name).eval()
+    return quantize(model) if quantized else model
+
+
+def model_id(model_name, quantized=INFERENCE['quantize']):
+    """Identifier used in cache keys, so int8 and fp32 embeddings of a model never mix."""
+    return f"{model_name}:int8" if quantized else model_name
+
+
+def _init_replica(threads):
+    torch.set_num_threads(threads)
+
+
+def _embed_on_replica(snippets):
+    tokenizer, model, batch_size, max_tokens = _replica
+    return embed_batched(tokenizer, model, snippets, batch_size=batch_size, max_tokens=max_tokens)
+
+
+class ReplicaPool:
+    """
+    N forked worker processes, each running the same already-loaded model.
+
+    The model is loaded once in the parent and the workers are forked afterwards, so its
+    weights are shared copy-on-write instead of loaded N times. Each worker gets an equal
+    share of the CPU threads. Requires the fork start method (Linux, macOS with fork).
+
+    Calling the pool embeds snippets. Close it, or use it as a context manager, to stop
+    the workers.
+    """
+
+    def __init__(self, tokenizer, model, replicas=INFERENCE['replicas'],
+                 batch_size=EMBEDDING['batch_size'], max_tokens=EMBEDDING['max_tokens']):
+        global _replica
+        # The fast tokenizer's own thread pool does not survive fork
+        os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+        _replica = (tokenizer, model, batch_size, max_tokens)
+        self.replicas = replicas
+        self.hidden_size = model.config.hidden_size
+        threads = max(1, torch.get_num_threads() // replicas)
+        self.pool = multiprocessing.get_context('fork').Pool(replicas, initializer=_init_replica, initargs=(threads,))
+
+    def embed(self, snippets):
+        """Split snippets evenly across the replicas and return their embeddings in input order."""
+        if not snippets:
+            return np.empty((0, self.hidden_size), dtype='float32')
+        size = -(-len(snippets) // self.replicas)
+        chunks = [snippets[start:start + size] for start in range(0, len(snippets), size)]
+        # The replicas' own timers stay in their processes; time the whole fan-out here
+        with metrics.timer('forward'):
+            embeddings = np.concatenate(self.pool.map(_embed_on_replica, chunks))
+        metrics.count('forward.snippets', len(snippets))
+        return embeddings
+
+    __call__ = embed
+
+    def close(self):
+        """Stop the worker processes; safe to call more than once."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def embedding_function(tokenizer, model, batch_size=EMBEDDING['batch_size'], max_tokens=EMBEDDING['max_tokens'],
+                       replicas=INFERENCE['replicas']):
+    """
+    Callable mapping a list of snippets to embeddings, on replica processes when more than one is configured.
+
+    Pass the result to close_embedding_function when done, to stop any replica processes.
+    """
+    if replicas > 1:
+        return ReplicaPool(tokenizer, model, replicas, batch_size, max_tokens)
+
+    def embed(snippets):
+        return embed_batched(tokenizer, model, snippets, batch_size=batch_size, max_tokens=max_tokens)
+
+    return embed
+
+
+def pipeline_embed_function(embed_fn):
+    """
+    What services.pipeline.stream_embeddings should embed with: the ReplicaPool behind an
+    embedding_function, or None to tokenize and run the model in the pipeline's own stages.
+    """
+    return embed_fn if isinstance(embed_fn, ReplicaPool) else None
+
+
+def close_embedding_function(embed_fn):
+    """Release what an embedding_function holds: the worker processes of a ReplicaPool."""
+    if isinstance(embed_fn, ReplicaPool):
+        embed_fn.close()
+
+
+def compare_quantization(tokenizer, model_name, snippets, batch_size=EMBEDDING['batch_size'],
+                         max_tokens=EMBEDDING['max_tokens'], repeat=3):
+    """
+    Time fp32 against int8 inference on the same snippets and measure how far the embeddings move.
+
+    :param snippets: Representative function sources.
+    :param repeat: Timed runs per variant; the fastest counts.
+    :return: Dict with fp32/int8 seconds, speedup and the mean/min cosine similarity between
+        each snippet's fp32 and int8 embedding.
+    """
+    fp32 = load_model(model_name, quantized=False)
+    int8 = quantize(load_model(model_name, quantized=False))
+    report = {'snippets': len(snippets)}
+    embeddings = {}
+    for label, model in (('fp32', fp32), ('int8', int8)):
+        # Warm-up run also produces the embeddings compared below
+        embeddings[label] = embed_batched(tokenizer, model, snippets, batch_size, max_tokens)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            embed_batched(tokenizer, model, snippets, batch_size, max_tokens)
+            timings.append(time.perf_counter() - start)
+        report[f'{label}_seconds'] = min(timings)
+    cosines = np.einsum('ij,ij->i', normalize_rows(embeddings['fp32']), normalize_rows(embeddings['int8']))
+    report['speedup'] = report['fp32_seconds'] / report['int8_seconds']
+    report['mean_cosine'] = float(cosines.mean()) if len(cosines) else 1.0
+    report['min_cosine'] = float(cosines.min()) if len(cosines) else 1.0
+    return report
@@ -0,0 +1,125 @@
+import ast
+import hashlib
+import textwrap
+from collections import namedtuple
+
+from config.settings import NORMALIZATION
+
+# Canonical form of one function: source with docstrings, comments and local names
+# normalized away, and the number of AST nodes in its body
+NormalizedFunction = namedtuple('NormalizedFunction', 'source body_nodes')
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _has_docstring(body):
+    return bool(body) and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+        and isinstance(body[0].value.value, str)
+
+
+def _strip_docstring(node):
+    if _has_docstring(node.body):
+        node.body = node.body[1:] or [ast.Pass()]
+
+
+def _walk(nodes):
+    return [node for root in nodes for node in ast.walk(root)]
+
+
+def _count_nodes(nodes):
+    return sum(1 for node in nodes if not isinstance(node, ast.expr_context))
+
+
+def body_nodes(definition):
+    """
+    Size of a definition's body in AST nodes, without its docstring, as normalize_function counts it.
+
+    Lets extraction record the size of every function without normalizing it.
+    """
+    body = definition.body[1:] if _has_docstring(definition.body) else definition.body
+    return _count_nodes(_walk(body)) if body else 1
+
+
+def normalize_function(code):
+    """
+    Canonicalize a function so copies that differ only in formatting, comments, docstrings or
+    local names come out identical.
+
+    Names the function binds (its own name, parameters, locals, nested definitions) become
+    v0, v1, ... in order of appearance. Globals (including names it declares ``global`` or
+    ``nonlocal``), builtins, attributes and keyword names keep their spelling, since they
+    change what the code does.
+
+    :param code: Source of one function, possibly indented.
+    :return: NormalizedFunction, or None when the code does not parse.
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(code))
+    except (SyntaxError, ValueError, RecursionError):
+        return None
+
+    # Walk the tree once; the list is reused for collecting and for renaming
+    _strip_docstring(tree)
+    if len(tree.body) == 1 and isinstance(tree.body[0], _DEFINITIONS):
+        definition = tree.body[0]
+        _strip_docstring(definition)
+        header = _walk(definition.decorator_list + getattr(definition, 'bases', []) + getattr(definition, 'keywords', []))
+        if isinstance(definition, ast.ClassDef):
+            body = _walk(definition.body)
+        else:
+            header += _walk([definition.args] + ([definition.returns] if definition.returns else []))
+            body = _walk(definition.body)
+        nodes = [definition] + header + body
+    else:
+        body = nodes = _walk(tree.body)
+    size = _count_nodes(body)
+
+    # Names the code binds itself (definitions, parameters, assignment targets), in walk order.
+    # Names declared global or nonlocal belong to an outer scope and keep their spelling.
+    declared = {name for node in nodes if isinstance(node, (ast.Global, ast.Nonlocal)) for name in node.names}
+    bound = {}
+    for node in nodes:
+        if isinstance(node, _DEFINITIONS):
+            if node is not nodes[0]:
+                _strip_docstring(node)
+            bound.setdefault(node.name)
+        elif isinstance(node, ast.arg):
+            bound.setdefault(node.arg)
+        elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            bound.setdefault(node.id)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.setdefault(node.name)
+    renamed = {name: f"v{number}" for number, name in enumerate(name for name in bound if name not in declared)}
+    for node in nodes:
+        if isinstance(node, _DEFINITIONS):
+            node.name = renamed.get(node.name, node.name)
+        elif isinstance(node, ast.arg):
+            node.arg = renamed.get(node.arg, node.arg)
+        elif isinstance(node, ast.Name):
+            node.id = renamed.get(node.id, node.id)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            node.name = renamed.get(node.name, node.name)
+
+    try:
+        source = ast.unparse(tree)
+    except RecursionError:
+        return None
+    return NormalizedFunction(source, size)
+
+
+def fingerprint(code):
+    """SHA-256 of the canonical form; equal for exact clones. None when the code does not parse."""
+    normalized = normalize_function(code)
+    if normalized is None:
+        return None
+    return hashlib.sha256(normalized.source.encode('utf-8')).hexdigest()
+
+
+def is_trivial(function, max_nodes=NORMALIZATION['trivial_max_nodes']):
+    """
+    Whether a function's body is too small to be worth embedding (pass, getters, setters).
+
+    :param function: NormalizedFunction, or the FunctionRecord extraction made for the
+        function, which counts its body the same way; None (unparsable) is never trivial.
+    """
+    return function is not None and function.body_nodes <= max_nodes
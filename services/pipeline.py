@@ -0,0 +1,265 @@
+import queue
+import threading
+
+import numpy as np
+
+from config.settings import EMBEDDING, NORMALIZATION, PIPELINE
+from services.embedding import embed_features, tokenize_batches
+from services.discovery import read_file
+from services.embedding_cache import cache_key, clone_key
+from services.extraction import extract_stream, read_sources
+from services.normalize import is_trivial, normalize_function
+from utils.metrics import metrics
+
+_DONE = object()
+
+
+class _Stop(Exception):
+    """Raised inside a stage when another stage failed or the consumer went away."""
+
+
+def _put(channel, item, stop):
+    while not stop.is_set():
+        try:
+            channel.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise _Stop()
+
+
+def _drain(channel, stop):
+    while True:
+        try:
+            item = channel.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Stop()
+            continue
+        if item is _DONE:
+            # Leave the marker for sibling workers of the same stage
+            channel.put(_DONE)
+            return
+        yield item
+
+
+def run_pipeline(source, stages, queue_size=PIPELINE['queue_size']):
+    """
+    Run iterator-transform stages concurrently, connected by bounded queues.
+
+    Every stage is a ``(transform, workers)`` pair where ``transform`` maps an iterator of
+    inputs to an iterator of outputs and runs in ``workers`` threads sharing one input queue.
+    Because queues are bounded, a slow stage makes the faster ones wait instead of piling
+    results up in memory. The first exception in any stage is re-raised to the consumer.
+
+    :param source: Iterable feeding the first stage.
+    :param stages: List of (transform, workers) pairs.
+    :param queue_size: Capacity of each queue between stages.
+    :return: Iterator over the outputs of the last stage.
+    """
+    stop = threading.Event()
+    errors = []
+    channels = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = []
+
+    def feed():
+        try:
+            for item in source:
+                _put(channels[0], item, stop)
+            _put(channels[0], _DONE, stop)
+        except _Stop:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads.append(threading.Thread(target=feed, name='pipeline-source', daemon=True))
+
+    for position, (transform, workers) in enumerate(stages):
+        inbox, outbox = channels[position], channels[position + 1]
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def work(transform=transform, inbox=inbox, outbox=outbox, remaining=remaining, lock=lock):
+            try:
+                for item in transform(_drain(inbox, stop)):
+                    _put(outbox, item, stop)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                # The last worker of a stage signals the next one
+                if last:
+                    _put(outbox, _DONE, stop)
+            except _Stop:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        for worker in range(workers):
+            threads.append(threading.Thread(target=work, name=f'pipeline-{transform.__name__}-{worker}', daemon=True))
+
+    for thread in threads:
+        thread.start()
+    try:
+        yield from _drain(channels[-1], stop)
+    except _Stop:
+        pass
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+
+def stream_embeddings(file_paths, tokenizer, model, model_name, cache=None,
+                      batch_size=EMBEDDING['batch_size'], max_tokens=EMBEDDING['max_tokens'],
+                      chunk_size=PIPELINE['chunk_size'], skip_trivial=NORMALIZATION['skip_trivial'],
+                      embed_fn=None):
+    """
+    Walk -> read -> parse -> tokenize -> embed, with every stage in its own threads.
+
+    File reads and tokenization overlap with the forward pass, which releases the GIL, and
+    long streams are parsed in services.extraction's process pool.
+    Reads go through services.discovery.read_file, so oversized files are skipped and
+    sources in other encodings arrive as UTF-8.
+    Only ``chunk_size`` function sources per queue slot are in flight, so memory does not
+    grow with the size of the repository.
+
+    Functions missing from the cache are normalized (services.normalize) before they reach
+    the model. Exact clones share one forward pass: a clone of a function embedded before
+    takes its vector from the cache, and a clone of one still in flight waits for it.
+
+    :param file_paths: Iterable of Python file paths, consumed lazily.
+    :param cache: EmbeddingCache consulted before, and filled after, the forward pass.
+    :param skip_trivial: Leave out functions whose bodies are too small to be worth embedding.
+    :param embed_fn: Callable that tokenizes and embeds a list of snippets itself, such as a
+        services.inference.ReplicaPool; every chunk of misses goes to it whole. By default
+        chunks are tokenized in one stage and run through ``model`` in the next.
+    :return: Iterator of (ids, vectors, keys) where ids are (file_path, FunctionRecord) pairs,
+        vectors is a float32 array with one row per id and keys are the cache keys
+        (services.embedding_cache.cache_key of the raw source) the vectors are stored under.
+    """
+    # Clone key -> (id, cache key) of clones waiting for an embedding already in the model
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+
+    def read(paths):
+        for path in paths:
+            try:
+                yield read_file(path)
+            except (OSError, ValueError) as e:
+                print(f"Error reading file {path}: {e}")
+
+    def parse(files):
+        # Parsed in a process pool once the stream is long enough; the GIL would serialize threads
+        for record, data in extract_stream(files):
+            path = record.path
+            if record.error:
+                print(f"Error parsing file {path}: {record.error}")
+                continue
+            for function, code in zip(record.defs, read_sources(record, data)):
+                # Decided from the record, so what gets indexed does not depend on what is cached
+                if skip_trivial and is_trivial(function):
+                    metrics.count('skipped.trivial')
+                    continue
+                yield (path, function), code
+
+    def chunk(functions):
+        pending = []
+        for function in functions:
+            pending.append(function)
+            if len(pending) == chunk_size:
+                yield from lookup(pending)
+                pending = []
+        if pending:
+            yield from lookup(pending)
+
+    def lookup(functions):
+        ids = [function_id for function_id, _ in functions]
+        codes = [code for _, code in functions]
+        keys = [cache_key(code, model_name) for code in codes]
+        cached = cache.get_many(keys) if cache is not None else {}
+        hits = [i for i, key in enumerate(keys) if key in cached]
+        if cache is not None:
+            metrics.count('cache.hits', len(hits))
+            metrics.count('cache.misses', len(keys) - len(hits))
+        if hits:
+            yield 'ready', [ids[i] for i in hits], np.stack([cached[keys[i]] for i in hits]), [keys[i] for i in hits]
+
+        # Normalizing costs a parse, so only functions headed for the model pay for it
+        shared_keys = {}
+        for i, key in enumerate(keys):
+            if key in cached:
+                continue
+            normalized = normalize_function(codes[i])
+            shared_keys[i] = key if normalized is None else clone_key(normalized, model_name)
+        shared = cache.get_many(set(shared_keys.values())) if cache is not None else {}
+
+        reused, todo, waiting = [], [], 0
+        with in_flight_lock:
+            for i, shared_key in shared_keys.items():
+                if shared_key in shared:
+                    reused.append(i)
+                elif shared_key in in_flight:
+                    in_flight[shared_key].append((ids[i], keys[i]))
+                    waiting += 1
+                else:
+                    in_flight[shared_key] = []
+                    todo.append(i)
+        metrics.count('clones.exact', len(reused) + waiting)
+        if reused:
+            vectors = np.stack([shared[shared_keys[i]] for i in reused])
+            # Under its own key too, so the next run finds it without normalizing
+            cache.put_many([keys[i] for i in reused], vectors)
+            yield 'ready', [ids[i] for i in reused], vectors, [keys[i] for i in reused]
+        if todo:
+            yield 'todo', [ids[i] for i in todo], [codes[i] for i in todo], [(keys[i], shared_keys[i]) for i in todo]
+
+    def tokenize(chunks):
+        for item in chunks:
+            if item[0] == 'ready':
+                yield item
+                continue
+            _, ids, codes, keys = item
+            for batch, features in tokenize_batches(tokenizer, codes, batch_size, max_tokens):
+                yield 'tokens', [ids[i] for i in batch], features, [keys[i] for i in batch]
+
+    def embed(batches):
+        for item in batches:
+            if item[0] == 'ready':
+                yield item
+                continue
+            kind, ids, payload, keys = item
+            vectors = embed_features(model, payload) if kind == 'tokens' else embed_fn(payload)
+            if cache is not None:
+                cache.put_many([key for key, _ in keys] + [shared_key for _, shared_key in keys],
+                               np.concatenate([vectors, vectors]))
+            with in_flight_lock:
+                waiters = [in_flight.pop(shared_key, []) for _, shared_key in keys]
+            keys = [key for key, _ in keys]
+            clone_ids, clone_keys, clone_rows = [], [], []
+            for row, clones in enumerate(waiters):
+                for clone_id, key in clones:
+                    clone_ids.append(clone_id)
+                    clone_keys.append(key)
+                    clone_rows.append(row)
+            if clone_ids:
+                if cache is not None:
+                    cache.put_many(clone_keys, vectors[clone_rows])
+                ids = ids + clone_ids
+                keys = keys + clone_keys
+                vectors = np.concatenate([vectors, vectors[clone_rows]])
+            yield 'ready', ids, vectors, keys
+
+    stages = [
+        (read, PIPELINE['read_workers']),
+        (parse, 1),
+        (chunk, 1),
+    ]
+    if embed_fn is None:
+        stages.append((tokenize, 1))
+    stages.append((embed, 1))
+    for _, ids, vectors, keys in run_pipeline(file_paths, stages):
+        yield ids, vectors, keys
@@ -0,0 +1,180 @@
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from services.extraction import module_name
+
+TOOL_NAME = 'rome'
+
+# sys.monitoring reserves 0-2 and 5 for debuggers, coverage.py, profilers and optimizers;
+# 3 and 4 are unassigned, and the reserved ids are only borrowed when both are taken.
+# COVERAGE_ID is never used, so coverage.py can measure the same test run.
+_TOOL_IDS = (3, 4, 2, 0, 5)
+
+
+def monitoring_available():
+    return sys.version_info >= (3, 12)
+
+
+def _claim_tool_id():
+    for tool_id in _TOOL_IDS:
+        try:
+            sys.monitoring.use_tool_id(tool_id, TOOL_NAME)
+        except ValueError:
+            continue  # In use by another tool
+        return tool_id
+    raise RuntimeError("Every sys.monitoring tool id is in use; cannot collect runtime coverage")
+
+
+class RuntimeCoverage:
+    """
+    Records which project functions actually run, using ``sys.monitoring`` (Python 3.12+).
+
+    By default only PY_START is watched and every callback returns DISABLE, so each code
+    object costs one callback in total and then runs at full speed. With ``timing`` the
+    callbacks stay enabled to count calls and accumulate wall time per function, which costs
+    a callback per call, return, yield and resume.
+
+    Functions outside ``project_dir`` or inside ``exclude_dirs`` are disabled on first sight.
+    """
+
+    def __init__(self, project_dir, exclude_dirs=(), timing=False):
+        if not monitoring_available():
+            raise RuntimeError("Runtime coverage needs Python 3.12 or newer (sys.monitoring)")
+        self.project_dir = os.path.abspath(project_dir)
+        self.excluded = tuple(os.path.join(os.path.abspath(path), '') for path in exclude_dirs)
+        self.timing = timing
+        self.tool_id = None
+        self.calls = Counter()
+        self.elapsed_ns = defaultdict(int)
+        self._wanted = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _is_wanted(self, code):
+        wanted = self._wanted.get(code)
+        if wanted is None:
+            path = os.path.abspath(code.co_filename)
+            # Module and class bodies run without new locals; only functions are reported
+            wanted = self._wanted[code] = (bool(code.co_flags & inspect.CO_NEWLOCALS)
+                                           and path.startswith(os.path.join(self.project_dir, ''))
+                                           and not path.startswith(self.excluded))
+        return wanted
+
+    def _active(self):
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = {}
+        return active
+
+    def start(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        self.tool_id = _claim_tool_id()
+        if not self.timing:
+            monitoring.register_callback(self.tool_id, events.PY_START, self._on_first_start)
+            monitoring.set_events(self.tool_id, events.PY_START)
+            return
+        monitoring.register_callback(self.tool_id, events.PY_START, self._on_start)
+        monitoring.register_callback(self.tool_id, events.PY_RESUME, self._on_resume)
+        monitoring.register_callback(self.tool_id, events.PY_RETURN, self._on_exit)
+        monitoring.register_callback(self.tool_id, events.PY_YIELD, self._on_exit)
+        monitoring.register_callback(self.tool_id, events.PY_UNWIND, self._on_exit)
+        monitoring.set_events(self.tool_id, events.PY_START | events.PY_RESUME | events.PY_RETURN
+                              | events.PY_YIELD | events.PY_UNWIND)
+
+    def stop(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.set_events(self.tool_id, events.NO_EVENTS)
+        for event in (events.PY_START, events.PY_RESUME, events.PY_RETURN, events.PY_YIELD, events.PY_UNWIND):
+            monitoring.register_callback(self.tool_id, event, None)
+        monitoring.free_tool_id(self.tool_id)
+        self.tool_id = None
+        # Re-arm the locations disabled by this run for the next collector
+        monitoring.restart_events()
+
+    def _on_first_start(self, code, instruction_offset):
+        if self._is_wanted(code):
+            self.calls[code] = 1
+        return sys.monitoring.DISABLE
+
+    def _on_start(self, code, instruction_offset):
+        if not self._is_wanted(code):
+            return sys.monitoring.DISABLE
+        with self._lock:
+            self.calls[code] += 1
+        self._enter(code)
+
+    def _on_resume(self, code, instruction_offset):
+        if not self._is_wanted(code):
+            return sys.monitoring.DISABLE
+        self._enter(code)
+
+    def _enter(self, code):
+        active = self._active()
+        depth, started = active.get(code, (0, 0))
+        # Recursive calls are timed once, by the outermost activation
+        active[code] = (depth + 1, time.perf_counter_ns() if depth == 0 else started)
+
+    def _on_exit(self, code, instruction_offset, value):
+        if not self._is_wanted(code):
+            # PY_UNWIND cannot be disabled per location; the others can
+            return None if isinstance(value, BaseException) else sys.monitoring.DISABLE
+        active = self._active()
+        depth, started = active.get(code, (0, 0))
+        if depth == 0:
+            # Entered before monitoring started
+            return None
+        if depth == 1:
+            del active[code]
+            with self._lock:
+                self.elapsed_ns[code] += time.perf_counter_ns() - started
+        else:
+            active[code] = (depth - 1, started)
+
+    def qualified_name(self, code):
+        return f"{module_name(code.co_filename, self.project_dir)}.{code.co_qualname}"
+
+    def results(self):
+        """Map ``module.qualname`` to (calls, seconds); without timing calls is 1 and seconds None."""
+        results = {}
+        for code, calls in self.calls.items():
+            name = self.qualified_name(code)
+            previous_calls, previous_seconds = results.get(name, (0, 0.0 if self.timing else None))
+            seconds = previous_seconds + self.elapsed_ns[code] / 1e9 if self.timing else None
+            results[name] = (previous_calls + calls, seconds)
+        return results
+
+
+def run_tests(test_dir, project_dir, runner='unittest'):
+    """
+    Run a test directory in this process so a collector can watch it.
+
+    :param runner: 'unittest' discovery or 'pytest'.
+    :return: True when every test passed.
+    """
+    project_dir = os.path.abspath(project_dir)
+    if project_dir not in sys.path:
+        sys.path.insert(0, project_dir)
+    if runner == 'pytest':
+        import pytest
+
+        return pytest.main(['-q', '-p', 'no:cacheprovider', test_dir]) == 0
+    if runner != 'unittest':
+        raise ValueError(f"Unknown test runner {runner!r}, expected unittest or pytest")
+
+    import unittest
+
+    suite = unittest.defaultTestLoader.discover(test_dir, top_level_dir=test_dir)
+    return unittest.TextTestRunner(verbosity=1).run(suite).wasSuccessful()
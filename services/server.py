@@ -0,0 +1,118 @@
+import functools
+import json
+import os
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from config.settings import SERVER
+from services.batcher import MicroBatcher
+from utils.logger import get_logger
+
+log = get_logger()
+
+
+class EmbeddingService:
+    """
+    Keeps one FaissEmbedder (model and index) resident and funnels every request's
+    snippets through a shared MicroBatcher, so concurrent callers share forward passes.
+    """
+
+    def __init__(self, embedder, max_batch_size=SERVER['max_batch_size'], max_wait_ms=SERVER['max_wait_ms']):
+        self.embedder = embedder
+        # Request snippets are looked up in the embedding cache but never added to it
+        self.batcher = MicroBatcher(functools.partial(embedder.calculate_embeddings, store=False),
+                                    max_batch_size, max_wait_ms)
+
+    def embed(self, snippets):
+        """Embed snippets through the shared batcher."""
+        return np.array(self.batcher.map(snippets), dtype='float32').reshape(len(snippets), -1)
+
+    def query(self, snippets, top_k=5):
+        """Return the top_k most similar indexed functions for each snippet."""
+        if self.embedder.index is None or not snippets:
+            return [[] for _ in snippets]
+        return self.embedder.search_functions(self.embed(snippets), top_k)
+
+    def status(self):
+        index = self.embedder.index
+        return {
+            'model_name': self.embedder.model_name,
+            'index_type': self.embedder.index_type,
+            'indexed_functions': 0 if index is None else int(index.ntotal),
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP: GET /status, POST /embed and POST /query."""
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            snippets = payload.get('snippets', [])
+            if self.path == '/embed':
+                self.send_json(200, {'embeddings': self.server.service.embed(snippets).tolist()})
+            elif self.path == '/query':
+                results = self.server.service.query(snippets, int(payload.get('top_k', 5)))
+                self.send_json(200, {'results': results})
+            else:
+                self.send_json(404, {'error': f"Unknown path {self.path}"})
+        except Exception as e:
+            log.error(f"Request {self.path} failed {type(e)}: {e}")
+            self.send_json(500, {'error': str(e)})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket peers have no host address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def create_server(service, host=SERVER['host'], port=SERVER['port'], socket_path=SERVER['socket']):
+    """Bind a threaded server to a Unix socket when socket_path is set, otherwise to host:port."""
+    if socket_path:
+        server = ThreadingUnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service
+    return server
+
+
+def serve(service, host=SERVER['host'], port=SERVER['port'], socket_path=SERVER['socket']):
+    """Serve embed/query requests until interrupted."""
+    server = create_server(service, host, port, socket_path)
+    log.info(f"Serving on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
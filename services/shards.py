@@ -0,0 +1,129 @@
+import hashlib
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from config.settings import SHARDS
+from services.extraction import iter_python_files
+from services.function_store import FunctionStore
+from services.similarity import top_k_cosine
+from utils.atomic import replace_directory, staging_directory
+
+SHARD_FILE = 'shard.json'
+
+
+def repo_fingerprint(file_paths):
+    """Hash of every file's path, mtime and size; changes whenever a file is added, removed or edited."""
+    digest = hashlib.sha256()
+    for path in sorted(file_paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ShardedIndex:
+    """
+    One FunctionStore shard per repository, under a common directory.
+
+    Every shard records the repository it came from, the model that embedded it and a
+    fingerprint of the repository's files, so shards are rebuilt one repository at a time
+    and only when that repository changed. Queries fan out to the loaded shards in a thread
+    pool (the matrix multiplies release the GIL) and the per-shard top-k lists are merged
+    with a heap.
+    """
+
+    def __init__(self, directory=SHARDS['path'], workers=SHARDS['workers']):
+        self.directory = directory
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = {}
+
+    def shard_path(self, repo_path):
+        repo_path = os.path.abspath(repo_path)
+        repo_id = hashlib.sha256(repo_path.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, f"{os.path.basename(repo_path) or 'root'}-{repo_id}")
+
+    def shard_info(self, repo_path):
+        try:
+            with open(os.path.join(self.shard_path(repo_path), SHARD_FILE), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, repo_path, model_name, fingerprint=None):
+        """Whether the saved shard of a repository matches its current files and the model."""
+        info = self.shard_info(repo_path)
+        if info is None:
+            return False
+        if fingerprint is None:
+            fingerprint = repo_fingerprint(iter_python_files(repo_path))
+        return info['model_name'] == model_name and info['fingerprint'] == fingerprint
+
+    def save_shard(self, repo_path, store, model_name, fingerprint):
+        """Write a repository's store next to the others, atomically replacing its previous shard."""
+        path = self.shard_path(repo_path)
+        staging = staging_directory(path)
+        store.save(staging)
+        with open(os.path.join(staging, SHARD_FILE), 'w', encoding='utf-8') as file:
+            json.dump({'repo_path': os.path.abspath(repo_path), 'model_name': model_name,
+                       'fingerprint': fingerprint, 'functions': len(store)}, file)
+        replace_directory(staging, path)
+
+    def repos(self):
+        """Repository paths of every shard saved under the directory."""
+        repos = []
+        if not os.path.isdir(self.directory):
+            return repos
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            # Staging and versioned directories behind the shard links are hidden
+            if entry.name.startswith('.'):
+                continue
+            info_path = os.path.join(entry.path, SHARD_FILE)
+            if entry.is_dir() and os.path.exists(info_path):
+                with open(info_path, 'r', encoding='utf-8') as file:
+                    repos.append(json.load(file)['repo_path'])
+        return repos
+
+    def load(self, repos=None, mmap=True):
+        """Load the shards of the given repositories, or all of them; arrays are memory-mapped."""
+        wanted = self.repos() if repos is None else [os.path.abspath(repo) for repo in repos]
+        for repo_path in wanted:
+            if repo_path not in self.shards and self.shard_info(repo_path) is not None:
+                self.shards[repo_path] = FunctionStore.load(self.shard_path(repo_path), mmap=mmap)
+        return self
+
+    def __len__(self):
+        return sum(len(store) for store in self.shards.values())
+
+    def search(self, queries, k, repos=None):
+        """
+        Top-k across shards for every query.
+
+        :param queries: (q, dim) query vectors.
+        :param k: Results per query.
+        :param repos: Only search the shards of these repositories; others are skipped entirely.
+        :return: One list per query of (score, repo_path, row), best first.
+        """
+        selected = list(self.shards) if repos is None else [os.path.abspath(repo) for repo in repos]
+        selected = [repo for repo in selected if repo in self.shards and self.shards[repo].vectors is not None]
+
+        def search_shard(repo_path):
+            return repo_path, top_k_cosine(queries, self.shards[repo_path].vectors, k)
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(selected)))) as pool:
+            per_shard = list(pool.map(search_shard, selected))
+
+        results = []
+        for query in range(len(queries)):
+            ranked = [
+                [(float(score), repo_path, int(row)) for score, row in zip(scores[query], indices[query])]
+                for repo_path, (scores, indices) in per_shard
+            ]
+            # Each shard's list is already sorted best first
+            merged = heapq.merge(*ranked, key=lambda hit: -hit[0])
+            results.append(list(islice(merged, k)))
+        return results
@@ -0,0 +1,55 @@
+import numpy as np
+
+from utils.metrics import metrics
+
+
+def normalize_rows(vectors, dtype='float32'):
+    """L2-normalize each row and store the result contiguously in the given dtype."""
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return np.ascontiguousarray(vectors / norms, dtype=dtype)
+
+
+@metrics.timer('search')
+def top_k_cosine(queries, corpus, k, chunk_rows=65536):
+    """
+    Top-k cosine search of many queries against a pre-normalized corpus matrix.
+
+    The corpus is scored in row chunks with one matrix multiply each, and only the
+    best k of every chunk survive, so memory stays at queries x chunk_rows.
+
+    :param queries: (q, dim) query vectors; normalized here.
+    :param corpus: (n, dim) row-normalized float32 or float16 matrix.
+    :param k: Number of results per query.
+    :param chunk_rows: Corpus rows scored per matrix multiply.
+    :return: (scores, indices), each (q, min(k, n)), best first.
+    """
+    queries = normalize_rows(queries)
+    n = len(corpus)
+    k = min(k, n)
+    if k == 0:
+        return np.empty((len(queries), 0), dtype='float32'), np.empty((len(queries), 0), dtype='int64')
+
+    best_scores, best_indices = None, None
+    for start in range(0, n, chunk_rows):
+        chunk = corpus[start:start + chunk_rows]
+        scores = queries @ chunk.astype('float32', copy=False).T
+        kk = min(k, scores.shape[1])
+        part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        part += start
+        if best_scores is None:
+            best_scores, best_indices = part_scores, part
+            continue
+        merged_scores = np.concatenate([best_scores, part_scores], axis=1)
+        merged_indices = np.concatenate([best_indices, part], axis=1)
+        if merged_scores.shape[1] <= k:
+            best_scores, best_indices = merged_scores, merged_indices
+            continue
+        keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        best_indices = np.take_along_axis(merged_indices, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_indices, order, axis=1)
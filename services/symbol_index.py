@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+
+from config.settings import COVERAGE
+from services.extraction import extract_files, module_name
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS files ('
+    'path TEXT PRIMARY KEY, kind TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, hash TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS definitions ('
+    'path TEXT NOT NULL, module TEXT NOT NULL, qualname TEXT NOT NULL, name TEXT NOT NULL, lineno INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS calls (path TEXT NOT NULL, name TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS definitions_name ON definitions (name)',
+    'CREATE INDEX IF NOT EXISTS definitions_path ON definitions (path)',
+    'CREATE INDEX IF NOT EXISTS calls_name ON calls (name)',
+    'CREATE INDEX IF NOT EXISTS calls_path ON calls (path)',
+    'CREATE INDEX IF NOT EXISTS files_kind ON files (kind)',
+)
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class SymbolIndex:
+    """
+    Persisted per-file definitions and call sites of one project.
+
+    Every file is recorded with its mtime, size and content hash. ``refresh`` only
+    reparses files whose content changed since the last run, and drops files that
+    disappeared. Definitions and calls are indexed by bare name, so coverage is a
+    join instead of a scan over every qualified name.
+    """
+
+    def __init__(self, project_dir, db_path=':memory:'):
+        self.project_dir = project_dir
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    @classmethod
+    def for_project(cls, project_dir):
+        """Open the project's index under the configured directory, or an in-memory one when disabled."""
+        if not COVERAGE['index_path']:
+            return cls(project_dir)
+        project_id = hashlib.sha256(os.path.abspath(project_dir).encode('utf-8')).hexdigest()[:16]
+        return cls(project_dir, os.path.join(COVERAGE['index_path'], f'{project_id}.sqlite'))
+
+    def refresh(self, file_paths, kind):
+        """
+        Bring the index up to date for one kind of file ('source' or 'test').
+
+        :param file_paths: Every current file of this kind.
+        :param kind: Label separating project code from test code.
+        :return: FileRecords of the files that were reparsed.
+        """
+        known = {path: (mtime_ns, size, digest) for path, mtime_ns, size, digest in
+                 self.db.execute('SELECT path, mtime_ns, size, hash FROM files WHERE kind = ?', (kind,))}
+        seen = set()
+        changed = {}
+        for path in file_paths:
+            seen.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = known.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                with open(path, 'rb') as file:
+                    digest = file_hash(file.read())
+            except OSError:
+                continue
+            if entry is not None and entry[2] == digest:
+                # Touched but not edited
+                self.db.execute('UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?',
+                                (stat.st_mtime_ns, stat.st_size, path))
+                continue
+            changed[path] = digest
+
+        for path in set(known) - seen:
+            self._forget(path)
+
+        records = extract_files(changed)
+        for record in records:
+            self._forget(record.path)
+            if record.error:
+                # Not recorded, so the file is retried (and reported) on the next run
+                continue
+            module = module_name(record.path, self.project_dir)
+            self.db.execute('INSERT INTO files (path, kind, mtime_ns, size, hash) VALUES (?, ?, ?, ?, ?)',
+                            (record.path, kind, record.mtime_ns, record.size, changed[record.path]))
+            self.db.executemany('INSERT INTO definitions (path, module, qualname, name, lineno) VALUES (?, ?, ?, ?, ?)',
+                                [(record.path, module, d.qualname, d.name, d.lineno) for d in record.defs])
+            self.db.executemany('INSERT INTO calls (path, name) VALUES (?, ?)',
+                                [(record.path, name) for name in record.calls])
+        self.db.commit()
+        return records
+
+    def _forget(self, path):
+        for table in ('files', 'definitions', 'calls'):
+            self.db.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+
+    def definitions(self, kind='source', name=None):
+        """
+        Qualified names ``module.qualname`` of the functions defined in files of one kind.
+
+        Functions local to another function are left out, since nothing outside can call them.
+        With ``name``, only definitions with that bare name are returned (an indexed lookup).
+        """
+        query = ("SELECT DISTINCT d.module || '.' || d.qualname FROM definitions d JOIN files f ON f.path = d.path "
+                 "WHERE f.kind = ? AND d.qualname NOT LIKE '%<locals>%'")
+        params = [kind]
+        if name is not None:
+            query += ' AND d.name = ?'
+            params.append(name)
+        return [row[0] for row in self.db.execute(query, params)]
+
+    def defined_names(self, kind='test', file_prefix=''):
+        """Bare names defined in files of one kind whose file name starts with file_prefix."""
+        rows = self.db.execute('SELECT DISTINCT d.path, d.name FROM definitions d JOIN files f ON f.path = d.path '
+                               'WHERE f.kind = ?', (kind,))
+        return {name for path, name in rows if os.path.basename(path).startswith(file_prefix)}
+
+    def call_names(self, kind='test'):
+        """Bare names called anywhere in files of one kind."""
+        return [row[0] for row in self.db.execute(
+            'SELECT DISTINCT c.name FROM calls c JOIN files f ON f.path = c.path WHERE f.kind = ?', (kind,))]
+
+    def covered_definitions(self, kind='source', caller_kind='test'):
+        """Qualified names of definitions whose bare name is called from files of caller_kind."""
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT d.module || '.' || d.qualname FROM definitions d JOIN files f ON f.path = d.path "
+            "WHERE f.kind = ? AND d.qualname NOT LIKE '%<locals>%' AND EXISTS ("
+            "SELECT 1 FROM calls c JOIN files cf ON cf.path = c.path WHERE c.name = d.name AND cf.kind = ?)",
+            (kind, caller_kind))]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,152 @@
+import json
+import os
+
+import faiss
+import numpy as np
+
+from config.settings import VECTOR_INDEX
+from utils.logger import get_logger
+
+log = get_logger()
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+# Index types that must be trained on a sample of the data before vectors are added
+TRAINED_INDEX_TYPES = ('ivf_flat', 'ivf_pq')
+
+INDEX_FILE = 'index.faiss'
+METADATA_FILE = 'metadata.json'
+
+
+def normalized(vectors):
+    """Return an L2-normalized float32 copy so inner product equals cosine similarity."""
+    vectors = np.array(vectors, dtype='float32', copy=True, ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_factory_string(index_type, dim, n_train):
+    """
+    Translate an index type into a faiss factory string sized for the training data.
+
+    Falls back to a flat index when there are too few vectors to train the requested one.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'hnsw':
+        return f"HNSW{VECTOR_INDEX['hnsw_m']}"
+
+    # faiss wants roughly 39 training points per IVF list
+    nlist = min(VECTOR_INDEX['nlist'], n_train // 39)
+    if nlist < 1:
+        log.warning(f"Only {n_train} vectors, too few to train {index_type}; using a flat index")
+        return 'Flat'
+    if index_type == 'ivf_flat':
+        return f"IVF{nlist},Flat"
+
+    nbits = VECTOR_INDEX['pq_nbits']
+    if n_train < 2 ** nbits or dim % VECTOR_INDEX['pq_m']:
+        log.warning(f"Cannot train PQ{VECTOR_INDEX['pq_m']}x{nbits} on {n_train} vectors of dim {dim}; using IVF-Flat")
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},PQ{VECTOR_INDEX['pq_m']}x{nbits}"
+
+
+def build_index(index_type, dim, train_vectors, id_map=False):
+    """
+    Create a cosine (normalized inner product) index and train it on a sample when required.
+
+    :param index_type: One of INDEX_TYPES.
+    :param dim: Vector dimension.
+    :param train_vectors: Normalized float32 vectors to draw the training sample from.
+    :param id_map: Wrap the index in an IndexIDMap2, so vectors are added and removed by
+        caller-chosen 64-bit ids. Not supported for hnsw, which cannot remove vectors.
+    :return: Trained, empty faiss index.
+    """
+    index = faiss.index_factory(dim, index_factory_string(index_type, dim, len(train_vectors)), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        sample_size = min(len(train_vectors), VECTOR_INDEX['train_sample'])
+        rng = np.random.default_rng(0)
+        sample = train_vectors[rng.choice(len(train_vectors), sample_size, replace=False)]
+        index.train(sample)
+    apply_search_params(index)
+    if id_map:
+        if index_type == 'hnsw':
+            raise ValueError("hnsw indexes cannot remove vectors; use flat, ivf_flat or ivf_pq for in-place updates")
+        index = faiss.IndexIDMap2(index)
+    return index
+
+
+def index_kind(index):
+    """The INDEX_TYPES name of a built index, looking through an id map."""
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        inner = faiss.downcast_index(inner.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+
+def apply_search_params(index):
+    """Set the query-time accuracy knobs (nprobe, efSearch) from config.settings."""
+    params = faiss.ParameterSpace()
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        # The id map adds nothing to tune; set the parameters on the wrapped index
+        index = inner = faiss.downcast_index(inner.index)
+    if isinstance(inner, faiss.IndexIVF):
+        params.set_index_parameter(index, 'nprobe', VECTOR_INDEX['nprobe'])
+    elif isinstance(inner, faiss.IndexHNSW):
+        params.set_index_parameter(index, 'efSearch', VECTOR_INDEX['ef_search'])
+
+
+def save_index(index, metadata, directory):
+    """Persist the index and its ID -> metadata mapping side by side."""
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(index, os.path.join(directory, INDEX_FILE))
+    with open(os.path.join(directory, METADATA_FILE), 'w', encoding='utf-8') as file:
+        json.dump(metadata, file)
+
+
+def load_index(directory, mmap=True):
+    """
+    Load an index saved with save_index.
+
+    With mmap the vectors are paged in from disk on demand instead of read up front,
+    so a query process can start without copying the whole index into memory.
+    A memory-mapped index is read-only; load with mmap=False to add or remove vectors.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE), flags)
+    apply_search_params(index)
+    with open(os.path.join(directory, METADATA_FILE), 'r', encoding='utf-8') as file:
+        metadata = json.load(file)
+    return index, metadata
+
+
+def recall_at_k(index, vectors, k=10, n_queries=1000):
+    """
+    Measure recall@k of an index against exact search over the same normalized vectors.
+
+    :param index: Index to evaluate, already populated with ``vectors``.
+    :param vectors: Normalized float32 vectors stored in the index, in ID order.
+    :param k: Number of neighbours compared per query.
+    :param n_queries: Number of stored vectors used as queries.
+    :return: Mean fraction of the exact top-k found by the index.
+    """
+    if len(vectors) == 0:
+        return 1.0
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / (len(queries) * k)
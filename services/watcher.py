@@ -0,0 +1,194 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from config.settings import WATCH
+from services.discovery import is_pruned, walk
+from services.extraction import iter_python_files
+from utils.logger import get_logger
+
+log = get_logger()
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """
+    Reports changed paths under some directories using Linux inotify through ctypes.
+
+    Every directory gets its own watch; directories created later are watched as they
+    appear. Reported paths are ``.py`` files and, for created, deleted or moved
+    directories and after a queue overflow, directories the caller should rescan.
+    """
+
+    def __init__(self, directories, debounce_ms=WATCH['debounce_ms']):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.libc = libc
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.debounce = debounce_ms / 1000
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}
+        for directory in self.directories:
+            self._watch_tree(directory)
+
+    def _watch_tree(self, directory):
+        # Pruned like discovery, so node_modules or a virtualenv does not use up the watch limit
+        for root, _ in walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                log.warning(f"Cannot watch {root}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self.paths[wd] = root
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    log.warning("inotify queue overflowed; rescanning everything")
+                    changed.update(self.directories)
+                    continue
+                if mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+                    continue
+                parent = self.paths.get(wd)
+                if parent is None:
+                    continue
+                path = os.path.join(parent, name) if name else parent
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # walk does not judge the directory it starts from
+                        if is_pruned(path, self.directories):
+                            continue
+                        # Files may have landed before the new watch existed
+                        self._watch_tree(path)
+                    changed.add(path)
+                elif path.endswith('.py'):
+                    changed.add(path)
+
+    def wait(self, timeout):
+        """Block up to timeout seconds for changes; return the set of changed paths (may be empty)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = self._read_events()
+        # Let bursts (save = write + rename + chmod, git checkout) settle into one batch
+        deadline = time.monotonic() + self.debounce
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return changed
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable:
+                changed |= self._read_events()
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable fallback: compares the mtime and size of every ``.py`` file each interval."""
+
+    def __init__(self, directories, interval=WATCH['poll_interval']):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.interval = interval
+        self.state = self._scan()
+
+    def _scan(self):
+        state = {}
+        for directory in self.directories:
+            for path in iter_python_files(directory):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def wait(self, timeout):
+        """Scan every interval until something changed or timeout passed; return the changed paths."""
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+            state = self._scan()
+            changed = {path for path in state.keys() | self.state.keys() if state.get(path) != self.state.get(path)}
+            self.state = state
+            if changed or time.monotonic() >= deadline:
+                return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directories, backend=WATCH['backend']):
+    """Inotify on Linux unless polling is configured or inotify cannot start; polling otherwise."""
+    if backend not in ('auto', 'inotify', 'polling'):
+        raise ValueError(f"Unknown watch backend {backend!r}, expected auto, inotify or polling")
+    if backend != 'polling' and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            if backend == 'inotify':
+                raise
+            log.warning(f"inotify unavailable ({e}); polling for changes instead")
+    return PollingWatcher(directories)
+
+
+def watch_index(embedder, directories, snapshot_dir=None, snapshot_interval=WATCH['snapshot_interval'],
+                stop=None, watcher=None):
+    """
+    Keep an updatable FaissEmbedder in step with the files under directories until stop is set.
+
+    Changed files are synced into the index as they are reported. When snapshot_dir is
+    given, the index is saved there at most every snapshot_interval seconds while it has
+    unsaved changes, and once more on the way out.
+
+    :param embedder: FaissEmbedder built or loaded with updatable=True.
+    :param stop: threading.Event ending the loop; runs until interrupted when None.
+    :param watcher: Watcher to read changes from; defaults to create_watcher(directories).
+    """
+    watcher = watcher or create_watcher(directories)
+    last_snapshot = time.monotonic()
+    dirty = False
+    try:
+        while stop is None or not stop.is_set():
+            changed = watcher.wait(timeout=1.0)
+            if changed:
+                removed, added = embedder.sync_paths(changed, roots=directories)
+                log.info(f"Synced {len(changed)} changed paths: {removed} functions removed, {added} added")
+                dirty = True
+            if snapshot_dir and dirty and time.monotonic() - last_snapshot >= snapshot_interval:
+                embedder.snapshot(snapshot_dir)
+                last_snapshot = time.monotonic()
+                dirty = False
+    finally:
+        watcher.close()
+        if snapshot_dir and dirty:
+            embedder.snapshot(snapshot_dir)
@@ -1,74 +1,415 @@
 import os
-import ast
+import tempfile
+import threading
+
 import faiss
-import torch
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-from sklearn.metrics.pairwise import cosine_similarity
+from transformers import AutoTokenizer
+
+from config.settings import EMBEDDING, INFERENCE, NORMALIZATION, VECTOR_INDEX
+from services.discovery import is_pruned
+from services.embedding_cache import EmbeddingCache, cached_embed
+from services.extraction import extract_files, iter_python_files, read_sources
+from services.function_store import FunctionStore
+from services.inference import (close_embedding_function, embedding_function, load_model, model_id,
+                                pipeline_embed_function)
+from services.normalize import is_trivial
+from services.pipeline import stream_embeddings
+from services.vector_index import (TRAINED_INDEX_TYPES, build_index, index_kind, load_index, normalized, recall_at_k,
+                                  save_index)
+from utils.atomic import replace_directory, staging_directory
+from utils.metrics import metrics
 
 class FaissEmbedder:
-    def __init__(self, model_name='microsoft/codebert-base', embedding_dim=768):
+    def __init__(self, model_name=EMBEDDING['model_name'], embedding_dim=None,
+                 batch_size=EMBEDDING['batch_size'], max_tokens=EMBEDDING['max_tokens'], cache=None,
+                 index_type=VECTOR_INDEX['type'], keep_embeddings=False, quantized=INFERENCE['quantize'],
+                 updatable=False):
+        if updatable and index_type == 'hnsw':
+            raise ValueError("hnsw indexes cannot remove vectors; use flat, ivf_flat or ivf_pq for in-place updates")
         # Load the tokenizer and model for embeddings
+        self.model_name = model_name
+        # int8 and fp32 embeddings are cached under different keys
+        self.model_id = model_id(model_name, quantized)
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        # Initialize FAISS index
-        self.index = faiss.IndexFlatL2(embedding_dim)
-        self.function_embeddings = []  # To store embedding vectors
-        self.function_names = []  # To store function names for easy reference
+        self.model = load_model(model_name, quantized)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.embed_fn = embedding_function(self.tokenizer, self.model, batch_size, max_tokens)
+        # Persistent cache so unchanged functions are not re-embedded on the next ingest
+        self.cache = cache if cache is not None else EmbeddingCache.from_settings(self.model.config.hidden_size)
+        # IVF index types train on the data, so their index is built once ingestion is done
+        self.embedding_dim = embedding_dim or self.model.config.hidden_size
+        self.index_type = index_type
+        self.index = None
+        self.pending = None  # temporary file of normalized vectors waiting for the index to be trained
+        self.pending_ids = []
+        self.pending_count = 0
+        self.train_sample = None
+        self.sample_rng = None  # one random stream per pending session, for the reservoir sample
+        # Directory of a memory-mapped (read-only) index, reloaded into memory before changes
+        self.mapped_from = None
+        # An updatable index is ID-mapped so functions can be replaced or removed in place
+        self.updatable = updatable
+        # Live row ids per file, for removing a file's functions when it changes
+        self.file_rows = {}
+        # Serializes index updates against searches and snapshots
+        self.lock = threading.RLock()
+        # Embeddings already live in the index; keep a second copy only for recall reports
+        self.keep_embeddings = keep_embeddings
+        self.function_embeddings = []
+        # Row i of the store describes the vector with FAISS id i
+        self.functions = FunctionStore()
     
-    def ingest_project(self, directory):
-        """Recursively walk through directory to find Python files and extract function embeddings."""
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if file.endswith('.py'):
-                    file_path = os.path.join(root, file)
-                    self.extract_functions_and_embed(file_path)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the inference replica processes, if any."""
+        close_embedding_function(self.embed_fn)
+
+    def ingest_project(self, directory, with_keys=False):
+        """
+        Stream Python files under directory through the ingestion pipeline into the index.
+
+        Trained index types are built on the first search or save (or by flush_index) after
+        every project has been ingested, so all of them count towards the training sample.
+
+        :param with_keys: Also return what was added, as ((file_path, FunctionRecord), cache key)
+            pairs, e.g. for CorpusStore.save_functions.
+        """
+        stream = stream_embeddings(iter_python_files(directory), self.tokenizer, self.model, self.model_id,
+                                   cache=self.cache, batch_size=self.batch_size, max_tokens=self.max_tokens,
+                                   embed_fn=pipeline_embed_function(self.embed_fn))
+        added = [] if with_keys else None
+        for ids, vectors, keys in stream:
+            self.add_functions_to_index(vectors, ids)
+            if with_keys:
+                added.extend(zip(ids, keys))
+        return added
+
+    def extract_functions(self, record):
+        """Return (name, code) pairs for every function definition in a parsed file record."""
+        if record.error:
+            print(f"Error parsing file {record.path}: {record.error}")
+            return []
+        return [(function.name, code) for function, code in zip(record.defs, read_sources(record))]
 
     def extract_functions_and_embed(self, file_path):
         """Extract function definitions from Python file and add embeddings to FAISS index."""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            code = file.read()
-            try:
-                parsed = ast.parse(code)
-                for node in ast.walk(parsed):
-                    if isinstance(node, ast.FunctionDef):
-                        function_name = node.name
-                        function_code = ast.unparse(node)
-                        embedding = self.calculate_embedding(function_code)
-                        self.add_to_index(embedding, function_name)
-            except Exception as e:
-                print(f"Error parsing file {file_path}: {e}")
+        self.embed_records(extract_files([file_path]))
+
+    def embed_records(self, records):
+        """Embed every function of the given file records and add them to the index in one call."""
+        functions, snippets = [], []
+        for record in records:
+            if record.error:
+                print(f"Error parsing file {record.path}: {record.error}")
+                continue
+            for function, code in zip(record.defs, read_sources(record)):
+                # Trivial bodies are left out, as in ingest_project
+                if NORMALIZATION['skip_trivial'] and is_trivial(function):
+                    continue
+                functions.append((record.path, function))
+                snippets.append(code)
+        self.add_functions_to_index(self.calculate_embeddings(snippets), functions)
+
+    def calculate_embeddings(self, code_snippets, store=True):
+        """
+        Generate CodeBERT embeddings for many snippets, embedding only those missing from the cache.
+
+        With store False (queries) the cache is only looked up, never written.
+        """
+        return cached_embed(self.cache, code_snippets, self._embed_uncached, self.model_id, store=store)
+
+    def _embed_uncached(self, code_snippets):
+        return self.embed_fn(code_snippets)
 
     def calculate_embedding(self, code_snippet):
         """Generate a CodeBERT embedding for a given code snippet."""
-        inputs = self.tokenizer(code_snippet, return_tensors='pt', truncation=True, padding=True)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1).numpy().astype('float32')
+        return self.calculate_embeddings([code_snippet])[0]
     
     def add_to_index(self, embedding, function_name):
         """Add a function's embedding to the FAISS index."""
-        self.index.add(np.array([embedding]))
-        self.function_embeddings.append(embedding)
-        self.function_names.append(function_name)
+        self.add_batch_to_index(np.array([embedding], dtype='float32'), [function_name])
+
+    def add_batch_to_index(self, embeddings, function_names):
+        """Add a block of embeddings known only by function name to the FAISS index with a single call."""
+        self._make_writable()
+        for function_name in function_names:
+            self.functions.append(function_name)
+        self._queue(embeddings, len(function_names))
+
+    def add_functions_to_index(self, embeddings, functions):
+        """Add a block of embeddings for (file_path, FunctionRecord) pairs to the FAISS index with a single call."""
+        self._make_writable()
+        for file_path, function in functions:
+            row = self.functions.append_function(file_path, function)
+            self.file_rows.setdefault(file_path, []).append(row)
+        self._queue(embeddings, len(functions))
+
+    def _queue(self, embeddings, count):
+        if count == 0:
+            return
+        embeddings = normalized(embeddings)
+        # The rows just appended to the store double as FAISS ids
+        ids = np.arange(len(self.functions) - count, len(self.functions), dtype='int64')
+        if self.index is None and self.index_type not in TRAINED_INDEX_TYPES:
+            with metrics.timer('index.build'):
+                self.index = build_index(self.index_type, self.embedding_dim, embeddings, id_map=self.updatable)
+        if self.index is None:
+            self._hold(embeddings, ids)
+            return
+        self._add(embeddings, ids)
+
+    def _hold(self, embeddings, ids):
+        """Park vectors on disk until flush_index, keeping a uniform training sample of all of them."""
+        if self.pending is None:
+            self.pending = tempfile.TemporaryFile(prefix='rome-pending-')
+            self.pending_ids = []
+            self.pending_count = 0
+            self.train_sample = np.empty((VECTOR_INDEX['train_sample'], self.embedding_dim), dtype='float32')
+            self.sample_rng = np.random.default_rng(0)
+        self.pending.write(embeddings.tobytes())
+        self.pending_ids.append(ids)
+        # Reservoir sampling, so the sample covers the whole corpus rather than its first files
+        for row in embeddings:
+            if self.pending_count < len(self.train_sample):
+                self.train_sample[self.pending_count] = row
+            else:
+                slot = self.sample_rng.integers(self.pending_count + 1)
+                if slot < len(self.train_sample):
+                    self.train_sample[slot] = row
+            self.pending_count += 1
+
+    def flush_index(self):
+        """Train the index on the sample of the vectors held back, then add all of them to it."""
+        if self.pending is None:
+            return
+        pending, ids = self.pending, np.concatenate(self.pending_ids)
+        sample = self.train_sample[:min(self.pending_count, len(self.train_sample))]
+        self.pending, self.pending_ids, self.pending_count, self.train_sample, self.sample_rng = None, [], 0, None, None
+        with metrics.timer('index.build'):
+            self.index = build_index(self.index_type, self.embedding_dim, sample, id_map=self.updatable)
+        pending.seek(0)
+        block = VECTOR_INDEX['train_sample']
+        for start in range(0, len(ids), block):
+            count = min(block, len(ids) - start)
+            embeddings = np.frombuffer(pending.read(count * self.embedding_dim * 4), dtype='float32')
+            self._add(embeddings.reshape(count, self.embedding_dim), ids[start:start + count])
+        pending.close()
+
+    def _make_writable(self):
+        # A memory-mapped index is read-only; changing it needs an in-memory copy
+        if self.mapped_from is None:
+            return
+        with self.lock:
+            self.index, _ = load_index(self.mapped_from, mmap=False)
+            self.functions = self.functions.writable()
+            self.mapped_from = None
+
+    @metrics.timer('index.add')
+    def _add(self, embeddings, ids):
+        if self.updatable:
+            self.index.add_with_ids(embeddings, ids)
+        else:
+            self.index.add(embeddings)
+        if self.keep_embeddings:
+            self.function_embeddings.extend(embeddings)
+
+    def remove_paths(self, paths):
+        """
+        Remove the functions of files, or of every file under directories, from the index.
+
+        Their metadata rows stay in the store, where no search can return them, until compact().
+
+        :return: Number of functions removed.
+        """
+        if not self.updatable:
+            raise RuntimeError("Functions can only be removed from an index built or loaded with updatable=True")
+        with self.lock:
+            self.flush_index()
+            prefixes = tuple(os.path.join(path, '') for path in paths)
+            doomed = [file_path for file_path in self.file_rows
+                      if file_path in paths or (file_path or '').startswith(prefixes)]
+            ids = [row for file_path in doomed for row in self.file_rows.pop(file_path)]
+            if ids and self.index is not None:
+                self.index.remove_ids(np.array(ids, dtype='int64'))
+            return len(ids)
+
+    def sync_paths(self, paths, roots=()):
+        """
+        Bring the index up to date with changed files or directories.
+
+        Functions of changed files are re-extracted and re-added under new ids, and those of
+        deleted files are removed; unchanged function bodies come from the embedding cache.
+        Paths that discovery would prune under their root are only removed, never added.
+
+        :param paths: Changed .py files and directories to rescan, as reported by a watcher.
+        :param roots: The watched project directories.
+        :return: (functions removed, functions added).
+        """
+        paths = {os.path.abspath(path) for path in paths}
+        current = set()
+        for path in paths:
+            if is_pruned(path, roots):
+                continue
+            if os.path.isdir(path):
+                current.update(iter_python_files(path))
+            elif os.path.isfile(path) and path.endswith('.py'):
+                current.add(path)
+        with self.lock:
+            removed = self.remove_paths(paths)
+            before = len(self.functions)
+            self.embed_records(extract_files(sorted(current)))
+            return removed, len(self.functions) - before
+
+    def compact(self):
+        """
+        Drop the store rows of removed functions and renumber the live ids densely.
+
+        Only the index's id map is rewritten; the vectors themselves stay where they are.
+
+        :return: Number of rows dropped.
+        """
+        with self.lock:
+            self.flush_index()
+            if not self.updatable or self.index is None:
+                return 0
+            live = faiss.vector_to_array(self.index.id_map)
+            dropped = len(self.functions) - len(live)
+            if not dropped:
+                return 0
+            rows = np.sort(live)
+            self.functions = self.functions.subset(rows.tolist())
+            faiss.copy_array_to_vector(np.searchsorted(rows, live).astype('int64'), self.index.id_map)
+            self.index.construct_rev_map()
+            self.file_rows = self.functions.rows_by_file()
+            return dropped
+
+    def snapshot(self, directory):
+        """
+        Compact the index and save it as directory, swapped in atomically.
+
+        Readers and crashes only ever see the previous snapshot or the new one.
+        """
+        staging = staging_directory(directory)
+        with self.lock:
+            self.compact()
+            self.save_index(staging)
+        replace_directory(staging, directory)
     
     def compare_function_similarity(self, function_code, top_k=5):
-        """Compare the new function embedding against all stored embeddings and return similar functions with scores."""
-        new_embedding = self.calculate_embedding(function_code)
-        distances, indices = self.index.search(np.array([new_embedding]), top_k)
-        similarity_scores = [(self.function_names[idx], 100 - (dist * 100)) for dist, idx in zip(distances[0], indices[0])]
-        return similarity_scores
-
-# Example Usage
-faiss_embedder = FaissEmbedder()
-faiss_embedder.ingest_project('/path/to/your/python/project')
-
-# Compare a new function to existing ones
-new_function_code = """
-def example_function(x):
-    return x * 2
-"""
-
-similar_functions = faiss_embedder.compare_function_similarity(new_function_code)
-for func_name, score in similar_functions:
-    print(f"Function: {func_name}, Similarity Score: {score:.2f}")
+        """Compare the new function embedding against all stored embeddings and return similar functions with cosine scores (0-100)."""
+        self.flush_index()
+        if self.index is None:
+            return []
+        return self.search_embeddings(self.calculate_embeddings([function_code], store=False), top_k)[0]
+
+    def search_embeddings(self, embeddings, top_k=5):
+        """Search the index with a block of query embeddings; returns one (name, score) list per query."""
+        return [
+            [(match['name'], match['score']) for match in matches]
+            for matches in self.search_functions(embeddings, top_k)
+        ]
+
+    def search_functions(self, embeddings, top_k=5, with_source=False):
+        """
+        Search the index with a block of query embeddings.
+
+        Returns one list per query of dicts with name, file, line span and cosine score (0-100).
+        Source code is read from disk only for these results, and only when with_source is set.
+        """
+        with self.lock, metrics.timer('search'):
+            self.flush_index()
+            scores, indices = self.index.search(normalized(embeddings), top_k)
+        results = []
+        for query_scores, query_indices in zip(scores, indices):
+            matches = []
+            for score, idx in zip(query_scores, query_indices):
+                # faiss pads with -1 when the index holds fewer than top_k vectors
+                if idx == -1:
+                    continue
+                match = self.functions.get(int(idx), with_source=with_source)
+                match['score'] = float(score) * 100
+                matches.append(match)
+            results.append(matches)
+        return results
+
+    def save_index(self, directory):
+        """Persist the FAISS index and the columnar ID -> function metadata store."""
+        self.flush_index()
+        metadata = {
+            'model_name': self.model_name,
+            # What was built: too small a corpus falls back from the requested type
+            'index_type': self.index_type if self.index is None else index_kind(self.index),
+        }
+        save_index(self.index, metadata, directory)
+        self.functions.save(directory)
+
+    def load_index(self, directory, mmap=True):
+        """
+        Load an index written by save_index, memory-mapping it by default.
+
+        An updatable embedder loads the index and store into memory instead, so the index
+        can be changed in place; its live ids come from the index's id map. A memory-mapped
+        index is read into memory the first time functions are added to it.
+        """
+        mmap = mmap and not self.updatable
+        self.index, metadata = load_index(directory, mmap=mmap)
+        self.mapped_from = directory if mmap else None
+        self.pending, self.pending_ids, self.pending_count, self.train_sample, self.sample_rng = None, [], 0, None, None
+        self.index_type = metadata['index_type']
+        self.functions = FunctionStore.load(directory, mmap=mmap)
+        self.function_embeddings = []
+        self.file_rows = {}
+        if self.updatable:
+            if not isinstance(self.index, faiss.IndexIDMap2):
+                raise ValueError(f"The index in {directory} was not built updatable; re-ingest it with in-place updates")
+            self.functions = self.functions.writable()
+            live = faiss.vector_to_array(self.index.id_map)
+            self.file_rows = self.functions.rows_by_file(live.tolist())
+
+    def load_corpus(self, corpus, path_prefix=None):
+        """
+        Build the index from the functions and embeddings this model stored in a CorpusStore.
+
+        :param corpus: services.corpus_store.CorpusStore shared with the ingesting workers.
+        :param path_prefix: Only index functions of files under this path.
+        """
+        store = corpus.load(self.model_id, path_prefix)
+        vectors, store.vectors = store.vectors, None
+        with self.lock:
+            self.index = None
+            self.mapped_from = None
+            self.pending, self.pending_ids, self.pending_count, self.train_sample, self.sample_rng = None, [], 0, None, None
+            self.function_embeddings = []
+            self.functions = store
+            self.file_rows = store.rows_by_file()
+            self._queue(vectors, len(store))
+            self.flush_index()
+
+    def report_recall(self, k=10, n_queries=1000):
+        """Recall@k of the current index against exact cosine search over the ingested embeddings."""
+        self.flush_index()
+        if self.index is None or not self.function_embeddings:
+            raise RuntimeError("Recall needs an index built in this process with keep_embeddings=True")
+        return recall_at_k(self.index, np.array(self.function_embeddings), k=k, n_queries=n_queries)
+
+if __name__ == "__main__":
+    # Example Usage
+    faiss_embedder = FaissEmbedder()
+    faiss_embedder.ingest_project('/path/to/your/python/project')
+
+    # Compare a new function to existing ones
+    new_function_code = """
+    def example_function(x):
+        return x * 2
+    """
+
+    similar_functions = faiss_embedder.compare_function_similarity(new_function_code)
+    for func_name, score in similar_functions:
+        print(f"Function: {func_name}, Similarity Score: {score:.2f}")
@@ -1,70 +1,204 @@
-import os
-import ast
-from transformers import AutoTokenizer, AutoModel
-import torch
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from transformers import AutoTokenizer
+
+from config.settings import DEDUPE, EMBEDDING, INFERENCE, SHARDS
+from services.dedupe import duplicate_clusters
+from services.embedding_cache import EmbeddingCache, cached_embed
+from services.extraction import extract_files, iter_python_files
+from services.function_store import FunctionStore
+from services.inference import (close_embedding_function, embedding_function, load_model, model_id,
+                                pipeline_embed_function)
+from services.pipeline import stream_embeddings
+from services.shards import ShardedIndex, repo_fingerprint
+from services.similarity import normalize_rows, top_k_cosine
 
 class FunctionSimilarityModel:
-    def __init__(self, repo_paths):
+    def __init__(self, repo_paths, model_name=EMBEDDING['model_name'], cache=None, dtype='float32',
+                 quantized=INFERENCE['quantize']):
         """
         Initialize the model with paths to the repositories.
         
         :param repo_paths: List of paths to the repositories.
+        :param model_name: Hugging Face model used for embeddings.
+        :param cache: EmbeddingCache to reuse vectors across runs; defaults to the one in config.settings.
+        :param dtype: Storage dtype of the corpus matrix, float32 or float16 to halve memory.
+        :param quantized: Run the model with dynamic int8 quantization.
         """
         self.repo_paths = repo_paths
+        self.model_name = model_name
+        self.quantized = quantized
+        # Cache and shard key; int8 and fp32 embeddings never mix
+        self.model_id = model_id(model_name, quantized)
+        self.cache = cache
+        self.dtype = dtype
+        self.tokenizer = None
+        self.model = None
+        self.embed_fn = None
         self.code_files = []
-        self.functions = []
-        self.function_embeddings = []
+        self.functions = FunctionStore()
+        self.function_embeddings = np.empty((0, 0), dtype=dtype)
+        # Set by load_shards; queries then fan out across per-repository shards
+        self.shards = None
     
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the inference replica processes, if any.
+        """
+        close_embedding_function(self.embed_fn)
+
     def collect_code(self):
         """
         Collect code files from the repositories.
         """
         self.code_files = []
         for repo_path in self.repo_paths:
-            for root, dirs, files in os.walk(repo_path):
-                for file in files:
-                    if file.endswith('.py'):
-                        self.code_files.append(os.path.join(root, file))
+            self.code_files.extend(iter_python_files(repo_path))
     
     def extract_functions(self):
         """
-        Extract functions from the code files using AST parsing.
-        """
-        self.functions = []
-        for file_path in self.code_files:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                code = f.read()
-                try:
-                    tree = ast.parse(code)
-                    for node in ast.walk(tree):
-                        if isinstance(node, ast.FunctionDef):
-                            function_code = ast.get_source_segment(code, node)
-                            self.functions.append({
-                                'name': node.name,
-                                'code': function_code,
-                                'file': file_path
-                            })
-                except SyntaxError:
-                    continue  # Skip files with syntax errors
+        Extract functions from the code files using the shared extraction engine.
+        
+        Metadata goes into a columnar FunctionStore; source text is read back by byte span
+        only for the results actually returned.
+        """
+        self.functions = self.extract_store(self.code_files)
+
+    def extract_store(self, code_files):
+        """
+        Extract the functions of some files into a new FunctionStore.
+        
+        :param code_files: List of Python file paths.
+        :return: FunctionStore without vectors.
+        """
+        store = FunctionStore()
+        for record in extract_files(code_files):
+            if record.error:
+                continue  # Skip files with syntax errors
+            for function in record.defs:
+                store.append_function(record.path, function)
+        return store
     
+    def load_model(self):
+        """
+        Load the tokenizer and model once and keep them resident for later calls.
+        """
+        if self.model is None:
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            self.model = load_model(self.model_name, self.quantized)
+            self.embed_fn = embedding_function(self.tokenizer, self.model)
+            if self.cache is None:
+                self.cache = EmbeddingCache.from_settings(self.model.config.hidden_size)
+
+    def embed(self, snippets, store=True):
+        """
+        Embed code snippets with the resident model, reusing cached vectors.
+        
+        :param snippets: List of code strings.
+        :param store: Add new vectors to the cache; queries only look it up.
+        :return: float32 array of shape (len(snippets), hidden_size).
+        """
+        self.load_model()
+        return cached_embed(self.cache, snippets, self.embed_fn, self.model_id, store=store)
+
     def generate_embeddings(self):
         """
         Generate embeddings for the extracted functions using CodeBERT.
+        
+        The corpus is kept as one row-normalized contiguous matrix so queries are a single matrix multiply.
+        """
+        self.functions = self.embed_store(self.functions, self.code_files)
+        self.function_embeddings = self.functions.vectors
+
+    def embed_store(self, store, code_files):
+        """
+        Embed every function of a store, streaming the files through the ingestion pipeline.
+        
+        Functions the pipeline leaves out (trivial bodies, as FaissEmbedder skips them) and
+        functions of files edited since extraction get no vector and are dropped, so they
+        can never come back from a search.
+        
+        :param store: FunctionStore built from code_files.
+        :param code_files: The files the store was extracted from.
+        :return: FunctionStore of the embedded functions, with the row-normalized matrix as its vectors.
+        """
+        self.load_model()
+        rows = store.rows_by_span()
+        embeddings = np.empty((len(store), self.model.config.hidden_size), dtype=self.dtype)
+        embedded = np.zeros(len(store), dtype=bool)
+        stream = stream_embeddings(code_files, self.tokenizer, self.model, self.model_id, cache=self.cache,
+                                   embed_fn=pipeline_embed_function(self.embed_fn))
+        for ids, vectors, _ in stream:
+            targets, sources = [], []
+            for i, (path, function) in enumerate(ids):
+                row = rows.get((path, function.start_offset))
+                if row is not None:
+                    targets.append(row)
+                    sources.append(i)
+            embeddings[targets] = normalize_rows(vectors[sources], dtype=self.dtype)
+            embedded[targets] = True
+        if not embedded.all():
+            kept = np.flatnonzero(embedded)
+            store = store.subset(kept.tolist())
+            embeddings = embeddings[kept]
+        store.vectors = embeddings
+        return store
+
+    def build_shards(self, directory=SHARDS['path'], force=False):
         """
-        tokenizer = AutoTokenizer.from_pretrained("microsoft/codebert-base")
-        model = AutoModel.from_pretrained("microsoft/codebert-base")
-        
-        self.function_embeddings = []
-        for func in self.functions:
-            code_tokens = tokenizer.tokenize(func['code'])
-            code_ids = tokenizer.convert_tokens_to_ids(code_tokens)
-            tokens_tensor = torch.tensor([code_ids])
-            
-            with torch.no_grad():
-                outputs = model(tokens_tensor)
-                embeddings = outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
-                self.function_embeddings.append(embeddings)
+        Build or refresh one index shard per repository.
+        
+        A repository whose files are unchanged since its shard was saved (same paths, mtimes
+        and sizes, same model) is skipped, so re-indexing one repository leaves the others alone.
+        
+        :param directory: Directory holding the shards.
+        :param force: Rebuild every shard even when it is up to date.
+        :return: List of the repository paths that were rebuilt.
+        """
+        index = ShardedIndex(directory)
+        rebuilt = []
+        for repo_path in self.repo_paths:
+            code_files = list(iter_python_files(repo_path))
+            fingerprint = repo_fingerprint(code_files)
+            if not force and index.is_fresh(repo_path, self.model_id, fingerprint):
+                continue
+            store = self.embed_store(self.extract_store(code_files), code_files)
+            index.save_shard(repo_path, store, self.model_id, fingerprint)
+            rebuilt.append(repo_path)
+        return rebuilt
+
+    def load_shards(self, directory=SHARDS['path'], repos=None):
+        """
+        Load saved shards, memory-mapped, for sharded queries.
+        
+        :param directory: Directory holding the shards.
+        :param repos: Only load the shards of these repositories; defaults to all saved shards.
+        """
+        self.shards = ShardedIndex(directory).load(repos)
+
+    def save(self, directory):
+        """
+        Save function metadata and the corpus matrix as .npy files.
+        
+        :param directory: Output directory.
+        """
+        self.functions.save(directory)
+
+    def load(self, directory, mmap=True):
+        """
+        Load a corpus written by save. With mmap the arrays are mapped read-only, so
+        worker processes loading the same directory share one copy in memory.
+        
+        :param directory: Directory written by save.
+        :param mmap: Memory-map instead of reading the arrays into memory.
+        """
+        self.functions = FunctionStore.load(directory, mmap=mmap)
+        self.function_embeddings = self.functions.vectors
     
     def find_similar_functions(self, function_code, top_n=5):
         """
@@ -74,31 +208,68 @@ class FunctionSimilarityModel:
         :param top_n: The number of similar functions to return.
         :return: List of similar functions with their similarity scores.
         """
-        tokenizer = AutoTokenizer.from_pretrained("microsoft/codebert-base")
-        model = AutoModel.from_pretrained("microsoft/codebert-base")
-        
-        code_tokens = tokenizer.tokenize(function_code)
-        code_ids = tokenizer.convert_tokens_to_ids(code_tokens)
-        tokens_tensor = torch.tensor([code_ids])
-        
-        with torch.no_grad():
-            outputs = model(tokens_tensor)
-            query_embedding = outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
-        
-        # Compute cosine similarities
-        similarities = cosine_similarity(
-            [query_embedding],
-            self.function_embeddings
-        )[0]
-        
-        # Get top_n similar functions
-        similar_indices = similarities.argsort()[-top_n:][::-1]
-        similar_functions = []
-        for idx in similar_indices:
-            similar_functions.append({
-                'name': self.functions[idx]['name'],
-                'code': self.functions[idx]['code'],
-                'file': self.functions[idx]['file'],
-                'similarity': similarities[idx]
-            })
-        return similar_functions
+        return self.find_similar_functions_batch([function_code], top_n=top_n)[0]
+
+    def find_similar_functions_batch(self, function_codes, top_n=5, repos=None):
+        """
+        Find similar functions for many queries at once.
+        
+        :param function_codes: List of query function codes.
+        :param top_n: The number of similar functions to return per query.
+        :param repos: With shards loaded, only search these repositories.
+        :return: One list of similar functions with their similarity scores per query.
+        """
+        query_embeddings = self.embed(function_codes, store=False)
+        if self.shards is not None:
+            return self._search_shards(query_embeddings, top_n, repos)
+        scores, indices = top_k_cosine(query_embeddings, self.function_embeddings, top_n)
+
+        results = []
+        for query_scores, query_indices in zip(scores, indices):
+            similar_functions = []
+            for score, idx in zip(query_scores, query_indices):
+                func = self.functions.get(int(idx), with_source=True)
+                similar_functions.append({
+                    'name': func['name'],
+                    'code': func['code'],
+                    'file': func['file'],
+                    'lineno': func['lineno'],
+                    'similarity': float(score)
+                })
+            results.append(similar_functions)
+        return results
+
+    def _search_shards(self, query_embeddings, top_n, repos):
+        results = []
+        for hits in self.shards.search(query_embeddings, top_n, repos=repos):
+            similar_functions = []
+            for score, repo_path, row in hits:
+                func = self.shards.shards[repo_path].get(row, with_source=True)
+                similar_functions.append({
+                    'name': func['name'],
+                    'code': func['code'],
+                    'file': func['file'],
+                    'lineno': func['lineno'],
+                    'repo': repo_path,
+                    'similarity': score
+                })
+            results.append(similar_functions)
+        return results
+
+    def find_duplicate_clusters(self, threshold=DEDUPE['threshold'], jaccard_threshold=DEDUPE['jaccard_threshold'], verify=True):
+        """
+        Find clusters of near-duplicate functions across the repositories.
+        
+        MinHash/LSH over normalized AST shingles proposes candidate pairs, and only the functions
+        in those pairs are embedded for verification, so no full corpus embedding is needed.
+        
+        :param threshold: Minimum cosine similarity of a verified pair.
+        :param jaccard_threshold: Minimum estimated shingle Jaccard similarity of a candidate pair.
+        :param verify: Verify candidates with embeddings; otherwise score by Jaccard estimate only.
+        :return: List of (functions, score) clusters, largest first.
+        """
+        # Sources are streamed from disk; only the candidates are read again to embed them
+        clusters = duplicate_clusters(self.functions.iter_sources(), embed=self.embed if verify else None,
+                                      threshold=threshold, jaccard_threshold=jaccard_threshold,
+                                      fetch_sources=self.functions.sources)
+        return [([self.functions.get(i) for i in members], score) for members, score in clusters]
@@ -1,81 +1,59 @@
 import os
-import ast
+
+from services.extraction import iter_python_files
+from services.runtime_coverage import RuntimeCoverage, run_tests
+from services.symbol_index import SymbolIndex
 
 class CodeCoverageAnalyzer:
-    def __init__(self, project_dir):
+    def __init__(self, project_dir, index=None):
         self.project_dir = project_dir
         self.test_dir = os.path.join(project_dir, 'tst')
+        # Persisted between runs, so only files changed since the last report are reparsed
+        self.index = index if index is not None else SymbolIndex.for_project(project_dir)
         self.function_definitions = set()
         self.function_calls_in_tests = set()
+        # Set by collect_runtime_coverage; replaces the static call-name match
+        self.runtime_results = None
 
     def get_function_definitions(self):
-        for dirpath, dirnames, filenames in os.walk(self.project_dir):
-            # Skip the 'tst' directory and its subdirectories
-            if self.test_dir in dirpath:
-                continue
-            for filename in filenames:
-                if filename.endswith('.py'):
-                    filepath = os.path.join(dirpath, filename)
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        try:
-                            node = ast.parse(file.read(), filename=filepath)
-                            self.extract_function_definitions(node, filepath)
-                        except SyntaxError as e:
-                            print(f"SyntaxError in file {filepath}: {e}")
-
-    def extract_function_definitions(self, node, filepath):
-        for child in ast.walk(node):
-            if isinstance(child, ast.FunctionDef):
-                function_name = child.name
-                # Get the module path relative to the project directory
-                module_path = os.path.relpath(filepath, self.project_dir)
-                module_name = module_path.replace(os.sep, '.')[:-3]  # remove .py extension
-                full_function_name = f"{module_name}.{function_name}"
-                self.function_definitions.add(full_function_name)
-            elif isinstance(child, ast.ClassDef):
-                class_name = child.name
-                for item in child.body:
-                    if isinstance(item, ast.FunctionDef):
-                        function_name = item.name
-                        module_path = os.path.relpath(filepath, self.project_dir)
-                        module_name = module_path.replace(os.sep, '.')[:-3]
-                        full_function_name = f"{module_name}.{class_name}.{function_name}"
-                        self.function_definitions.add(full_function_name)
+        # Skip the 'tst' directory and its subdirectories
+        paths = iter_python_files(self.project_dir, exclude_dirs=[self.test_dir])
+        self.report_errors(self.index.refresh(paths, 'source'))
+        self.function_definitions = set(self.index.definitions('source'))
 
     def get_function_calls_in_tests(self):
-        for dirpath, dirnames, filenames in os.walk(self.test_dir):
-            for filename in filenames:
-                if filename.endswith('.py'):
-                    filepath = os.path.join(dirpath, filename)
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        try:
-                            node = ast.parse(file.read(), filename=filepath)
-                            self.extract_function_calls(node)
-                        except SyntaxError as e:
-                            print(f"SyntaxError in file {filepath}: {e}")
+        self.report_errors(self.index.refresh(iter_python_files(self.test_dir), 'test'))
+        self.function_calls_in_tests = set(self.index.call_names('test'))
+
+    def collect_runtime_coverage(self, runner='unittest', timing=False):
+        """
+        Run the test suite under a sys.monitoring collector and record which functions ran.
+
+        :param runner: 'unittest' or 'pytest'.
+        :param timing: Also count calls and time every function, at a per-call cost.
+        :return: True when every test passed.
+        """
+        collector = RuntimeCoverage(self.project_dir, exclude_dirs=[self.test_dir], timing=timing)
+        with collector:
+            passed = run_tests(self.test_dir, self.project_dir, runner)
+        self.runtime_results = collector.results()
+        return passed
 
-    def extract_function_calls(self, node):
-        for child in ast.walk(node):
-            if isinstance(child, ast.Call):
-                func = child.func
-                if isinstance(func, ast.Name):
-                    function_name = func.id
-                    self.function_calls_in_tests.add(function_name)
-                elif isinstance(func, ast.Attribute):
-                    # For method calls like obj.method()
-                    function_name = func.attr
-                    self.function_calls_in_tests.add(function_name)
+    def report_errors(self, records):
+        for record in records:
+            if record.error:
+                print(f"Error parsing file {record.path}: {record.error}")
 
     def analyze_coverage(self):
         total_functions = len(self.function_definitions)
         if total_functions == 0:
             print("No functions found in the project code.")
-            return
-        covered_functions = set()
-        for func_def in self.function_definitions:
-            func_name = func_def.split('.')[-1]  # Get the function name
-            if func_name in self.function_calls_in_tests:
-                covered_functions.add(func_def)
+            return []
+        if self.runtime_results is not None:
+            covered_functions = self.function_definitions & self.runtime_results.keys()
+        else:
+            # Definitions whose bare name is called from a test, matched by the index
+            covered_functions = set(self.index.covered_definitions('source', 'test'))
         uncovered_functions = self.function_definitions - covered_functions
         coverage_percentage = (len(covered_functions) / total_functions) * 100
 
@@ -85,6 +63,17 @@ class CodeCoverageAnalyzer:
         print("\nFunctions not covered by tests:")
         for func in sorted(uncovered_functions):
             print(func)
+        return sorted(uncovered_functions)
+
+    def report_timings(self, top=20):
+        """Print the functions with the most cumulative time from a timed runtime collection."""
+        timed = [(seconds, calls, name) for name, (calls, seconds) in self.runtime_results.items() if seconds is not None]
+        if not timed:
+            return
+        print("\nSlowest functions (cumulative):")
+        print(f"{'calls':>10} {'seconds':>10}  function")
+        for seconds, calls, name in sorted(timed, reverse=True)[:top]:
+            print(f"{calls:>10} {seconds:>10.4f}  {name}")
 
 if __name__ == "__main__":
     project_directory = 'path_to_your_project'  # Replace with your project path
@@ -1,87 +1,134 @@
 import os
-import ast
-
-class UnitTestGenerator:
-    def __init__(self, project_dir, uncovered_functions):
-        self.project_dir = project_dir
-        self.uncovered_functions = uncovered_functions
-        self.test_dir = os.path.join(project_dir, 'tst')
-        self.existing_tests = set()
-
-    def get_existing_tests(self):
-        """Collect existing test methods to avoid duplicates."""
-        for dirpath, dirnames, filenames in os.walk(self.test_dir):
-            for filename in filenames:
-                if filename.startswith('test_') and filename.endswith('.py'):
-                    filepath = os.path.join(dirpath, filename)
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        try:
-                            node = ast.parse(file.read(), filename=filepath)
-                            for child in ast.walk(node):
-                                if isinstance(child, ast.FunctionDef):
-                                    self.existing_tests.add(child.name)
-                        except SyntaxError as e:
-                            print(f"SyntaxError in file {filepath}: {e}")
-
-    def generate_tests(self):
-        """Generate unit test files for uncovered functions."""
-        self.get_existing_tests()
-        for func_full_name in self.uncovered_functions:
-            parts = func_full_name.split('.')
-            if len(parts) >= 2:
-                module_path = '.'.join(parts[:-1])
-                function_name = parts[-1]
-                test_class_name = f"Test{function_name.capitalize()}"
-                test_method_name = f"test_{function_name}"
-
-                # Avoid duplicate test methods
-                if test_method_name in self.existing_tests:
-                    continue
-
-                # Create test file path
-                module_file = module_path.replace('.', os.sep) + '.py'
-                module_relpath = os.path.relpath(module_file, self.project_dir)
-                test_file_name = f"test_{os.path.basename(module_file)}"
-                test_file_dir = os.path.join(self.test_dir, os.path.dirname(module_relpath))
-                os.makedirs(test_file_dir, exist_ok=True)
-                test_file_path = os.path.join(test_file_dir, test_file_name)
-
-                # Generate test code
-                test_code = self.create_test_code(module_path, function_name, test_class_name, test_method_name)
-
-                # Write to test file
-                with open(test_file_path, 'a', encoding='utf-8') as test_file:
-                    test_file.write(test_code)
-
-                print(f"Generated test for {func_full_name} at {test_file_path}")
-
-    def create_test_code(self, module_path, function_name, test_class_name, test_method_name):
-        """Create the code for the unit test."""
-        test_code = f"""
-import unittest
-from {module_path} import {function_name}
-
-class {test_class_name}(unittest.TestCase):
-    def {test_method_name}(self):
-        # TODO: Implement test case for {function_name}
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from jinja2 import Environment
+
+from config.settings import TEST_GENERATION
+from services.extraction import iter_python_files
+from services.symbol_index import SymbolIndex
+from utils.atomic import write_atomic
+
+# Imports and test classes for a group of functions of one module
+TESTS_TEMPLATE = """
+{% if header %}import unittest
+{% endif %}from {{ module_path }} import {{ tests|map(attribute='function_name')|join(', ') }}
+{% for test in tests %}
+class {{ test.class_name }}(unittest.TestCase):
+    def {{ test.method_name }}(self):
+        # TODO: Implement test case for {{ test.function_name }}
         # Example input parameters
-        input_params = {{'param1': value1, 'param2': value2}}  # Replace with actual parameters
+        input_params = {'param1': value1, 'param2': value2}  # Replace with actual parameters
 
         # If the function returns a value
-        result = {function_name}(**input_params)
+        result = {{ test.function_name }}(**input_params)
         expected_result = None  # Define the expected result
         self.assertEqual(result, expected_result)
 
         # If the function modifies a dict parameter
-        # initial_dict = {{'key': 'initial_value'}}
-        # {function_name}(initial_dict)
-        # expected_dict = {{'key': 'modified_value'}}
+        # initial_dict = {'key': 'initial_value'}
+        # {{ test.function_name }}(initial_dict)
+        # expected_dict = {'key': 'modified_value'}
         # self.assertEqual(initial_dict, expected_dict)
+{% endfor %}"""
 
+MAIN_BLOCK = """
 if __name__ == '__main__':
     unittest.main()
 """
-        return test_code
+
+# Compiled once per process and shared by every rendering thread
+_environment = Environment(keep_trailing_newline=True, autoescape=False)
+_tests_template = _environment.from_string(TESTS_TEMPLATE)
+
+
+class UnitTestGenerator:
+    def __init__(self, project_dir, uncovered_functions, index=None, workers=TEST_GENERATION['workers']):
+        self.project_dir = project_dir
+        self.uncovered_functions = uncovered_functions
+        self.test_dir = os.path.join(project_dir, 'tst')
+        # Shared with the coverage analyzer, so unchanged test files are not reparsed
+        self.index = index if index is not None else SymbolIndex.for_project(project_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.existing_tests = set()
+
+    def get_existing_tests(self):
+        """Collect existing test methods to avoid duplicates."""
+        for record in self.index.refresh(iter_python_files(self.test_dir), 'test'):
+            if record.error:
+                print(f"Error parsing file {record.path}: {record.error}")
+        self.existing_tests = self.index.defined_names('test', file_prefix='test_')
+
+    def plan_tests(self):
+        """
+        Group the uncovered functions by the test file they belong in.
+
+        :return: Dict of test file path -> (module path, list of test dicts), skipping
+            functions whose test method already exists.
+        """
+        plan = {}
+        planned = defaultdict(set)
+        for func_full_name in self.uncovered_functions:
+            parts = func_full_name.split('.')
+            if len(parts) < 2:
+                continue
+            module_path = '.'.join(parts[:-1])
+            function_name = parts[-1]
+            test_method_name = f"test_{function_name}"
+
+            # Avoid duplicate test methods
+            if test_method_name in self.existing_tests:
+                continue
+
+            # Mirror the module's location under the test directory
+            module_file = module_path.replace('.', os.sep) + '.py'
+            test_file_name = f"test_{os.path.basename(module_file)}"
+            test_file_path = os.path.join(self.test_dir, os.path.dirname(module_file), test_file_name)
+            if test_method_name in planned[test_file_path]:
+                continue
+            planned[test_file_path].add(test_method_name)
+
+            _, tests = plan.setdefault(test_file_path, (module_path, []))
+            tests.append({
+                'full_name': func_full_name,
+                'function_name': function_name,
+                'class_name': f"Test{function_name.capitalize()}",
+                'method_name': test_method_name,
+            })
+        return plan
+
+    def generate_tests(self):
+        """Generate unit test files for uncovered functions, one rendering and one write per file."""
+        self.get_existing_tests()
+        plan = self.plan_tests()
+        for test_file_path in plan:
+            os.makedirs(os.path.dirname(test_file_path), exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for test_file_path, tests in pool.map(self.write_test_file, plan.items()):
+                for test in tests:
+                    print(f"Generated test for {test['full_name']} at {test_file_path}")
+
+    def write_test_file(self, item):
+        test_file_path, (module_path, tests) = item
+        try:
+            with open(test_file_path, 'r', encoding='utf-8') as test_file:
+                existing = test_file.read()
+        except FileNotFoundError:
+            existing = ''
+        test_code = self.create_test_code(module_path, tests, header='import unittest' not in existing)
+        write_atomic(test_file_path, self.merge_test_code(existing, test_code))
+        return test_file_path, tests
+
+    def merge_test_code(self, existing, test_code):
+        """Place new tests before an existing file's unittest.main() block, keeping exactly one."""
+        if MAIN_BLOCK in existing:
+            head, tail = existing.split(MAIN_BLOCK, 1)
+            return head + test_code + MAIN_BLOCK + tail
+        return existing + test_code + MAIN_BLOCK
+
+    def create_test_code(self, module_path, tests, header=True):
+        """Create the imports and test classes for a group of functions from one module."""
+        return _tests_template.render(module_path=module_path, tests=tests, header=header)
 
 if __name__ == "__main__":
     # Assume we have a list of uncovered functions from the analyzer
@@ -94,4 +141,3 @@ if __name__ == "__main__":
 
     test_generator = UnitTestGenerator(project_directory, uncovered_functions)
     test_generator.generate_tests()
-
@@ -1,9 +1,7 @@
-import torch
-from transformers import BertTokenizer, BertModel, TFBertModel
-import tensorflow as tf
 import inspect
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+
+from config.settings import BACKENDS
+from services.backends import EmbeddingEngine
 
 def get_function_code(func):
     """Extract source code from the function."""
@@ -11,45 +9,44 @@ def get_function_code(func):
 
 def get_embeddings_pytorch(text):
     """Generate embeddings using BERT model in PyTorch."""
-    tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-    model = BertModel.from_pretrained('bert-base-uncased')
-    inputs = tokenizer(text, return_tensors='pt', padding=True, truncation=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).numpy()
+    return EmbeddingEngine(backends=['torch']).embed([text])['torch']
 
 def get_embeddings_tensorflow(text):
     """Generate embeddings using BERT model in TensorFlow."""
-    tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-    model = TFBertModel.from_pretrained('bert-base-uncased')
-    inputs = tokenizer(text, return_tensors='tf', padding=True, truncation=True)
-    outputs = model(**inputs)
-    return tf.reduce_mean(outputs.last_hidden_state, axis=1).numpy()
+    return EmbeddingEngine(backends=['tensorflow']).embed([text])['tensorflow']
 
 def calculate_similarity(embedding1, embedding2):
     """Calculate cosine similarity between two embeddings."""
-    return cosine_similarity(embedding1, embedding2)[0][0]
+    return EmbeddingEngine.cosine(embedding1, embedding2)
 
 def are_functions_similar(func1, func2, threshold=0.95):
     """Determine if two functions are similar based on cosine similarity."""
-    # Extract code
-    code1 = get_function_code(func1)
-    code2 = get_function_code(func2)
-    
-    # Get embeddings
-    emb_pytorch_1 = get_embeddings_pytorch(code1)
-    emb_pytorch_2 = get_embeddings_pytorch(code2)
-    emb_tensorflow_1 = get_embeddings_tensorflow(code1)
-    emb_tensorflow_2 = get_embeddings_tensorflow(code2)
-    
-    # Calculate similarities
-    similarity_pytorch = calculate_similarity(emb_pytorch_1, emb_pytorch_2)
-    similarity_tensorflow = calculate_similarity(emb_tensorflow_1, emb_tensorflow_2)
-    
-    print(f"Similarity (PyTorch): {similarity_pytorch}")
-    print(f"Similarity (TensorFlow): {similarity_tensorflow}")
-    
-    return similarity_pytorch >= threshold and similarity_tensorflow >= threshold
+    return are_functions_similar_bulk([(func1, func2)], threshold=threshold)[0]
+
+def are_functions_similar_bulk(function_pairs, threshold=0.95, engine=None):
+    """
+    Compare many function pairs on the PyTorch and TensorFlow backends at once.
+
+    Every distinct function is embedded once per backend in batched passes, with the
+    backends running concurrently; models stay loaded for the life of the process.
+
+    :param function_pairs: Iterable of (func1, func2); each item a function or its source code.
+    :param threshold: Minimum similarity required on every backend.
+    :param engine: EmbeddingEngine to use; defaults to the one configured in config.settings.
+    :return: List of booleans, one per pair.
+    """
+    engine = engine or EmbeddingEngine(model_name=BACKENDS['model_name'])
+    code_pairs = [tuple(func if isinstance(func, str) else get_function_code(func) for func in pair)
+                  for pair in function_pairs]
+    similarities, similar = engine.compare_pairs(code_pairs, threshold=threshold)
+
+    for backend, values in similarities.items():
+        if len(values) == 1:
+            print(f"Similarity ({backend}): {values[0]}")
+        else:
+            print(f"Similarity ({backend}): {int((values >= threshold).sum())} of {len(values)} pairs above {threshold}")
+
+    return similar.tolist()
 
 
 def example_func1(host, database, user, password, port=5432):
@@ -108,6 +105,7 @@ def example_func2(host, database, user, password, port=5432):
         print(f"Error connecting to PostgreSQL database: {e}")
         return None
 
-# Determine similarity
-is_similar = are_functions_similar(example_func1, example_func2)
-print("Are the functions similar?", is_similar)
+if __name__ == "__main__":
+    # Determine similarity
+    is_similar = are_functions_similar(example_func1, example_func2)
+    print("Are the functions similar?", is_similar)
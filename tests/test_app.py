@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from core.app import load_args, status
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoadArgsTest(unittest.TestCase):
+    def test_bare_invocation_runs_status(self):
+        args = load_args([])
+        self.assertEqual(args.command, 'status')
+        self.assertIs(args.handler, status)
+
+    def test_subcommand_options(self):
+        args = load_args(['ingest', 'a', 'b', '--index-type', 'hnsw', '--recall', '5'])
+        self.assertEqual((args.command, args.paths, args.index_type, args.recall), ('ingest', ['a', 'b'], 'hnsw', 5))
+
+    def test_repo_filter_is_repeatable(self):
+        args = load_args(['query', 'q.py', '--shards', 'shards', '--repo', 'a', '--repo', 'b'])
+        self.assertEqual((args.shards, args.repo), ('shards', ['a', 'b']))
+        self.assertIsNone(load_args(['query', 'q.py']).repo)
+
+    def test_import_report_is_a_flag_with_a_separate_limit(self):
+        args = load_args(['--import-report', 'status'])
+        self.assertTrue(args.import_report)
+        self.assertEqual(args.import_report_limit, 20)
+        args = load_args(['--import-report-limit', '5', 'gen-tests', '.'])
+        self.assertFalse(args.import_report)
+        self.assertEqual(args.import_report_limit, 5)
+
+    def test_profile_out_is_separate_from_the_flag(self):
+        args = load_args(['--profile', 'status'])
+        self.assertTrue(args.profile)
+        self.assertIsNone(args.profile_out)
+        self.assertEqual(load_args(['--profile-out', 'x.prof', 'status']).profile_out, 'x.prof')
+
+
+class LazyImportTest(unittest.TestCase):
+    def test_status_does_not_import_ml_libraries(self):
+        script = (
+            "import sys\n"
+            "sys.argv = ['main.py', 'status', '--socket', '/nonexistent/rome.sock']\n"
+            "from core.app import run\n"
+            "run()\n"
+            "print(sorted(name for name in ('torch', 'transformers', 'faiss', 'tensorflow', 'sklearn') if name in sys.modules))\n"
+        )
+        env = dict(os.environ, EMBEDDING_CACHE_DIR='', LOG_LEVEL='WARNING')
+        output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, capture_output=True, text=True,
+                                check=True, timeout=60).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.atomic import _UMASK, replace_directory, staging_directory, write_atomic
+
+
+class WriteAtomicTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'file.py')
+
+    def mode(self):
+        return stat.S_IMODE(os.stat(self.path).st_mode)
+
+    def test_new_file_gets_the_umask_mode(self):
+        write_atomic(self.path, 'x = 1\n')
+        with open(self.path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'x = 1\n')
+        self.assertEqual(self.mode(), 0o666 & ~_UMASK)
+
+    def test_existing_file_keeps_its_mode(self):
+        write_atomic(self.path, 'old\n')
+        os.chmod(self.path, 0o640)
+        write_atomic(self.path, 'new ü\n')
+        self.assertEqual(self.mode(), 0o640)
+        with open(self.path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'new ü\n')
+
+    def test_failed_write_leaves_the_old_file_and_no_temporary(self):
+        write_atomic(self.path, 'old\n')
+        with mock.patch('utils.atomic.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                write_atomic(self.path, 'new\n')
+        self.assertEqual(os.listdir(self.directory.name), ['file.py'])
+        with open(self.path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'old\n')
+
+
+class ReplaceDirectoryTest(unittest.TestCase):
+    def test_versions_replace_each_other(self):
+        with tempfile.TemporaryDirectory() as parent:
+            target = os.path.join(parent, 'index')
+            os.makedirs(target)
+            with open(os.path.join(target, 'v'), 'w') as file:
+                file.write('0')
+            for version in ('1', '2'):
+                staging = staging_directory(target)
+                os.makedirs(staging)
+                with open(os.path.join(staging, 'v'), 'w') as file:
+                    file.write(version)
+                replace_directory(staging, target)
+                self.assertTrue(os.path.islink(target))
+                with open(os.path.join(target, 'v')) as file:
+                    self.assertEqual(file.read(), version)
+            # Only the live version is left next to the link
+            self.assertEqual(len(os.listdir(parent)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
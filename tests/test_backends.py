@@ -0,0 +1,60 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from services.backends import EmbeddingEngine, registered
+from tests.tiny_model import tiny_model_dir
+
+
+class RegisteredTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_load(self):
+        loads = []
+        release = threading.Event()
+
+        def load():
+            loads.append(1)
+            release.wait(5)
+            return object()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(registered, 'test-shared', 'model', load) for _ in range(4)]
+            release.set()
+            results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(len(loads), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_a_slow_load_does_not_block_other_models(self):
+        release = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(registered, 'test-slow', 'model', lambda: release.wait(5) and 'slow')
+            # Loads while the first one is still in progress
+            self.assertEqual(registered('test-slow', 'other', lambda: 'fast'), 'fast')
+            self.assertFalse(slow.done())
+            release.set()
+            self.assertEqual(slow.result(timeout=5), 'slow')
+
+    def test_failed_load_is_retried(self):
+        def fail():
+            raise OSError('no weights')
+
+        with self.assertRaises(OSError):
+            registered('test-retry', 'model', fail)
+        self.assertEqual(registered('test-retry', 'model', lambda: 'loaded'), 'loaded')
+
+
+class EmbeddingEngineTest(unittest.TestCase):
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            EmbeddingEngine(tiny_model_dir(), backends=['torch', 'onnx'])
+
+    def test_identical_code_is_similar_on_every_backend(self):
+        engine = EmbeddingEngine(tiny_model_dir(), backends=['torch'])
+        similarities, similar = engine.compare_pairs([('x = 1', 'x = 1'), ('x = 1', 'for y in z : pass')],
+                                                     threshold=0.999)
+        self.assertAlmostEqual(float(similarities['torch'][0]), 1.0, places=5)
+        self.assertEqual(similarities['torch'].shape, (2,))
+        self.assertTrue(similar[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+
+from services.batcher import MicroBatcher
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def test_full_batch_dispatches_before_the_deadline(self):
+        batches = []
+        batcher = MicroBatcher(lambda items: batches.append(list(items)) or [item * 2 for item in items], max_batch_size=4, max_wait_ms=10000)
+        started = time.monotonic()
+        self.assertEqual(batcher.map([1, 2, 3, 4]), [2, 4, 6, 8])
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(batches, [[1, 2, 3, 4]])
+
+    def test_lone_item_is_flushed_after_the_deadline(self):
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=64, max_wait_ms=50)
+        started = time.monotonic()
+        self.assertEqual(batcher.submit(1).result(timeout=5), 2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_batches_never_exceed_the_size_limit(self):
+        sizes = []
+        batcher = MicroBatcher(lambda items: sizes.append(len(items)) or list(items), max_batch_size=3, max_wait_ms=20)
+        self.assertEqual(batcher.map(range(10)), list(range(10)))
+        self.assertEqual(sum(sizes), 10)
+        self.assertLessEqual(max(sizes), 3)
+
+    def test_concurrent_submitters_share_batches(self):
+        sizes = []
+        batcher = MicroBatcher(lambda items: sizes.append(len(items)) or [-item for item in items], max_batch_size=64, max_wait_ms=200)
+        results = {}
+        barrier = threading.Barrier(8)
+
+        def submit(value):
+            barrier.wait()
+            results[value] = batcher.submit(value).result(timeout=5)
+
+        threads = [threading.Thread(target=submit, args=(value,)) for value in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {value: -value for value in range(8)})
+        self.assertLess(len(sizes), 8)
+
+    def test_errors_fail_the_whole_batch_and_the_worker_survives(self):
+        def process(items):
+            if 'bad' in items:
+                raise ValueError('bad item')
+            return [item.upper() for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=10000)
+        futures = [batcher.submit('ok'), batcher.submit('bad')]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        self.assertEqual(batcher.map(['a', 'b']), ['A', 'B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import os
+import tempfile
+import unittest
+
+from services.benchmark import bench_similarity_model
+from tests.tiny_model import tiny_model_dir
+from utils.synthetic_repo import generate_repo
+
+
+class BenchSimilarityModelTest(unittest.TestCase):
+    def test_embedded_count_and_recall(self):
+        with tempfile.TemporaryDirectory() as directory:
+            repo = os.path.join(directory, 'repo')
+            generated = generate_repo(repo, files=4, functions_per_file=5, mean_lines=4, seed=5)
+            report = bench_similarity_model(repo, tiny_model_dir(), queries=3, top_k=5, dtype='float32',
+                                            cache_dir=os.path.join(directory, 'cache'))
+        self.assertGreaterEqual(report['functions'], generated['functions'])
+        # Trivial functions are dropped from the corpus, not embedded as zero rows
+        self.assertTrue(0 < report['embedded'] < report['functions'])
+        self.assertGreater(report['recall_at_5'], 0.99)
+
+
+if __name__ == '__main__':
+    unittest.main()
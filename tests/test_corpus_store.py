@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.corpus_store import CorpusStore
+from services.extraction import FunctionRecord
+
+
+def function(name, lineno, start_offset):
+    return FunctionRecord(name, name, False, lineno, lineno + 1, start_offset, start_offset + 20, 10)
+
+
+class CorpusStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CorpusStore(f"sqlite:///{os.path.join(self.directory.name, 'corpus.sqlite')}", dim=4)
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        self.directory.cleanup()
+
+    def test_put_many_get_many_round_trip(self):
+        vectors = np.arange(8, dtype='float32').reshape(2, 4)
+        self.store.put_many(['a', 'b'], vectors)
+        found = self.store.get_many(['a', 'b', 'missing'])
+        self.assertEqual(set(found), {'a', 'b'})
+        np.testing.assert_array_equal(found['b'], vectors[1])
+        self.assertEqual(len(self.store), 2)
+
+    def test_put_many_keeps_the_first_vector(self):
+        self.store.put_many(['a'], np.ones((1, 4)))
+        self.store.put_many(['a'], np.zeros((1, 4)))
+        np.testing.assert_array_equal(self.store.get_many(['a'])['a'], np.ones(4))
+
+    def test_save_functions_and_load(self):
+        self.store.put_many(['ka', 'kb'], np.eye(4, dtype='float32')[:2])
+        saved = self.store.save_functions([
+            (('/p/a.py', function('f', 1, 0)), 'ka'),
+            (('/p/a.py', function('g', 5, 40)), 'kb'),
+            (('/p/b.py', function('h', 1, 0)), 'ka'),
+        ], 'model')
+        self.assertEqual(saved, 3)
+
+        loaded = self.store.load('model')
+        self.assertEqual([loaded.get(row) for row in range(len(loaded))], [
+            {'name': 'f', 'file': '/p/a.py', 'lineno': 1, 'end_lineno': 2},
+            {'name': 'g', 'file': '/p/a.py', 'lineno': 5, 'end_lineno': 6},
+            {'name': 'h', 'file': '/p/b.py', 'lineno': 1, 'end_lineno': 2},
+        ])
+        np.testing.assert_array_equal(loaded.vectors, np.eye(4, dtype='float32')[[0, 1, 0]])
+        self.assertEqual(len(self.store.load('other model')), 0)
+        self.assertEqual(len(self.store.load('model', path_prefix='/p/b')), 1)
+
+    def test_save_functions_replaces_a_file(self):
+        self.store.put_many(['ka', 'kb'], np.eye(4, dtype='float32')[:2])
+        self.store.save_functions([
+            (('/p/a.py', function('f', 1, 0)), 'ka'),
+            (('/p/a.py', function('g', 5, 40)), 'kb'),
+        ], 'model')
+        self.store.save_functions([(('/p/a.py', function('g', 1, 0)), 'kb')], 'model')
+
+        loaded = self.store.load('model')
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(loaded.name(0), 'g')
+        np.testing.assert_array_equal(loaded.vectors[0], np.eye(4)[1])
+
+    def test_delete_paths(self):
+        self.store.put_many(['ka'], np.ones((1, 4)))
+        self.store.save_functions([(('/p/a.py', function('f', 1, 0)), 'ka')], 'model')
+        self.store.delete_paths(['/p/a.py'], 'model')
+        self.assertEqual(len(self.store.load('model')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+import numpy as np
+
+from services.dedupe import MinHasher, ast_tokens, duplicate_clusters, lsh_candidates, shingle_hashes
+
+
+class MinHasherTest(unittest.TestCase):
+    def setUp(self):
+        self.hasher = MinHasher(num_perm=128, seed=1)
+
+    def test_identical_sets_have_identical_signatures(self):
+        hashes = np.arange(100, dtype='uint64')
+        np.testing.assert_array_equal(self.hasher.signature(hashes), self.hasher.signature(hashes[::-1]))
+
+    def test_agreement_estimates_jaccard_similarity(self):
+        # 32-bit hashes, like shingle_hashes produces
+        hashes = np.random.default_rng(0).choice(1 << 32, 1500, replace=False).astype('uint64')
+        first, second = hashes[:1000], hashes[500:]
+        agreement = np.mean(self.hasher.signature(first) == self.hasher.signature(second))
+        # True Jaccard similarity is 500 / 1500
+        self.assertAlmostEqual(agreement, 1 / 3, delta=0.12)
+
+    def test_disjoint_sets_rarely_agree(self):
+        hashes = np.random.default_rng(0).choice(1 << 32, 2000, replace=False).astype('uint64')
+        first, second = hashes[:1000], hashes[1000:]
+        self.assertLess(np.mean(self.hasher.signature(first) == self.hasher.signature(second)), 0.05)
+
+    def test_seed_makes_signatures_reproducible(self):
+        hashes = np.arange(50, dtype='uint64')
+        np.testing.assert_array_equal(MinHasher(num_perm=16, seed=7).signature(hashes),
+                                      MinHasher(num_perm=16, seed=7).signature(hashes))
+
+    def test_empty_set(self):
+        signature = self.hasher.signature(np.empty(0, dtype='uint64'))
+        self.assertEqual(signature.shape, (128,))
+        self.assertTrue((signature == signature[0]).all())
+
+    def test_signatures_stacks_rows(self):
+        sets = [np.arange(10, dtype='uint64'), np.arange(5, 15, dtype='uint64')]
+        signatures = self.hasher.signatures(sets)
+        self.assertEqual(signatures.shape, (2, 128))
+        np.testing.assert_array_equal(signatures[1], self.hasher.signature(sets[1]))
+
+
+class ShingleTest(unittest.TestCase):
+    def test_renamed_copies_share_shingles(self):
+        first = shingle_hashes(ast_tokens("def f(a):\n    '''Doc.'''\n    return a + 1\n"), size=3)
+        second = shingle_hashes(ast_tokens("def g(b):\n    return b + 2\n"), size=3)
+        self.assertEqual(set(first), set(second))
+
+    def test_short_token_streams_have_no_shingles(self):
+        self.assertEqual(len(shingle_hashes(['Name', 'Load'], size=3)), 0)
+        self.assertEqual(ast_tokens("def f(:\n"), [])
+
+
+class LshTest(unittest.TestCase):
+    def test_matching_band_makes_a_candidate(self):
+        signatures = np.array([[1, 2, 3, 4], [1, 2, 9, 9], [7, 8, 9, 9], [5, 6, 7, 8]], dtype='uint32')
+        self.assertEqual(set(lsh_candidates(signatures, bands=2)), {(0, 1), (1, 2)})
+
+
+TOTAL = "def total(items):\n    result = 0\n    for item in items:\n        if item > 0:\n            result += item * 2\n    return result\n"
+# Same code with other names: an exact clone after normalization
+TOTAL_RENAMED = TOTAL.replace('items', 'values').replace('item', 'value').replace('result', 'acc')
+# Same shape with other constants, and the same with one more statement: near-duplicates
+SUMMED = TOTAL.replace('total', 'summed').replace('> 0', '> 1').replace('* 2', '* 3')
+SUMMED_PRINT = SUMMED.replace('    return result', '    print(result)\n    return result')
+LOAD = "def load(path):\n    with open(path) as f:\n        data = json.load(f)\n    return {k: v for k, v in data.items() if k}\n"
+TINY = "def f():\n    pass\n"
+CODES = [TOTAL, TOTAL_RENAMED, SUMMED, SUMMED_PRINT, LOAD, TINY]
+
+
+class DuplicateClustersTest(unittest.TestCase):
+    def test_near_duplicates_cluster_and_others_do_not(self):
+        clusters = duplicate_clusters(CODES)
+        self.assertEqual([members for members, _ in clusters], [[0, 1, 2, 3]])
+        self.assertTrue(0.5 <= clusters[0][1] <= 1.0)
+
+    def test_exact_clones_score_one(self):
+        self.assertEqual(duplicate_clusters([TOTAL, LOAD, TOTAL_RENAMED]), [([0, 2], 1.0)])
+
+    def test_small_functions_are_skipped(self):
+        self.assertEqual(duplicate_clusters([TINY, TINY]), [])
+
+    def test_embedding_verifies_candidates(self):
+        embedded = []
+
+        def embed(sources):
+            embedded.extend(sources)
+            # SUMMED_PRINT points away from the others
+            return np.array([[0.0, 1.0] if 'print' in source else [1.0, 0.1] for source in sources])
+
+        clusters = duplicate_clusters(CODES, embed=embed, threshold=0.9)
+        self.assertEqual([members for members, _ in clusters], [[0, 1, 2]])
+        # Only the representative of the exact clones is embedded
+        self.assertCountEqual(embedded, [TOTAL, SUMMED, SUMMED_PRINT])
+
+    def test_streamed_codes_are_read_back_through_fetch_sources(self):
+        fetched = []
+
+        def fetch_sources(indices):
+            fetched.extend(indices)
+            return [CODES[i] for i in indices]
+
+        clusters = duplicate_clusters(iter(CODES), embed=lambda sources: np.ones((len(sources), 2)),
+                                      fetch_sources=fetch_sources)
+        self.assertEqual([members for members, _ in clusters], [[0, 1, 2, 3]])
+        self.assertEqual(fetched, [0, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from services.discovery import GitIgnore, is_pruned, iter_files
+
+
+class GitIgnoreTest(unittest.TestCase):
+    def match(self, lines, relative, is_dir=False):
+        return GitIgnore('/repo', lines).match(os.path.join('/repo', relative), is_dir)
+
+    def test_unanchored_pattern_matches_at_any_depth(self):
+        self.assertTrue(self.match(['*.pyc'], 'a.pyc'))
+        self.assertTrue(self.match(['*.pyc'], 'pkg/sub/a.pyc'))
+        self.assertTrue(self.match(['generated'], 'pkg/generated', is_dir=True))
+
+    def test_leading_slash_anchors_to_the_gitignore_directory(self):
+        self.assertTrue(self.match(['/build'], 'build', is_dir=True))
+        self.assertIsNone(self.match(['/build'], 'pkg/build', is_dir=True))
+
+    def test_inner_slash_anchors_too(self):
+        self.assertTrue(self.match(['docs/build'], 'docs/build', is_dir=True))
+        self.assertIsNone(self.match(['docs/build'], 'pkg/docs/build', is_dir=True))
+
+    def test_trailing_slash_matches_directories_only(self):
+        self.assertTrue(self.match(['out/'], 'out', is_dir=True))
+        self.assertIsNone(self.match(['out/'], 'out'))
+
+    def test_negation_reincludes(self):
+        lines = ['*.py', '!keep.py']
+        self.assertTrue(self.match(lines, 'drop.py'))
+        self.assertFalse(self.match(lines, 'pkg/keep.py'))
+
+    def test_last_matching_pattern_wins(self):
+        self.assertTrue(self.match(['!keep.py', '*.py'], 'keep.py'))
+
+    def test_double_star(self):
+        self.assertTrue(self.match(['a/**/z.py'], 'a/z.py'))
+        self.assertTrue(self.match(['a/**/z.py'], 'a/b/c/z.py'))
+        self.assertIsNone(self.match(['a/*/z.py'], 'a/b/c/z.py'))
+
+    def test_comments_blank_lines_and_escapes(self):
+        lines = ['# comment', '', '\\#literal.py', '\\!bang.py']
+        self.assertIsNone(self.match(lines, 'comment'))
+        self.assertTrue(self.match(lines, '#literal.py'))
+        self.assertTrue(self.match(lines, '!bang.py'))
+
+
+class PruningTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        for path in ['pkg/build/mod.py', 'pkg/dist/mod.py', 'pkg/generated/gen.py', 'pkg/generated/keep.py',
+                     'node_modules/x.py', 'env/lib/site.py', 'out/o.py', 'main.py']:
+            self.write(path, '')
+        self.write('.gitignore', '/out/\npkg/generated/*\n!pkg/generated/keep.py\n')
+        self.write('env/pyvenv.cfg', 'home = /usr/bin\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, relative, text):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    def path(self, relative):
+        return os.path.join(self.root, relative)
+
+    def test_walk_keeps_packages_named_build_or_dist(self):
+        found = {os.path.relpath(path, self.root) for path in iter_files(self.root)}
+        self.assertEqual(found, {'main.py', 'pkg/build/mod.py', 'pkg/dist/mod.py',
+                                 os.path.join('pkg', 'generated', 'keep.py')})
+
+    def test_new_directories_are_judged_like_walk_judges_them(self):
+        roots = [self.root]
+        self.assertFalse(is_pruned(self.path('pkg/build'), roots))
+        self.assertTrue(is_pruned(self.path('node_modules'), roots))
+        self.assertTrue(is_pruned(self.path('env'), roots))
+        self.assertTrue(is_pruned(self.path('env/lib'), roots))
+        self.assertTrue(is_pruned(self.path('out'), roots))
+        self.assertTrue(is_pruned(self.path('out/o.py'), roots))
+
+    def test_files_follow_gitignore_negation(self):
+        roots = [self.root]
+        self.assertTrue(is_pruned(self.path('pkg/generated/gen.py'), roots))
+        self.assertFalse(is_pruned(self.path('pkg/generated/keep.py'), roots))
+
+    def test_root_is_never_pruned(self):
+        self.assertFalse(is_pruned(self.path('node_modules'), [self.path('node_modules')]))
+        self.assertFalse(is_pruned(self.path('node_modules/x.py'), [self.path('node_modules')]))
+
+    def test_missing_root_is_empty_without_a_warning(self):
+        with self.assertNoLogs(level='WARNING'):
+            self.assertEqual(list(iter_files(self.path('tst'))), [])
+
+    def test_unreadable_directory_is_reported(self):
+        with mock.patch('services.discovery.os.scandir', side_effect=PermissionError('denied')):
+            with self.assertLogs(level='WARNING') as logs:
+                self.assertEqual(list(iter_files(self.root)), [])
+        self.assertIn('Cannot list', logs.output[0])
+
+    def test_edited_gitignore_is_read_again(self):
+        self.assertFalse(is_pruned(self.path('main.py'), [self.root]))
+        self.write('.gitignore', 'main.py\n# longer, so the size changes too\n')
+        self.assertTrue(is_pruned(self.path('main.py'), [self.root]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from services.embedding import embed_batched, length_sorted_batches
+from tests.tiny_model import HIDDEN_SIZE, tiny_model_dir
+
+
+class LengthSortedBatchesTest(unittest.TestCase):
+    def test_batches_cover_every_index_once_in_length_order(self):
+        lengths = [5, 1, 9, 3, 7, 2, 8]
+        batches = list(length_sorted_batches(lengths, 3))
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        flat = [i for batch in batches for i in batch]
+        self.assertEqual(sorted(flat), list(range(len(lengths))))
+        self.assertEqual([lengths[i] for i in flat], sorted(lengths))
+
+    def test_no_lengths(self):
+        self.assertEqual(list(length_sorted_batches([], 4)), [])
+
+
+class EmbedBatchedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from transformers import AutoModel, AutoTokenizer
+
+        cls.tokenizer = AutoTokenizer.from_pretrained(tiny_model_dir())
+        cls.model = AutoModel.from_pretrained(tiny_model_dir())
+
+    def test_batched_matches_one_at_a_time(self):
+        snippets = ['def x ( ) : pass', 'x', 'for x in y : print ( x + 1 )', 'return None', 'x = y * 2']
+        batched = embed_batched(self.tokenizer, self.model, snippets, batch_size=2)
+        self.assertEqual(batched.shape, (len(snippets), HIDDEN_SIZE))
+        self.assertEqual(batched.dtype, np.float32)
+        for row, snippet in enumerate(snippets):
+            # Padding in a batch must not change a snippet's vector
+            single = embed_batched(self.tokenizer, self.model, [snippet], batch_size=1)[0]
+            np.testing.assert_allclose(batched[row], single, rtol=1e-4, atol=1e-5)
+
+    def test_empty_input(self):
+        self.assertEqual(embed_batched(self.tokenizer, self.model, []).shape, (0, HIDDEN_SIZE))
+
+
+if __name__ == '__main__':
+    unittest.main()
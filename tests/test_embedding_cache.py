@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.embedding_cache import EmbeddingCache, cache_key, cached_embed
+
+DIM = 4
+
+
+def _fill(directory, prefix, count):
+    cache = EmbeddingCache(directory, DIM, max_entries=10000)
+    for i in range(count):
+        cache.put_many([f'{prefix}{i}'], np.full((1, DIM), i, dtype='float32'))
+    cache.close()
+
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, max_entries=100):
+        cache = EmbeddingCache(self.directory.name, DIM, max_entries=max_entries)
+        self.addCleanup(cache.close)
+        return cache
+
+    def slots(self):
+        with sqlite3.connect(os.path.join(self.directory.name, f'index_{DIM}.sqlite')) as db:
+            return dict(db.execute('SELECT key, slot FROM entries'))
+
+    def test_round_trip(self):
+        cache = self.open()
+        vectors = np.arange(8, dtype='float32').reshape(2, DIM)
+        cache.put_many(['a', 'b'], vectors)
+        found = cache.get_many(['b', 'a', 'missing', 'a'])
+        self.assertEqual(set(found), {'a', 'b'})
+        np.testing.assert_array_equal(found['a'], vectors[0])
+        np.testing.assert_array_equal(found['b'], vectors[1])
+        self.assertEqual(len(cache), 2)
+
+    def test_rewriting_a_key_keeps_its_slot(self):
+        cache = self.open()
+        cache.put_many(['a', 'b'], np.zeros((2, DIM)))
+        before = self.slots()
+        cache.put_many(['a'], np.ones((1, DIM)))
+        self.assertEqual(self.slots(), before)
+        np.testing.assert_array_equal(cache.get_many(['a'])['a'], np.ones(DIM))
+
+    def test_evicts_the_least_recently_used_entry(self):
+        cache = self.open(max_entries=3)
+        for key in 'abc':
+            cache.put_many([key], np.zeros((1, DIM)))
+        cache.get_many(['a'])
+        cache.put_many(['d'], np.ones((1, DIM)))
+        self.assertEqual(set(self.slots()), {'a', 'c', 'd'})
+        self.assertEqual(sorted(self.slots().values()), [0, 1, 2])
+        self.assertLessEqual(os.path.getsize(os.path.join(self.directory.name, f'vectors_{DIM}.bin')), 3 * DIM * 4)
+
+    def test_lookups_do_not_wait_for_a_writer(self):
+        cache = self.open()
+        cache.put_many(['a'], np.ones((1, DIM)))
+        writer = sqlite3.connect(os.path.join(self.directory.name, f'index_{DIM}.sqlite'), isolation_level=None)
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            cache.db.execute('PRAGMA busy_timeout = 100')
+            self.assertEqual(set(cache.get_many(['a'])), {'a'})
+        finally:
+            writer.execute('ROLLBACK')
+            writer.close()
+
+    def test_concurrent_writers_get_distinct_slots(self):
+        processes = [multiprocessing.Process(target=_fill, args=(self.directory.name, f'p{n}-', 50)) for n in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        slots = self.slots()
+        self.assertEqual(len(slots), 200)
+        self.assertEqual(sorted(slots.values()), list(range(200)))
+        found = self.open(max_entries=10000).get_many(list(slots))
+        for key, vector in found.items():
+            np.testing.assert_array_equal(vector, np.full(DIM, int(key.split('-')[1])))
+
+
+class CachedEmbedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(self.directory.name, DIM)
+        self.calls = []
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def embed(self, snippets):
+        self.calls.append(list(snippets))
+        return np.array([[len(snippet)] * DIM for snippet in snippets], dtype='float32')
+
+    def test_only_misses_are_embedded(self):
+        first = cached_embed(self.cache, ['def f(a):\n    return a + 1\n'], self.embed, 'm')
+        second = cached_embed(self.cache, ['def f(a):\n    return a + 1\n', 'x = 1'], self.embed, 'm')
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.calls[1], ['x = 1'])
+        np.testing.assert_array_equal(first[0], second[0])
+
+    def test_clones_are_embedded_once(self):
+        cached_embed(self.cache, ['def f(a):\n    return a + 1\n', 'def g(b):\n    return b + 1\n'], self.embed, 'm')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(self.calls[0]), 1)
+
+    def test_store_false_leaves_the_cache_alone(self):
+        cached_embed(self.cache, ['x = 1'], self.embed, 'm', store=False)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.get_many([cache_key('x = 1', 'm')]), {})
+
+    def test_formatting_only_edits_share_a_key(self):
+        self.assertEqual(cache_key('    x = 1   \n\n', 'm'), cache_key('x = 1', 'm'))
+        self.assertNotEqual(cache_key('x = 1', 'm'), cache_key('x = 1', 'other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from config.settings import EXTRACTION
+from services.discovery import read_file
+from services.extraction import clear_records, extract_files, extract_source, extract_stream, read_sources
+
+SOURCE = '''import os
+
+
+class Shape:
+    def area(self):
+        return helper(self.width) * 2
+
+    async def load(self, path):
+        return await os.fspath(path)
+
+
+def helper(x):
+    def inner():
+        return x
+    return inner()
+'''
+
+
+class ExtractSourceTest(unittest.TestCase):
+    def test_definitions_and_calls(self):
+        record = extract_source('shapes.py', SOURCE.encode('utf-8'), 5, 6)
+        self.assertIsNone(record.error)
+        self.assertEqual((record.mtime_ns, record.size), (5, 6))
+        self.assertEqual([(d.name, d.qualname, d.is_async, d.lineno, d.end_lineno) for d in record.defs], [
+            ('area', 'Shape.area', False, 5, 6),
+            ('load', 'Shape.load', True, 8, 9),
+            ('helper', 'helper', False, 12, 15),
+            ('inner', 'helper.<locals>.inner', False, 13, 14),
+        ])
+        self.assertEqual(set(record.calls), {'helper', 'fspath', 'inner'})
+
+    def test_offsets_slice_the_source(self):
+        data = '# é\n\ndef f():\n    return "ü"\n'.encode('utf-8')
+        record = extract_source('f.py', data)
+        self.assertEqual(read_sources(record, data), ['def f():\n    return "ü"'])
+
+    def test_syntax_errors_are_recorded(self):
+        record = extract_source('bad.py', b'def f(:\n')
+        self.assertEqual(record.defs, ())
+        self.assertTrue(record.error.startswith('SyntaxError'))
+
+
+class ExtractFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = []
+        for n in range(6):
+            path = os.path.join(self.directory.name, f'm{n}.py')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(f'def f{n}():\n    return {n}\n')
+            self.paths.append(path)
+        clear_records()
+
+    def tearDown(self):
+        clear_records()
+        self.directory.cleanup()
+
+    def names(self, records):
+        return [[d.name for d in record.defs] for record in records]
+
+    def test_records_come_back_in_input_order(self):
+        paths = self.paths[::-1] + self.paths[:1]
+        self.assertEqual(self.names(extract_files(paths, workers=1)), [[f'f{n}'] for n in (5, 4, 3, 2, 1, 0, 0)])
+
+    def test_pool_gives_the_same_records(self):
+        with mock.patch.dict(EXTRACTION, min_pool_files=2):
+            pooled = extract_files(self.paths, workers=2)
+        clear_records()
+        self.assertEqual(pooled, extract_files(self.paths, workers=1))
+
+    def test_changed_files_are_parsed_again(self):
+        extract_files(self.paths, workers=1)
+        with open(self.paths[0], 'w', encoding='utf-8') as file:
+            file.write('def changed_name():\n    return 0\n')
+        self.assertEqual(self.names(extract_files(self.paths[:1], workers=1)), [['changed_name']])
+
+    def test_stream_keeps_order_in_and_out_of_the_pool(self):
+        sources = [read_file(path) for path in self.paths]
+        with mock.patch.dict(EXTRACTION, min_pool_files=3):
+            streamed = list(extract_stream(iter(sources), workers=2))
+        self.assertEqual([record.path for record, _ in streamed], self.paths)
+        self.assertEqual([data for _, data in streamed], [source.data for source in sources])
+        self.assertEqual(self.names(record for record, _ in streamed), [[f'f{n}'] for n in range(6)])
+
+
+if __name__ == '__main__':
+    unittest.main()
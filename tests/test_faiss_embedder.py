@@ -0,0 +1,185 @@
+import os
+import tempfile
+import unittest
+
+import faiss
+
+from services.embedding_cache import EmbeddingCache
+from services.vector_index import load_index
+from tests.tiny_model import HIDDEN_SIZE, tiny_model_dir
+from utils.synthetic_repo import generate_repo
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+class FaissEmbedderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.small = os.path.join(cls.directory.name, 'small')
+        write(os.path.join(cls.small, 'one.py'), 'def double(x):\n    y = x * 2\n    return y + 1\n')
+        cls.large = os.path.join(cls.directory.name, 'large')
+        cls.large_functions = generate_repo(cls.large, files=12, functions_per_file=10, mean_lines=4, seed=1)['functions']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def embedder(self, **options):
+        from test.faiss_test import FaissEmbedder
+
+        cache = EmbeddingCache(tempfile.mkdtemp(dir=self.directory.name), HIDDEN_SIZE)
+        embedder = FaissEmbedder(model_name=tiny_model_dir(), cache=cache, quantized=False, **options)
+        self.addCleanup(cache.close)
+        self.addCleanup(embedder.close)
+        return embedder
+
+    def test_trained_index_is_built_from_every_project(self):
+        embedder = self.embedder(index_type='ivf_flat', keep_embeddings=True)
+        embedder.ingest_project(self.small)
+        embedder.ingest_project(self.large)
+        self.assertIsNone(embedder.index)
+        target = os.path.join(self.directory.name, 'two-projects')
+        embedder.save_index(target)
+
+        index, metadata = load_index(target, mmap=False)
+        self.assertEqual(metadata['index_type'], 'ivf_flat')
+        self.assertEqual(index.ntotal, len(embedder.functions))
+        ivf = faiss.extract_index_ivf(index)
+        self.assertTrue(ivf.is_trained)
+        # Trained on the whole corpus, not on the first project's single function
+        self.assertEqual(ivf.nlist, len(embedder.functions) // 39)
+        self.assertGreater(embedder.report_recall(k=5), 0.5)
+
+    def test_small_corpus_is_saved_as_what_was_built(self):
+        embedder = self.embedder(index_type='ivf_flat')
+        embedder.ingest_project(self.small)
+        target = os.path.join(self.directory.name, 'small-index')
+        embedder.save_index(target)
+        self.assertEqual(load_index(target)[1]['index_type'], 'flat')
+
+    def test_search_builds_the_index(self):
+        embedder = self.embedder(index_type='ivf_flat')
+        embedder.ingest_project(self.large)
+        matches = embedder.compare_function_similarity(open(os.path.join(self.small, 'one.py')).read(), top_k=3)
+        self.assertEqual(len(matches), 3)
+        self.assertIsNotNone(embedder.index)
+
+    def test_saved_index_answers_like_the_live_one(self):
+        embedder = self.embedder()
+        embedder.ingest_project(self.large)
+        target = os.path.join(self.directory.name, 'saved')
+        embedder.save_index(target)
+        query = 'def f(x):\n    return x + 1\n'
+        live = embedder.compare_function_similarity(query, top_k=5)
+
+        loaded = self.embedder()
+        loaded.load_index(target)
+        self.assertEqual(loaded.mapped_from, target)
+        self.assertEqual(len(loaded.functions), self.large_functions)
+        self.assertEqual([name for name, _ in loaded.compare_function_similarity(query, top_k=5)],
+                         [name for name, _ in live])
+        # A mapped index is read into memory before it changes
+        loaded.ingest_project(self.small)
+        loaded.flush_index()
+        self.assertIsNone(loaded.mapped_from)
+        self.assertEqual(loaded.index.ntotal, self.large_functions + 1)
+
+
+def function(name, factor):
+    return (f"def {name}(values):\n    total = 0\n    for value in values:\n"
+            f"        if value > {factor}:\n            total += value * {factor}\n    return total\n")
+
+
+class UpdatableIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.project = os.path.join(self.directory.name, 'project')
+        self.paths = {}
+        for name, factor in (('alpha', 2), ('beta', 3), ('gamma', 4)):
+            self.paths[name] = os.path.join(self.project, f'{name}.py')
+            write(self.paths[name], function(f'{name}_one', factor) + '\n\n' + function(f'{name}_two', factor + 10))
+
+    def embedder(self, **options):
+        from test.faiss_test import FaissEmbedder
+
+        cache = EmbeddingCache(tempfile.mkdtemp(dir=self.directory.name), HIDDEN_SIZE)
+        embedder = FaissEmbedder(model_name=tiny_model_dir(), cache=cache, quantized=False, **options)
+        self.addCleanup(cache.close)
+        self.addCleanup(embedder.close)
+        return embedder
+
+    def indexed_names(self, embedder):
+        matches = embedder.search_functions(embedder.calculate_embeddings([function('query', 5)], store=False), 100)
+        return sorted((match['name'], match['file']) for match in matches[0])
+
+    def test_hnsw_is_rejected_before_ingestion(self):
+        with self.assertRaises(ValueError):
+            self.embedder(index_type='hnsw', updatable=True)
+
+    def test_removal_needs_an_updatable_index(self):
+        embedder = self.embedder()
+        embedder.ingest_project(self.project)
+        with self.assertRaises(RuntimeError):
+            embedder.remove_paths([self.paths['alpha']])
+
+    def test_sync_replaces_changed_and_deleted_files(self):
+        embedder = self.embedder(updatable=True)
+        embedder.ingest_project(self.project)
+        self.assertEqual(len(self.indexed_names(embedder)), 6)
+
+        write(self.paths['alpha'], function('alpha_new', 7))
+        os.remove(self.paths['beta'])
+        self.assertEqual(embedder.sync_paths([self.paths['alpha'], self.paths['beta']], roots=[self.project]), (4, 1))
+        expected = [('alpha_new', self.paths['alpha']), ('gamma_one', self.paths['gamma']),
+                    ('gamma_two', self.paths['gamma'])]
+        self.assertEqual(self.indexed_names(embedder), expected)
+        # Removed rows stay in the store until compacted
+        self.assertEqual(len(embedder.functions), 7)
+
+        self.assertEqual(embedder.compact(), 4)
+        self.assertEqual(len(embedder.functions), 3)
+        self.assertEqual(embedder.compact(), 0)
+        self.assertEqual(self.indexed_names(embedder), expected)
+        self.assertEqual(embedder.file_rows, embedder.functions.rows_by_file())
+
+    def test_sync_skips_pruned_directories(self):
+        embedder = self.embedder(updatable=True)
+        embedder.ingest_project(self.project)
+        vendored = os.path.join(self.project, 'node_modules', 'lib.py')
+        write(vendored, function('vendored', 9))
+        added = os.path.join(self.project, 'pkg', 'delta.py')
+        write(added, function('delta', 8))
+        self.assertEqual(embedder.sync_paths([os.path.dirname(vendored), os.path.dirname(added)],
+                                             roots=[self.project]), (0, 1))
+        self.assertNotIn(('vendored', vendored), self.indexed_names(embedder))
+
+    def test_removing_a_directory_removes_its_files(self):
+        embedder = self.embedder(updatable=True)
+        write(os.path.join(self.project, 'pkg', 'delta.py'), function('delta', 8))
+        embedder.ingest_project(self.project)
+        self.assertEqual(embedder.remove_paths([os.path.join(self.project, 'pkg')]), 1)
+        self.assertEqual(len(self.indexed_names(embedder)), 6)
+
+    def test_snapshot_is_compacted_and_reloads(self):
+        embedder = self.embedder(updatable=True)
+        embedder.ingest_project(self.project)
+        embedder.remove_paths([self.paths['gamma']])
+        target = os.path.join(self.directory.name, 'snapshot')
+        embedder.snapshot(target)
+        embedder.snapshot(target)
+        self.assertTrue(os.path.islink(target))
+
+        loaded = self.embedder(updatable=True)
+        loaded.load_index(target)
+        self.assertEqual(len(loaded.functions), 4)
+        self.assertEqual(self.indexed_names(loaded), self.indexed_names(embedder))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.function_store import FunctionStore, StringTable
+
+SOURCE = 'def first():\n    return 1\n\n\ndef second(x):\n    return "é" + x\n'
+
+
+class StringTableTest(unittest.TestCase):
+    def test_intern_reuses_ids_and_survives_a_round_trip(self):
+        table = StringTable()
+        ids = [table.intern(string) for string in ('a', 'ünï', 'a', '')]
+        self.assertEqual(ids, [0, 1, 0, 2])
+        with tempfile.TemporaryDirectory() as directory:
+            table.save(directory)
+            loaded = StringTable.load(directory)
+            self.assertEqual([loaded[i] for i in range(len(loaded))], ['a', 'ünï', ''])
+            with self.assertRaises(ValueError):
+                loaded.intern('b')
+            writable = loaded.writable()
+            self.assertEqual(writable.intern('ünï'), 1)
+            self.assertEqual(writable.intern('b'), 3)
+
+
+class FunctionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'module.py')
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(SOURCE)
+        data = SOURCE.encode('utf-8')
+        second = data.index(b'def second')
+        self.store = FunctionStore()
+        self.store.append('first', self.path, 1, 2, 0, data.index(b'\n\n\n') + 1)
+        self.store.append('second', self.path, 5, 6, second, len(data))
+        self.store.append('snippet')
+        self.store.vectors = np.arange(6, dtype='float32').reshape(3, 2)
+
+    def test_rows_and_sources(self):
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.get(1, with_source=True),
+                         {'name': 'second', 'file': self.path, 'lineno': 5, 'end_lineno': 6,
+                          'code': 'def second(x):\n    return "é" + x\n'})
+        self.assertIsNone(self.store.file(2))
+        self.assertEqual(self.store.sources([1, 2, 0]), [self.store.source(1), None, 'def first():\n    return 1\n'])
+        self.assertEqual(list(self.store.iter_sources(block_size=1)), self.store.sources([0, 1, 2]))
+
+    def test_round_trip_is_memory_mapped_and_read_only(self):
+        target = os.path.join(self.directory.name, 'store')
+        self.store.save(target)
+        loaded = FunctionStore.load(target)
+        self.assertIsInstance(loaded.columns['name'], np.memmap)
+        self.assertIsInstance(loaded.vectors, np.memmap)
+        self.assertEqual([loaded.get(row, with_source=True) for row in range(3)],
+                         [self.store.get(row, with_source=True) for row in range(3)])
+        np.testing.assert_array_equal(loaded.vectors, self.store.vectors)
+        with self.assertRaises(ValueError):
+            loaded.vectors[0, 0] = 1
+
+        in_memory = FunctionStore.load(target, mmap=False)
+        self.assertNotIsInstance(in_memory.vectors, np.memmap)
+
+    def test_writable_copies_a_loaded_store(self):
+        target = os.path.join(self.directory.name, 'store')
+        self.store.save(target)
+        loaded = FunctionStore.load(target)
+        writable = loaded.writable()
+        self.assertIs(writable.writable(), writable)
+        self.assertEqual(writable.append('third', self.path, 9, 9), 3)
+        self.assertEqual(writable.file(3), self.path)
+        self.assertEqual(len(loaded), 3)
+        writable.vectors[0, 0] = 100
+        self.assertEqual(loaded.vectors[0, 0], 0)
+
+    def test_subset_keeps_the_given_row_order(self):
+        subset = self.store.subset([2, 0])
+        self.assertEqual([subset.name(row) for row in range(2)], ['snippet', 'first'])
+        self.assertEqual(subset.source(1), self.store.source(0))
+        np.testing.assert_array_equal(subset.vectors, [[4, 5], [0, 1]])
+        self.assertEqual(len(self.store.subset([])), 0)
+
+    def test_grouping_helpers(self):
+        self.assertEqual(self.store.rows_by_file(), {self.path: [0, 1], None: [2]})
+        self.assertEqual(self.store.rows_by_file([1]), {self.path: [1]})
+        self.assertEqual(self.store.rows_by_span()[(self.path, 0)], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.embedding import embed_batched
+from services.extraction import iter_python_files
+from services.inference import ReplicaPool, embedding_function, pipeline_embed_function
+from services.pipeline import stream_embeddings
+from tests.tiny_model import HIDDEN_SIZE, tiny_model_dir
+from utils.synthetic_repo import generate_repo
+
+
+class ReplicaPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from transformers import AutoModel, AutoTokenizer
+
+        cls.tokenizer = AutoTokenizer.from_pretrained(tiny_model_dir())
+        cls.model = AutoModel.from_pretrained(tiny_model_dir()).eval()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.repo = os.path.join(cls.directory.name, 'repo')
+        generate_repo(cls.repo, files=4, functions_per_file=5, mean_lines=4, seed=4)
+        cls.files = list(iter_python_files(cls.repo))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_replicas_embed_like_the_parent_in_input_order(self):
+        snippets = ['def x ( ) : pass', 'x', 'for x in y : print ( x + 1 )', 'return None', 'x = y * 2']
+        with ReplicaPool(self.tokenizer, self.model, replicas=2, batch_size=2) as pool:
+            np.testing.assert_allclose(pool(snippets), embed_batched(self.tokenizer, self.model, snippets, 2),
+                                       rtol=1e-4, atol=1e-5)
+            self.assertEqual(pool([]).shape, (0, HIDDEN_SIZE))
+
+    def test_pipeline_embeds_through_the_replica_pool(self):
+        calls = []
+        with ReplicaPool(self.tokenizer, self.model, replicas=2) as pool:
+            def embed_fn(snippets):
+                calls.append(len(snippets))
+                return pool(snippets)
+
+            pooled = {(path, function.lineno): vector
+                      for ids, vectors, _ in stream_embeddings(iter(self.files), self.tokenizer, self.model, 'tiny',
+                                                               skip_trivial=False, embed_fn=embed_fn)
+                      for (path, function), vector in zip(ids, vectors)}
+        local = {(path, function.lineno): vector
+                 for ids, vectors, _ in stream_embeddings(iter(self.files), self.tokenizer, self.model, 'tiny',
+                                                          skip_trivial=False)
+                 for (path, function), vector in zip(ids, vectors)}
+        self.assertTrue(calls)
+        self.assertEqual(sum(calls), len(local))
+        self.assertEqual(set(pooled), set(local))
+        for key, vector in local.items():
+            np.testing.assert_allclose(pooled[key], vector, rtol=1e-4, atol=1e-5)
+
+    def test_only_a_pool_replaces_the_pipeline_stages(self):
+        embed_fn = embedding_function(self.tokenizer, self.model, replicas=0)
+        self.assertIsNone(pipeline_embed_function(embed_fn))
+        with ReplicaPool(self.tokenizer, self.model, replicas=2) as pool:
+            self.assertIs(pipeline_embed_function(pool), pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from utils.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_timers_keep_count_total_and_longest(self):
+        self.metrics.observe('forward', 0.5)
+        self.metrics.observe('forward', 1.5)
+        with self.metrics.timer('read'):
+            pass
+        timers = self.metrics.snapshot()['timers']
+        self.assertEqual(timers['forward'], {'count': 2, 'seconds': 2.0, 'max_seconds': 1.5})
+        self.assertEqual(timers['read']['count'], 1)
+
+    def test_timer_is_shared_safely_between_threads(self):
+        timed = self.metrics.timer('stage')
+
+        @timed
+        def work():
+            self.metrics.count('items')
+
+        threads = [threading.Thread(target=lambda: [work() for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'items': 400})
+        self.assertEqual(snapshot['timers']['stage']['count'], 400)
+        self.assertIs(self.metrics.timer('stage'), timed)
+
+    def test_prometheus_text_format(self):
+        self.metrics.count('cache.hits', 3)
+        self.metrics.observe('index.add', 0.25)
+        self.assertEqual(self.metrics.to_prometheus(), (
+            "# TYPE rome_cache_hits_total counter\n"
+            "rome_cache_hits_total 3\n"
+            "# TYPE rome_index_add_seconds summary\n"
+            "rome_index_add_seconds_count 1\n"
+            "rome_index_add_seconds_sum 0.250000000\n"
+            "# TYPE rome_index_add_max_seconds gauge\n"
+            "rome_index_add_max_seconds 0.250000000\n"
+        ))
+
+    def test_dump_picks_the_format_from_the_extension(self):
+        self.metrics.count('walk.files', 2)
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('metrics.prom', 'metrics.json'):
+                self.metrics.dump(os.path.join(directory, name))
+            with open(os.path.join(directory, 'metrics.prom'), encoding='utf-8') as file:
+                self.assertIn('rome_walk_files_total 2\n', file.read())
+            with open(os.path.join(directory, 'metrics.json'), encoding='utf-8') as file:
+                self.assertEqual(json.load(file)['counters'], {'walk.files': 2})
+
+    def test_reset(self):
+        self.metrics.count('x')
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot(), {'counters': {}, 'timers': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
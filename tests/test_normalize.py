@@ -0,0 +1,104 @@
+import ast
+import unittest
+
+from services.extraction import extract_source
+from services.normalize import body_nodes, fingerprint, is_trivial, normalize_function
+
+
+class NormalizeFunctionTest(unittest.TestCase):
+    def test_renames_bound_names_in_order_of_appearance(self):
+        normalized = normalize_function(
+            "def area(width, height):\n"
+            "    result = width * height\n"
+            "    return round(result)\n")
+        self.assertEqual(normalized.source, "def v0(v1, v2):\n    v3 = v1 * v2\n    return round(v3)")
+
+    def test_keeps_globals_attributes_and_keywords(self):
+        normalized = normalize_function(
+            "def load(path):\n"
+            "    return json.loads(open(path).read(), strict=STRICT)\n")
+        self.assertEqual(normalized.source, "def v0(v1):\n    return json.loads(open(v1).read(), strict=STRICT)")
+
+    def test_keeps_names_declared_global(self):
+        normalized = normalize_function(
+            "def bump():\n"
+            "    global counter\n"
+            "    counter = counter + 1\n"
+            "    step = 1\n"
+            "    return step\n")
+        self.assertIn("global counter\n    counter = counter + 1", normalized.source)
+        self.assertIn("v1 = 1", normalized.source)
+
+    def test_keeps_names_declared_nonlocal(self):
+        normalized = normalize_function(
+            "    def inner():\n"
+            "        nonlocal total\n"
+            "        total += 1\n")
+        self.assertEqual(normalized.source, "def v0():\n    nonlocal total\n    total += 1")
+
+    def test_strips_docstrings_and_comments(self):
+        documented = normalize_function(
+            "def f(x):\n"
+            "    '''Double x.'''\n"
+            "    def g(y):\n"
+            "        '''Inner.'''\n"
+            "        return y  # comment\n"
+            "    return g(x) * 2\n")
+        bare = normalize_function("def f(x):\n    def g(y):\n        return y\n    return g(x) * 2\n")
+        self.assertEqual(documented.source, bare.source)
+        self.assertNotIn('Double', documented.source)
+
+    def test_docstring_only_body_becomes_pass(self):
+        normalized = normalize_function("def f():\n    '''Nothing yet.'''\n")
+        self.assertEqual(normalized.source, "def v0():\n    pass")
+        self.assertEqual(normalized.body_nodes, 1)
+
+    def test_clones_share_a_fingerprint(self):
+        original = "def total(items):\n    s = 0\n    for item in items:\n        s += item\n    return s\n"
+        renamed = "def add_all(values):\n    # running sum\n    acc = 0\n    for v in values:\n        acc += v\n    return acc\n"
+        self.assertEqual(fingerprint(original), fingerprint(renamed))
+        self.assertNotEqual(fingerprint(original), fingerprint(renamed.replace('acc += v', 'acc -= v')))
+
+    def test_unparsable_code(self):
+        self.assertIsNone(normalize_function("def f(:\n"))
+        self.assertIsNone(fingerprint("def f(:\n"))
+        self.assertFalse(is_trivial(None))
+
+
+class TrivialTest(unittest.TestCase):
+    def test_thresholds(self):
+        getter = normalize_function("def name(self):\n    return self._name\n")
+        # Return, Attribute, Name
+        self.assertEqual(getter.body_nodes, 3)
+        self.assertTrue(is_trivial(getter, max_nodes=3))
+        self.assertFalse(is_trivial(getter, max_nodes=2))
+        self.assertTrue(is_trivial(normalize_function("def f():\n    pass\n"), max_nodes=1))
+
+    def test_extraction_counts_like_normalization(self):
+        source = (
+            "class A:\n"
+            "    def name(self):\n"
+            "        '''The name.'''\n"
+            "        return self._name\n"
+            "\n"
+            "    def todo(self):\n"
+            "        '''Later.'''\n"
+            "\n"
+            "def outer(x):\n"
+            "    def inner(y):\n"
+            "        '''Kept in the count.'''\n"
+            "        return y + x\n"
+            "    return inner(1)\n")
+        record = extract_source('a.py', source.encode('utf-8'))
+        data = source.encode('utf-8')
+        for function in record.defs:
+            code = data[function.start_offset:function.end_offset].decode('utf-8')
+            self.assertEqual(function.body_nodes, normalize_function(code).body_nodes, function.qualname)
+
+    def test_body_nodes_of_a_definition(self):
+        definition = ast.parse("def f():\n    '''Doc.'''\n    return 1\n").body[0]
+        self.assertEqual(body_nodes(definition), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import itertools
+import threading
+import time
+import unittest
+
+from services.pipeline import run_pipeline
+
+
+def double(items):
+    for item in items:
+        yield item * 2
+
+
+def pairs(items):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == 2:
+            yield tuple(batch)
+            batch = []
+    if batch:
+        yield tuple(batch)
+
+
+class RunPipelineTest(unittest.TestCase):
+    def test_single_workers_keep_order(self):
+        self.assertEqual(list(run_pipeline(range(7), [(double, 1), (pairs, 1)])),
+                         [(0, 2), (4, 6), (8, 10), (12,)])
+
+    def test_several_workers_process_every_item_once(self):
+        results = list(run_pipeline(range(200), [(double, 4), (double, 3)]))
+        self.assertEqual(sorted(results), [item * 4 for item in range(200)])
+
+    def test_stage_error_is_raised_to_the_consumer(self):
+        def explode(items):
+            for item in items:
+                if item == 5:
+                    raise ValueError('stage failed')
+                yield item
+
+        with self.assertRaisesRegex(ValueError, 'stage failed'):
+            list(run_pipeline(range(100), [(explode, 2), (double, 1)]))
+
+    def test_source_error_is_raised_to_the_consumer(self):
+        def source():
+            yield 1
+            raise OSError('cannot list')
+
+        with self.assertRaisesRegex(OSError, 'cannot list'):
+            list(run_pipeline(source(), [(double, 1)]))
+
+    def test_closing_the_consumer_stops_every_stage(self):
+        before = threading.active_count()
+        results = run_pipeline(itertools.count(), [(double, 2), (double, 1)], queue_size=4)
+        self.assertEqual(next(results) % 4, 0)
+        results.close()
+        self.assertEqual(threading.active_count(), before)
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith('pipeline-')])
+
+    def test_bounded_queues_hold_back_the_source(self):
+        produced = []
+
+        def source():
+            for item in range(10000):
+                produced.append(item)
+                yield item
+
+        results = run_pipeline(source(), [(double, 1), (double, 1)], queue_size=2)
+        next(results)
+        # Wait until the stages stall on the full queues
+        time.sleep(0.5)
+        # Three queues of two, one item held by each thread, and the one consumed
+        self.assertLess(len(produced), 20)
+        results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import io
+import os
+import pstats
+import tempfile
+import threading
+import unittest
+
+from utils.profiling import ThreadProfiler
+
+
+def work_in_thread():
+    return sum(i * i for i in range(1000))
+
+
+def work_in_main():
+    return sorted(range(1000), reverse=True)
+
+
+def profiled_functions(stats):
+    return {name for _, _, name in stats.stats}
+
+
+class ThreadProfilerTest(unittest.TestCase):
+    def run_profiled(self):
+        profiler = ThreadProfiler()
+        profiler.enable()
+        try:
+            work_in_main()
+            threads = [threading.Thread(target=work_in_thread) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            profiler.disable()
+        return profiler
+
+    def test_threads_started_while_enabled_are_profiled(self):
+        stats = self.run_profiled().stats()
+        self.assertTrue({'work_in_main', 'work_in_thread'} <= profiled_functions(stats))
+        calls = {name: entry[1] for (_, _, name), entry in stats.stats.items()}
+        self.assertEqual(calls['work_in_thread'], 3)
+
+    def test_threads_started_after_disable_are_not(self):
+        self.run_profiled()
+        self.assertIsNone(threading.getprofile())
+
+    def test_dump_stats_writes_a_pstats_file(self):
+        profiler = self.run_profiled()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.prof')
+            profiler.dump_stats(path)
+            stats = pstats.Stats(path, stream=io.StringIO())
+        self.assertIn('work_in_thread', profiled_functions(stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from services.embedding_cache import EmbeddingCache
+from tests.tiny_model import HIDDEN_SIZE, tiny_model_dir
+from utils.synthetic_repo import generate_repo
+
+
+class FunctionSimilarityModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.repo = os.path.join(cls.directory.name, 'repo')
+        generate_repo(cls.repo, files=6, functions_per_file=6, mean_lines=4, seed=2)
+        cls.other_repo = os.path.join(cls.directory.name, 'other')
+        generate_repo(cls.other_repo, files=3, functions_per_file=4, mean_lines=4, seed=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def model(self, repos=None):
+        from test.repo_similarity_test import FunctionSimilarityModel
+
+        cache = EmbeddingCache(tempfile.mkdtemp(dir=self.directory.name), HIDDEN_SIZE)
+        model = FunctionSimilarityModel(repos or [self.repo], model_name=tiny_model_dir(), cache=cache, quantized=False)
+        self.addCleanup(cache.close)
+        self.addCleanup(model.close)
+        return model
+
+    def indexed_model(self):
+        model = self.model()
+        model.collect_code()
+        model.extract_functions()
+        model.generate_embeddings()
+        return model
+
+    def test_batch_matches_single_queries(self):
+        model = self.indexed_model()
+        queries = ['def f(x):\n    return x + 1\n', 'def g(self):\n    for y in self:\n        print(y)\n']
+        batch = model.find_similar_functions_batch(queries, top_n=4)
+        self.assertEqual(len(batch), 2)
+        for query, results in zip(queries, batch):
+            single = model.find_similar_functions(query, top_n=4)
+            self.assertEqual([(r['file'], r['lineno']) for r in results], [(r['file'], r['lineno']) for r in single])
+            self.assertEqual(len(results), 4)
+            self.assertTrue(all(results[i]['similarity'] >= results[i + 1]['similarity'] for i in range(3)))
+
+    def test_queries_are_not_cached(self):
+        model = self.indexed_model()
+        cached = len(model.cache)
+        model.find_similar_functions_batch(['def novel(x):\n    return x * 2 + 1\n'], top_n=1)
+        self.assertEqual(len(model.cache), cached)
+
+    def test_an_indexed_function_finds_itself(self):
+        model = self.indexed_model()
+        source = model.functions.source(0)
+        best = model.find_similar_functions(source, top_n=1)[0]
+        self.assertEqual((best['file'], best['lineno']), (model.functions.file(0), model.functions.get(0)['lineno']))
+        self.assertAlmostEqual(best['similarity'], 1.0, places=4)
+
+    def test_shards_are_rebuilt_only_when_their_repository_changes(self):
+        shards = tempfile.mkdtemp(dir=self.directory.name)
+        model = self.model([self.repo, self.other_repo])
+        self.assertEqual(model.build_shards(shards), [self.repo, self.other_repo])
+        self.assertEqual(model.build_shards(shards), [])
+        with open(os.path.join(self.other_repo, 'added.py'), 'w', encoding='utf-8') as file:
+            file.write('def added(x):\n    return [y for y in x if y]\n')
+        self.addCleanup(os.remove, os.path.join(self.other_repo, 'added.py'))
+        self.assertEqual(model.build_shards(shards), [self.other_repo])
+
+        model.load_shards(shards)
+        query = 'def added(x):\n    return [y for y in x if y]\n'
+        best = model.find_similar_functions(query, top_n=1)[0]
+        self.assertEqual((best['repo'], best['name']), (self.other_repo, 'added'))
+        only_first = model.find_similar_functions_batch([query], top_n=5, repos=[self.repo])[0]
+        self.assertEqual({match['repo'] for match in only_first}, {self.repo})
+
+
+if __name__ == '__main__':
+    unittest.main()
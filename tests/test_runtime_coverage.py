@@ -0,0 +1,92 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+from services.runtime_coverage import RuntimeCoverage, monitoring_available
+
+MODULE = '''
+import time
+
+
+def called():
+    return 1
+
+
+def never():
+    return 2
+
+
+def recursive(n):
+    if n:
+        return recursive(n - 1)
+    time.sleep(0.01)
+    return 0
+
+
+def numbers():
+    yield 1
+    yield 2
+
+
+class Box:
+    def open(self):
+        return called()
+'''
+
+
+@unittest.skipUnless(monitoring_available(), "sys.monitoring needs Python 3.12")
+class RuntimeCoverageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        path = os.path.join(self.directory.name, 'sample.py')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(MODULE)
+        spec = importlib.util.spec_from_file_location('sample', path)
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+
+    def exercise(self):
+        for _ in range(3):
+            self.module.called()
+        self.module.recursive(2)
+        list(self.module.numbers())
+        self.module.Box().open()
+
+    def test_records_each_function_that_ran_once(self):
+        with RuntimeCoverage(self.directory.name) as collector:
+            self.exercise()
+        self.assertEqual(collector.results(), {
+            'sample.called': (1, None), 'sample.recursive': (1, None),
+            'sample.numbers': (1, None), 'sample.Box.open': (1, None),
+        })
+
+    def test_timing_counts_calls_and_times_outermost_activations(self):
+        with RuntimeCoverage(self.directory.name, timing=True) as collector:
+            self.exercise()
+        results = collector.results()
+        self.assertEqual({name: calls for name, (calls, _) in results.items()}, {
+            'sample.called': 4, 'sample.recursive': 3, 'sample.numbers': 1, 'sample.Box.open': 1,
+        })
+        self.assertGreaterEqual(results['sample.recursive'][1], 0.01)
+        self.assertLess(results['sample.recursive'][1], 1)
+
+    def test_excluded_directories_and_other_files_are_ignored(self):
+        with RuntimeCoverage(self.directory.name, exclude_dirs=[self.directory.name]) as collector:
+            self.exercise()
+        self.assertEqual(collector.results(), {})
+
+    def test_tool_id_is_released_and_events_rearmed(self):
+        with RuntimeCoverage(self.directory.name):
+            self.module.called()
+        self.assertFalse(any(sys.monitoring.get_tool(tool_id) == 'rome' for tool_id in range(6)))
+        # A second collector sees the function the first one disabled
+        with RuntimeCoverage(self.directory.name) as collector:
+            self.module.called()
+        self.assertEqual(collector.results(), {'sample.called': (1, None)})
+
+
+if __name__ == '__main__':
+    unittest.main()
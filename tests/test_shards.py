@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.function_store import FunctionStore
+from services.shards import ShardedIndex, repo_fingerprint
+from services.similarity import top_k_cosine
+
+
+def random_store(rng, rows, dim=8):
+    store = FunctionStore()
+    for row in range(rows):
+        store.append(f"f{row}")
+    store.vectors = rng.standard_normal((rows, dim)).astype('float32')
+    return store
+
+
+class ShardedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.repos = [os.path.join(self.directory.name, name) for name in ('alpha', 'beta', 'gamma')]
+        rng = np.random.default_rng(0)
+        self.stores = [random_store(rng, rows) for rows in (40, 3, 25)]
+        self.index_dir = os.path.join(self.directory.name, 'shards')
+        index = ShardedIndex(self.index_dir, workers=2)
+        for repo, store in zip(self.repos, self.stores):
+            os.makedirs(repo)
+            index.save_shard(repo, store, 'model', 'print')
+        self.queries = rng.standard_normal((5, 8)).astype('float32')
+
+    def test_merged_results_match_one_global_search(self):
+        index = ShardedIndex(self.index_dir, workers=2).load()
+        self.assertEqual(len(index), 68)
+        results = index.search(self.queries, 10)
+
+        owners = [(repo, row) for repo, store in zip(self.repos, self.stores) for row in range(len(store))]
+        scores, indices = top_k_cosine(self.queries, np.vstack([store.vectors for store in self.stores]), 10)
+        for hits, query_scores, query_indices in zip(results, scores, indices):
+            self.assertEqual([(repo, row) for _, repo, row in hits], [owners[i] for i in query_indices])
+            np.testing.assert_allclose([score for score, _, _ in hits], query_scores, rtol=1e-5)
+
+    def test_repo_filter_only_searches_the_selected_shards(self):
+        index = ShardedIndex(self.index_dir).load()
+        _, indices = top_k_cosine(self.queries, self.stores[1].vectors, 10)
+        for hits, query_indices in zip(index.search(self.queries, 10, repos=[self.repos[1]]), indices):
+            # beta holds only three functions
+            self.assertEqual([(repo, row) for _, repo, row in hits], [(self.repos[1], row) for row in query_indices])
+            self.assertEqual(len(hits), 3)
+        self.assertEqual(index.search(self.queries, 3, repos=[os.path.join(self.directory.name, 'missing')]),
+                         [[] for _ in range(5)])
+
+    def test_load_selected_repositories(self):
+        index = ShardedIndex(self.index_dir).load(repos=[self.repos[2]])
+        self.assertEqual(list(index.shards), [self.repos[2]])
+        self.assertEqual(ShardedIndex(self.index_dir).repos(), self.repos)
+
+    def test_freshness_tracks_the_model_and_the_files(self):
+        repo = self.repos[0]
+        path = os.path.join(repo, 'mod.py')
+        with open(path, 'w') as file:
+            file.write('x = 1\n')
+        index = ShardedIndex(self.index_dir)
+        fingerprint = repo_fingerprint([path])
+        index.save_shard(repo, self.stores[0], 'model', fingerprint)
+        self.assertTrue(index.is_fresh(repo, 'model'))
+        self.assertFalse(index.is_fresh(repo, 'other-model'))
+        with open(path, 'a') as file:
+            file.write('y = 2\n')
+        self.assertFalse(index.is_fresh(repo, 'model'))
+        self.assertFalse(index.is_fresh(os.path.join(self.directory.name, 'unknown'), 'model'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+from services.similarity import normalize_rows, top_k_cosine
+
+
+class NormalizeRowsTest(unittest.TestCase):
+    def test_unit_rows_and_zero_rows(self):
+        rows = normalize_rows([[3, 4], [0, 0]])
+        np.testing.assert_allclose(rows, [[0.6, 0.8], [0, 0]])
+        self.assertTrue(rows.flags['C_CONTIGUOUS'])
+        self.assertEqual(normalize_rows([[1, 0]], dtype='float16').dtype, np.float16)
+
+
+class TopKCosineTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.corpus = normalize_rows(rng.standard_normal((1000, 24)))
+        self.queries = rng.standard_normal((7, 24))
+
+    def exact(self, k):
+        scores = normalize_rows(self.queries) @ self.corpus.T
+        indices = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, indices, axis=1), indices
+
+    def test_matches_exact_search_across_chunks(self):
+        expected_scores, expected_indices = self.exact(10)
+        for chunk_rows in (1000, 128, 7):
+            scores, indices = top_k_cosine(self.queries, self.corpus, 10, chunk_rows=chunk_rows)
+            np.testing.assert_array_equal(indices, expected_indices)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_best_first(self):
+        scores, _ = top_k_cosine(self.queries, self.corpus, 20, chunk_rows=64)
+        self.assertTrue((np.diff(scores, axis=1) <= 0).all())
+
+    def test_k_larger_than_the_corpus(self):
+        scores, indices = top_k_cosine(self.queries, self.corpus[:3], 10)
+        self.assertEqual(scores.shape, (7, 3))
+        self.assertEqual(sorted(indices[0]), [0, 1, 2])
+
+    def test_empty_corpus(self):
+        scores, indices = top_k_cosine(self.queries, self.corpus[:0], 5)
+        self.assertEqual(scores.shape, (7, 0))
+        self.assertEqual(indices.dtype, np.int64)
+
+    def test_half_precision_corpus(self):
+        _, expected = self.exact(1)
+        _, indices = top_k_cosine(self.queries, self.corpus.astype('float16'), 1)
+        np.testing.assert_array_equal(indices, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from services.symbol_index import SymbolIndex
+
+MODULE = '''
+def used():
+    return 1
+
+
+def unused():
+    def helper():
+        return 2
+    return helper()
+
+
+class Box:
+    def open(self):
+        return used()
+'''
+
+TEST = '''
+def test_used():
+    assert used() == 1
+'''
+
+
+class SymbolIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.project = self.directory.name
+        os.makedirs(os.path.join(self.project, 'pkg'))
+        self.module = self.write('pkg/mod.py', MODULE)
+        self.test = self.write('test_mod.py', TEST)
+        self.index = SymbolIndex(self.project, os.path.join(self.project, '.index', 'symbols.sqlite'))
+        self.addCleanup(lambda: self.index.close())
+
+    def write(self, relative, text):
+        path = os.path.join(self.project, relative)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def refresh(self):
+        return ([record.path for record in self.index.refresh([self.module], 'source')],
+                [record.path for record in self.index.refresh([self.test], 'test')])
+
+    def test_definitions_and_coverage(self):
+        self.assertEqual(self.refresh(), ([self.module], [self.test]))
+        self.assertCountEqual(self.index.definitions(), ['pkg.mod.used', 'pkg.mod.unused', 'pkg.mod.Box.open'])
+        self.assertEqual(self.index.definitions(name='open'), ['pkg.mod.Box.open'])
+        self.assertEqual(self.index.covered_definitions(), ['pkg.mod.used'])
+        self.assertEqual(self.index.defined_names(file_prefix='test_'), {'test_used'})
+        self.assertEqual(self.index.call_names(), ['used'])
+
+    def test_unchanged_and_touched_files_are_not_reparsed(self):
+        self.refresh()
+        self.assertEqual(self.refresh(), ([], []))
+        stat = os.stat(self.module)
+        os.utime(self.module, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.refresh(), ([], []))
+        self.assertEqual(self.index.db.execute('SELECT mtime_ns FROM files WHERE path = ?', (self.module,)).fetchone(),
+                         (stat.st_mtime_ns + 10 ** 9,))
+
+    def test_only_edited_files_are_reparsed(self):
+        self.refresh()
+        self.write('pkg/mod.py', MODULE + '\n\ndef added():\n    return unused()\n')
+        self.assertEqual(self.refresh(), ([self.module], []))
+        self.assertIn('pkg.mod.added', self.index.definitions())
+
+    def test_removed_files_are_forgotten(self):
+        self.refresh()
+        self.index.refresh([], 'test')
+        self.assertEqual(self.index.call_names(), [])
+        self.assertEqual(self.index.covered_definitions(), [])
+        self.assertEqual(len(self.index.definitions()), 3)
+
+    def test_files_that_do_not_parse_are_retried(self):
+        self.write('pkg/mod.py', 'def broken(:\n')
+        records = self.index.refresh([self.module], 'source')
+        self.assertTrue(records[0].error)
+        self.assertEqual(self.index.definitions(), [])
+        self.assertEqual(len(self.index.refresh([self.module], 'source')), 1)
+
+    def test_index_persists_across_instances(self):
+        self.refresh()
+        self.index.close()
+        self.index = SymbolIndex(self.project, os.path.join(self.project, '.index', 'symbols.sqlite'))
+        self.assertEqual(self.refresh(), ([], []))
+        self.assertEqual(self.index.covered_definitions(), ['pkg.mod.used'])
+
+
+if __name__ == '__main__':
+    unittest.main()
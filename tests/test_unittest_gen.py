@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from services.symbol_index import SymbolIndex
+from test.test_unittest_gen import MAIN_BLOCK, UnitTestGenerator
+
+
+class UnitTestGeneratorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.project = self.directory.name
+
+    def generator(self, functions):
+        index = SymbolIndex(self.project)
+        self.addCleanup(index.close)
+        return UnitTestGenerator(self.project, functions, index=index, workers=2)
+
+    def test_plan_groups_functions_by_module_test_file(self):
+        generator = self.generator(['pkg.mod.first', 'pkg.mod.second', 'pkg.mod.first', 'top.run', 'loose'])
+        generator.existing_tests = {'test_second'}
+        plan = generator.plan_tests()
+        tst = os.path.join(self.project, 'tst')
+        self.assertEqual(set(plan), {os.path.join(tst, 'pkg', 'test_mod.py'), os.path.join(tst, 'test_top.py')})
+        module_path, tests = plan[os.path.join(tst, 'pkg', 'test_mod.py')]
+        self.assertEqual(module_path, 'pkg.mod')
+        self.assertEqual([test['method_name'] for test in tests], ['test_first'])
+        self.assertEqual(tests[0]['class_name'], 'TestFirst')
+
+    def test_generated_files_are_merged_and_not_duplicated(self):
+        self.generator(['pkg.mod.first']).generate_tests()
+        self.generator(['pkg.mod.first', 'pkg.mod.second']).generate_tests()
+        with open(os.path.join(self.project, 'tst', 'pkg', 'test_mod.py'), encoding='utf-8') as file:
+            code = file.read()
+        compile(code, 'test_mod.py', 'exec')
+        self.assertEqual(code.count('import unittest'), 1)
+        self.assertEqual(code.count(MAIN_BLOCK), 1)
+        self.assertEqual(code.count('def test_first'), 1)
+        self.assertLess(code.index('def test_second'), code.index(MAIN_BLOCK))
+
+
+if __name__ == '__main__':
+    unittest.main()
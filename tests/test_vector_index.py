@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+
+from services.vector_index import (build_index, index_factory_string, index_kind, load_index, normalized,
+                                   recall_at_k, save_index)
+
+
+def random_vectors(count, dim=16, seed=0):
+    return normalized(np.random.default_rng(seed).standard_normal((count, dim)))
+
+
+class IndexFactoryTest(unittest.TestCase):
+    def test_types(self):
+        self.assertEqual(index_factory_string('flat', 16, 10), 'Flat')
+        self.assertTrue(index_factory_string('hnsw', 16, 10).startswith('HNSW'))
+        self.assertTrue(index_factory_string('ivf_flat', 16, 10000).endswith(',Flat'))
+
+    def test_too_little_training_data_falls_back(self):
+        self.assertEqual(index_factory_string('ivf_flat', 16, 10), 'Flat')
+        self.assertTrue(index_factory_string('ivf_pq', 16, 100).endswith(',Flat'))
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            index_factory_string('annoy', 16, 10)
+
+
+class BuildIndexTest(unittest.TestCase):
+    def test_kind_reports_what_was_built(self):
+        vectors = random_vectors(400)
+        self.assertEqual(index_kind(build_index('ivf_flat', 16, vectors)), 'ivf_flat')
+        self.assertEqual(index_kind(build_index('ivf_flat', 16, vectors[:10])), 'flat')
+        self.assertEqual(index_kind(build_index('hnsw', 16, vectors)), 'hnsw')
+        self.assertEqual(index_kind(build_index('flat', 16, vectors, id_map=True)), 'flat')
+
+    def test_id_map(self):
+        index = build_index('flat', 16, random_vectors(10), id_map=True)
+        self.assertIsInstance(index, faiss.IndexIDMap2)
+        with self.assertRaises(ValueError):
+            build_index('hnsw', 16, random_vectors(10), id_map=True)
+
+    def test_exact_index_has_full_recall(self):
+        vectors = random_vectors(200)
+        index = build_index('flat', 16, vectors)
+        index.add(vectors)
+        self.assertEqual(recall_at_k(index, vectors, k=5), 1.0)
+        self.assertEqual(recall_at_k(index, vectors[:0], k=5), 1.0)
+
+
+class PersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.vectors = random_vectors(500)
+        index = build_index('ivf_flat', 16, self.vectors)
+        index.add(self.vectors)
+        self.expected = index.search(self.vectors[:5], 3)
+        save_index(index, {'model_name': 'm', 'index_type': 'ivf_flat'}, self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        for mmap in (False, True):
+            index, metadata = load_index(self.directory.name, mmap=mmap)
+            self.assertEqual(metadata, {'model_name': 'm', 'index_type': 'ivf_flat'})
+            self.assertEqual(index.ntotal, 500)
+            scores, ids = index.search(self.vectors[:5], 3)
+            np.testing.assert_array_equal(ids, self.expected[1])
+            np.testing.assert_allclose(scores, self.expected[0], rtol=1e-5)
+
+    def test_mapped_index_is_read_only(self):
+        index, _ = load_index(self.directory.name, mmap=True)
+        with self.assertRaises(RuntimeError):
+            index.add(self.vectors[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
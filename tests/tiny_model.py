@@ -0,0 +1,39 @@
+"""A tiny random RoBERTa encoder and word-level tokenizer, so tests run offline in seconds."""
+import atexit
+import shutil
+import tempfile
+
+_VOCAB = ['<s>', '<pad>', '</s>', '<unk>', 'def', 'return', 'self', 'x', 'y', 'if', 'else', 'for', 'in',
+          'while', 'class', 'import', 'from', 'pass', 'None', 'True', 'False', '+', '-', '*', '/', '=',
+          '(', ')', ':', ',', '.', '[', ']', '{', '}', '0', '1', '2', 'print']
+
+HIDDEN_SIZE = 32
+
+_directory = None
+
+
+def tiny_model_dir():
+    """Path of a saved model and tokenizer, built once per test run."""
+    global _directory
+    if _directory is None:
+        import torch
+        from tokenizers import Tokenizer, models, pre_tokenizers, processors
+        from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaModel
+
+        directory = tempfile.mkdtemp(prefix='rome-tiny-model-')
+        atexit.register(shutil.rmtree, directory, True)
+
+        tokenizer = Tokenizer(models.WordLevel({token: i for i, token in enumerate(_VOCAB)}, unk_token='<unk>'))
+        tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        tokenizer.post_processor = processors.TemplateProcessing(
+            single='<s> $A </s>', special_tokens=[('<s>', 0), ('</s>', 2)])
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token='<s>', eos_token='</s>', pad_token='<pad>',
+                                unk_token='<unk>', model_max_length=512).save_pretrained(directory)
+
+        torch.manual_seed(0)
+        config = RobertaConfig(vocab_size=len(_VOCAB), hidden_size=HIDDEN_SIZE, num_hidden_layers=2,
+                               num_attention_heads=2, intermediate_size=64, max_position_embeddings=514,
+                               pad_token_id=1, bos_token_id=0, eos_token_id=2)
+        RobertaModel(config).eval().save_pretrained(directory)
+        _directory = directory
+    return _directory
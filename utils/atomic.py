@@ -0,0 +1,74 @@
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+# Read once at import: os.umask can only be queried by setting it, which races with threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(path, content):
+    """
+    Write content to path through a temporary file and a rename, so readers never see half a file.
+
+    The file keeps the mode it had, or gets the usual umask-derived mode when it is new;
+    mkstemp alone would leave it readable by the owner only.
+    """
+    directory = os.path.dirname(path)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+            os.fchmod(file.fileno(), mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def staging_directory(directory):
+    """Hidden sibling of directory to write a new version into before replace_directory."""
+    parent, name = os.path.split(os.path.abspath(directory))
+    staging = os.path.join(parent, f".{name}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    return staging
+
+
+def replace_directory(staging, directory):
+    """
+    Make directory show the contents of staging, atomically.
+
+    directory is a symlink to a hidden versioned sibling (``.name.<ns>``). The new version
+    is linked under a temporary name and renamed over directory in one step, so readers
+    and crashes only ever see the old contents or the new ones. The old version is deleted
+    afterwards; processes that still have its files open or mapped keep reading them.
+
+    :param staging: Complete new contents, on the same file system as directory.
+    :param directory: Path to replace; a plain directory from before versioning is moved aside.
+    """
+    directory = os.path.abspath(directory)
+    parent, name = os.path.split(directory)
+    version = os.path.join(parent, f".{name}.{time.time_ns()}")
+    os.rename(staging, version)
+    link = os.path.join(parent, f".{name}.link")
+    if os.path.lexists(link):
+        os.unlink(link)
+    # Relative, so the whole tree can be moved
+    os.symlink(os.path.basename(version), link)
+
+    previous = None
+    if os.path.islink(directory):
+        previous = os.path.realpath(directory)
+    elif os.path.isdir(directory):
+        # A directory cannot be renamed over; this happens once, on the first versioned write
+        previous = os.path.join(parent, f".{name}.{time.time_ns()}.old")
+        os.rename(directory, previous)
+    os.replace(link, directory)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
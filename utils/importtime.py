@@ -0,0 +1,49 @@
+import os
+import sys
+
+# Set in the re-run command's environment, so it runs the command instead of reporting again
+IMPORTTIME_CHILD = 'ROME_IMPORTTIME_CHILD'
+
+
+def parse_importtime(stderr):
+    """
+    Split ``-X importtime`` output into (rows, other_lines).
+
+    Each row is (self_us, cumulative_us, module).
+    """
+    rows, other_lines = [], []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            other_lines.append(line)
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            rows.append((int(parts[0]), int(parts[1]), parts[2].strip()))
+        except (IndexError, ValueError):
+            continue  # column header
+    return rows, other_lines
+
+
+def import_time_report(argv, top=20):
+    """
+    Re-run the CLI with the same arguments under ``python -X importtime`` and print
+    the imports with the highest cumulative cost, followed by the total.
+
+    :param argv: CLI arguments, the report flags included; the re-run ignores them.
+    :param top: Number of modules to list.
+    :return: Exit code of the re-run command.
+    """
+    import subprocess
+
+    command = [sys.executable, '-X', 'importtime', sys.argv[0]] + list(argv)
+    result = subprocess.run(command, stderr=subprocess.PIPE, text=True, env=dict(os.environ, **{IMPORTTIME_CHILD: '1'}))
+    rows, other_lines = parse_importtime(result.stderr)
+    if other_lines:
+        print('\n'.join(other_lines), file=sys.stderr)
+
+    total_us = sum(self_us for self_us, _, _ in rows)
+    print(f"\nImport time report ({len(rows)} modules, {total_us / 1000:.1f} ms total)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, module in sorted(rows, key=lambda row: row[1], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+    return result.returncode
@@ -1,22 +1,62 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 
-def get_logger():
-    """Creates and configures a logger."""
+from config.settings import LOGGING
+
+_listener = None
+
+
+def _stream_handler():
+    handler = logging.StreamHandler()
+    handler.setLevel(LOGGING['level'])
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(filename)s:%(lineno)s - %(levelname)s - %(message)s'))
+    return handler
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _log_directly_after_fork():
+    # The listener thread does not exist in a forked child; write to the stream from there
+    global _listener
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger.removeHandler(handler)
+            logger.addHandler(_stream_handler())
+    _listener = None
 
-    # Create console handler and set level to debug
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
 
-    # Create formatter
-    formatter = logging.Formatter('%(asctime)s - %(filename)s:%(lineno)s - %(levelname)s - %(message)s')
+def get_logger():
+    """
+    Creates and configures a logger.
 
-    # Add formatter to console handler
-    ch.setFormatter(formatter)
+    With LOGGING['queue'] set, records are put on an in-memory queue and written to the
+    console by a background listener thread, so logging from hot loops never waits on I/O.
+    """
+    global _listener
+    logger = logging.getLogger()
+    logger.setLevel(LOGGING['level'])
 
-    # Add console handler to logger
-    if not logger.handlers:
-        logger.addHandler(ch)
+    if logger.handlers:
+        return logger
+    if not LOGGING['queue']:
+        logger.addHandler(_stream_handler())
+        return logger
 
+    records = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, _stream_handler(), respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued before the interpreter exits
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_log_directly_after_fork)
     return logger
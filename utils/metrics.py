@@ -0,0 +1,114 @@
+import json
+import re
+import threading
+import time
+from contextlib import ContextDecorator
+
+
+class _Timer(ContextDecorator):
+    """Adds the wall time of each ``with`` block or decorated call to a timer of a Metrics."""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.local = threading.local()
+
+    def __enter__(self):
+        # Per thread, so one timer object can be shared by pipeline workers
+        self.local.__dict__.setdefault('starts', []).append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.local.starts.pop())
+        return False
+
+
+class Metrics:
+    """
+    Thread-safe counters and timers, cheap enough for per-file and per-batch use.
+
+    A timer keeps the number of observations, their total and the longest one. Processes
+    started by a pool keep their own copy, so work done in pool workers is not counted here.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self._timer_objects = {}
+
+    def count(self, name, value=1):
+        """Add value to a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record one duration under a timer."""
+        with self.lock:
+            stats = self.timers.get(name)
+            if stats is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    def timer(self, name):
+        """Context manager and decorator timing its block or function under name."""
+        timer = self._timer_objects.get(name)
+        if timer is None:
+            timer = self._timer_objects.setdefault(name, _Timer(self, name))
+        return timer
+
+    def snapshot(self):
+        """Copy of the current values: {'counters': {name: value}, 'timers': {name: {count, seconds, max_seconds}}}."""
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {
+                    name: {'count': count, 'seconds': total, 'max_seconds': longest}
+                    for name, (count, total, longest) in self.timers.items()
+                },
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='rome'):
+        """Prometheus text exposition format: counters as ``_total``, timers as summaries in seconds."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines.extend([f"# TYPE {metric} counter", f"{metric} {value}"])
+        for name, stats in sorted(snapshot['timers'].items()):
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines.extend([
+                f"# TYPE {metric}_seconds summary",
+                f"{metric}_seconds_count {stats['count']}",
+                f"{metric}_seconds_sum {stats['seconds']:.9f}",
+                f"# TYPE {metric}_max_seconds gauge",
+                f"{metric}_max_seconds {stats['max_seconds']:.9f}",
+            ])
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write the metrics to path, in Prometheus text format for .prom/.txt files and JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json() + '\n'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+# Process-wide registry used by the pipeline stages
+metrics = Metrics()
+timer = metrics.timer
+count = metrics.count
@@ -0,0 +1,52 @@
+import cProfile
+import pstats
+import sys
+import threading
+
+
+class ThreadProfiler:
+    """
+    cProfile of the calling thread and of every thread started while it is enabled.
+
+    Before Python 3.12 a cProfile.Profile only sees the thread that enabled it, so each new
+    thread gets its own, installed through ``threading.setprofile``, and the profiles are
+    merged when dumped. From 3.12 one profile already covers every thread. Threads that were
+    running before ``enable`` and work done in pool processes are not profiled.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.lock = threading.Lock()
+
+    def _start_thread(self, frame, event, arg):
+        # First event of a new thread: replace this hook with the thread's own profiler
+        profile = cProfile.Profile()
+        with self.lock:
+            self.thread_profiles.append(profile)
+        profile.enable()
+
+    def enable(self):
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+
+    def stats(self):
+        """pstats.Stats of every profiled thread together."""
+        stats = pstats.Stats(self.profile)
+        with self.lock:
+            profiles = list(self.thread_profiles)
+        for profile in profiles:
+            # A thread that made no call while profiled has nothing to add
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+        return stats
+
+    def dump_stats(self, path):
+        self.stats().dump_stats(path)